@@ -11,6 +11,12 @@ echo "=== Running migrations ==="
 python manage.py showmigrations
 python manage.py migrate --verbosity 2
 
+echo "=== Building food index ==="
+python manage.py build_food_index
+
+echo "=== Checking query plans ==="
+python manage.py check_query_plans
+
 echo "=== Checking tables ==="
 python -c "
 import sqlite3
@@ -1,3 +1,34 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import NutritionCache, PhotoEstimateCache
+
+
+@admin.register(NutritionCache)
+class NutritionCacheAdmin(admin.ModelAdmin):
+    """Inspect and invalidate cached AI nutrition results."""
+    list_display = ('key', 'kind', 'hit_count', 'last_used_at', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('key',)
+    ordering = ('-last_used_at',)
+    readonly_fields = ('created_at',)
+    actions = ['invalidate_selected', 'invalidate_all']
+
+    @admin.action(description='Invalidate selected entries')
+    def invalidate_selected(self, request, queryset):
+        deleted, _ = queryset.delete()
+        self.message_user(request, f'Invalidated {deleted} cached nutrition results.')
+
+    @admin.action(description='Invalidate the whole nutrition cache')
+    def invalidate_all(self, request, queryset):
+        from .nutrition_cache import invalidate
+
+        deleted = invalidate()
+        self.message_user(request, f'Invalidated all {deleted} cached nutrition results.')
+
+
+@admin.register(PhotoEstimateCache)
+class PhotoEstimateCacheAdmin(admin.ModelAdmin):
+    """Inspect and invalidate cached photo estimates."""
+    list_display = ('__str__', 'user_id', 'hit_count', 'created_at')
+    search_fields = ('user_id',)
+    ordering = ('-created_at',)
@@ -3,12 +3,42 @@ Unified AI API — tries the primary provider first, falls back to the other on
 Callers import from here instead of individual providers.
 
 Set AI_PRIMARY_PROVIDER env var to 'gemini' (default) or 'openrouter'.
+
+Hedging: if the primary hasn't answered within AI_HEDGE_DELAY_<TEXT|IMAGE|ADVICE|BATCH>
+seconds, the fallback is started in parallel and the first valid answer wins
+(the loser's request is cancelled). Set a delay to 0 to call providers one after
+the other instead.
+
+Every entry point has an async twin (aestimate_nutrition, ...) for code that
+wants to run many LLM calls concurrently on one event loop; the sync versions
+run the provider calls on the shared ai_http loop.
+
+Meal parses that need a provider are micro-batched across concurrent users by
+ai_batcher (one multi-meal prompt per AI_BATCH_WINDOW_MS window), with solo
+calls for lone requests and for meals a batch answer misses.
+
+Common foods are answered from the bundled offline food_db, item by item, so
+only the items it doesn't know go to a provider. Other text lookups are
+answered from nutrition_cache, and photos from photo_cache (perceptual hash),
+when possible. Photos are downsized and re-encoded by image_pipeline before
+hashing and upload.
 """
+import asyncio
 import logging
 import os
+import threading
+
+from asgiref.sync import sync_to_async
 
+from . import ai_batcher
+from . import ai_http
+from . import ai_schemas
+from . import food_db
 from . import gemini_api
+from . import image_pipeline
+from . import nutrition_cache
 from . import openrouter_api
+from . import photo_cache
 
 logger = logging.getLogger(__name__)
 
@@ -23,42 +53,309 @@ else:
 
 logger.info(f"AI primary provider: {_PRIMARY}")
 
+# Seconds to wait on the primary before racing the fallback, per call type
+_HEDGE_DELAYS = {
+    'text': float(os.environ.get('AI_HEDGE_DELAY_TEXT', '4')),
+    'image': float(os.environ.get('AI_HEDGE_DELAY_IMAGE', '8')),
+    'advice': float(os.environ.get('AI_HEDGE_DELAY_ADVICE', '6')),
+    'batch': float(os.environ.get('AI_HEDGE_DELAY_BATCH', '10')),
+}
+
+_stats_lock = threading.Lock()
+_hedge_stats = {
+    'calls': 0,
+    'hedged': 0,
+    'primary_wins': 0,
+    'fallback_wins': 0,
+    'both_failed': 0,
+}
+
+
+def _count(key):
+    with _stats_lock:
+        _hedge_stats[key] += 1
+
+
+async def _attempt(func, *args):
+    """Await a provider call; returns (result, whether any of its answers failed schema parsing)."""
+    failures = []
+    token = ai_schemas.parse_failures.set(failures)
+    try:
+        return await func(*args), bool(failures)
+    finally:
+        ai_schemas.parse_failures.reset(token)
+
+
+async def _fall_back(method, fallback, args, parse_failed):
+    logger.info(f"Primary failed for {method}, falling back")
+    if parse_failed:
+        ai_schemas.record_fallback()
+    return await fallback(*args)
+
+
+async def _acall(kind, method, is_valid, *args):
+    """
+    Await async `method` on the primary provider, falling back to the other provider
+    if it fails — or, once the kind's hedge delay passes, racing both.
+    Returns the first valid result, else the fallback's (invalid) result.
+    """
+    primary = getattr(_primary, f'a{method}')
+    fallback = getattr(_fallback, f'a{method}')
+    delay = _HEDGE_DELAYS.get(kind, 0)
+    _count('calls')
+
+    if delay <= 0:
+        try:
+            result, parse_failed = await _attempt(primary, *args)
+        except Exception as e:
+            logger.warning(f"Primary raised for {method}: {e}")
+            return await fallback(*args)
+        if is_valid(result):
+            return result
+        return await _fall_back(method, fallback, args, parse_failed)
+
+    first = asyncio.ensure_future(_attempt(primary, *args))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        try:
+            result, parse_failed = first.result()
+        except Exception as e:
+            logger.warning(f"Primary raised for {method}: {e}")
+            return await fallback(*args)
+        if is_valid(result):
+            _count('primary_wins')
+            return result
+        return await _fall_back(method, fallback, args, parse_failed)
+
+    logger.info(f"Primary slow for {method} after {delay:.1f}s, hedging with fallback")
+    _count('hedged')
+    second = asyncio.ensure_future(_attempt(fallback, *args))
+    pending = {first: 'primary', second: 'fallback'}
+    result = error = None
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                who = pending.pop(future)
+                try:
+                    candidate, _ = future.result()
+                except Exception as e:
+                    logger.warning(f"{who.capitalize()} raised for {method}: {e}")
+                    error = e
+                    continue
+                if is_valid(candidate):
+                    _count(f'{who}_wins')
+                    logger.info(f"Hedged {method}: {who} answered first")
+                    return candidate
+                if who == 'fallback' or result is None:
+                    result = candidate
+    finally:
+        # The loser's HTTP request is cancelled, freeing its pooled connection
+        for loser in pending:
+            loser.cancel()
+
+    _count('both_failed')
+    if result is None and error is not None:
+        raise error
+    return result
+
+
+def hedge_stats():
+    """Return process-local hedging counters and the configured delays."""
+    with _stats_lock:
+        return {**_hedge_stats, 'delays': dict(_HEDGE_DELAYS)}
+
+
+def _has_calories(result):
+    return result is not None and result.get('calories') is not None
+
+
+def _has_food_name(result):
+    return result is not None and result.get('food_name') is not None
+
+
+def _not_none(result):
+    return result is not None
+
+
+def _any_meal(result):
+    return result is not None and any(foods is not None for foods in result)
+
+
+async def _parse_foods_solo(text):
+    return await _acall('text', 'parse_and_estimate_foods', _not_none, text)
+
+
+async def _parse_foods_batch(texts):
+    return await _acall('batch', 'parse_and_estimate_foods_batch', _any_meal, texts)
+
+
+_foods_batcher = ai_batcher.MicroBatcher(_parse_foods_batch, _parse_foods_solo)
+
+
+def _local_estimate(food_name, description):
+    """food_db answer for a plain food name (a description may change the portion, so it goes to the LLM)."""
+    if description:
+        return None
+    found = food_db.lookup(food_name)
+    if found is None:
+        return None
+    return {k: found[k] for k in ('calories', 'protein', 'carbs', 'fat', 'basis')}
+
+
+def _local_foods(text):
+    """
+    Look each item of a meal description up in food_db.
+    Returns (results, unmatched): results has None in the slots of unmatched items.
+    """
+    items = food_db.split_items(text)
+    results = [food_db.lookup(item) for item in items]
+    return results, [item for item, found in zip(items, results) if found is None]
+
+
+def _merge_foods(local, estimated):
+    """Put the LLM's items where the first unmatched item was, keeping the meal's order."""
+    merged, inserted = [], False
+    for found in local:
+        if found is not None:
+            merged.append(found)
+        elif not inserted:
+            merged.extend(estimated)
+            inserted = True
+    return merged
+
+
+# ── Async entry points (cache lookups run in a thread via sync_to_async) ─────
+
+async def aestimate_nutrition(food_name, description=''):
+    local = _local_estimate(food_name, description)
+    if local is not None:
+        return local
+
+    cache_text = f"{food_name}, {description}" if description else food_name
+    cached = await sync_to_async(nutrition_cache.lookup)(nutrition_cache.KIND_ESTIMATE, cache_text)
+    if cached is not None:
+        return cached
+
+    result = await _acall('text', 'estimate_nutrition', _has_calories, food_name, description)
+    if result['calories'] is not None:
+        await sync_to_async(nutrition_cache.store)(nutrition_cache.KIND_ESTIMATE, cache_text, result)
+    return result
+
+
+async def aestimate_nutrition_from_image(image_bytes, mime_type, user_id=None):
+    image_bytes, mime_type = await sync_to_async(image_pipeline.prepare_image)(image_bytes, mime_type)
+    photo_hash, cached = await sync_to_async(photo_cache.lookup)(image_bytes, user_id)
+    if cached is not None:
+        return cached
+
+    result = await _acall('image', 'estimate_nutrition_from_image', _has_food_name, image_bytes, mime_type)
+    if result['food_name'] is not None:
+        await sync_to_async(photo_cache.store)(photo_hash, result, user_id)
+    return result
+
+
+async def aparse_and_estimate_foods(text):
+    local, unmatched = _local_foods(text)
+    if local and not unmatched:
+        return local
+
+    cached = await sync_to_async(nutrition_cache.lookup)(nutrition_cache.KIND_PARSE, text)
+    if cached is not None:
+        return cached
+
+    partial = len(unmatched) < len(local)
+    query = '、'.join(unmatched) if partial else text
+    result = await _foods_batcher.submit(query)
+    if result is not None:
+        if partial:
+            result = _merge_foods(local, result)
+        await sync_to_async(nutrition_cache.store)(nutrition_cache.KIND_PARSE, text, result)
+    return result
+
+
+async def amodify_food_estimation(original_food, modification):
+    return await _acall('text', 'modify_food_estimation', _not_none, original_food, modification)
+
+
+async def agenerate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    return await _acall('advice', 'generate_diet_advice', _not_none, foods, tdee, user_prompt, goal)
+
+
+async def astream_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    """
+    Yield advice text chunks as the primary provider streams them, switching to
+    the fallback if the primary fails (or has no key) before sending anything.
+    Not hedged: streaming already makes the first token arrive quickly.
+    """
+    for provider in (_primary, _fallback):
+        emitted = False
+        try:
+            async for chunk in provider.astream_diet_advice(foods, tdee, user_prompt, goal):
+                emitted = True
+                yield chunk
+        except Exception as e:
+            if emitted:
+                raise
+            logger.warning(f"{provider.__name__} advice stream failed before any text: {e}")
+            continue
+        if emitted:
+            return
+
+
+# ── Sync entry points (DB work in the calling thread, HTTP on the ai-http loop) ─
 
 def estimate_nutrition(food_name, description=''):
-    result = _primary.estimate_nutrition(food_name, description)
+    local = _local_estimate(food_name, description)
+    if local is not None:
+        return local
+
+    cache_text = f"{food_name}, {description}" if description else food_name
+    cached = nutrition_cache.lookup(nutrition_cache.KIND_ESTIMATE, cache_text)
+    if cached is not None:
+        return cached
+
+    result = ai_http.run(_acall('text', 'estimate_nutrition', _has_calories, food_name, description))
     if result['calories'] is not None:
-        return result
-    logger.info("Primary failed for estimate_nutrition, falling back")
-    return _fallback.estimate_nutrition(food_name, description)
+        nutrition_cache.store(nutrition_cache.KIND_ESTIMATE, cache_text, result)
+    return result
+
 
+def estimate_nutrition_from_image(image_bytes, mime_type, user_id=None):
+    image_bytes, mime_type = image_pipeline.prepare_image(image_bytes, mime_type)
+    photo_hash, cached = photo_cache.lookup(image_bytes, user_id)
+    if cached is not None:
+        return cached
 
-def estimate_nutrition_from_image(image_bytes, mime_type):
-    result = _primary.estimate_nutrition_from_image(image_bytes, mime_type)
+    result = ai_http.run(_acall('image', 'estimate_nutrition_from_image', _has_food_name, image_bytes, mime_type))
     if result['food_name'] is not None:
-        return result
-    logger.info("Primary failed for estimate_nutrition_from_image, falling back")
-    return _fallback.estimate_nutrition_from_image(image_bytes, mime_type)
+        photo_cache.store(photo_hash, result, user_id)
+    return result
 
 
 def parse_and_estimate_foods(text):
-    result = _primary.parse_and_estimate_foods(text)
-    if result is not None:
-        return result
-    logger.info("Primary failed for parse_and_estimate_foods, falling back")
-    return _fallback.parse_and_estimate_foods(text)
+    local, unmatched = _local_foods(text)
+    if local and not unmatched:
+        return local
 
+    cached = nutrition_cache.lookup(nutrition_cache.KIND_PARSE, text)
+    if cached is not None:
+        return cached
 
-def modify_food_estimation(original_food, modification):
-    result = _primary.modify_food_estimation(original_food, modification)
+    partial = len(unmatched) < len(local)
+    query = '、'.join(unmatched) if partial else text
+    result = ai_http.run(_foods_batcher.submit(query))
     if result is not None:
-        return result
-    logger.info("Primary failed for modify_food_estimation, falling back")
-    return _fallback.modify_food_estimation(original_food, modification)
+        if partial:
+            result = _merge_foods(local, result)
+        nutrition_cache.store(nutrition_cache.KIND_PARSE, text, result)
+    return result
 
 
-def generate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
-    result = _primary.generate_diet_advice(foods, tdee, user_prompt, goal)
-    if result is not None:
-        return result
-    logger.info("Primary failed for generate_diet_advice, falling back")
-    return _fallback.generate_diet_advice(foods, tdee, user_prompt, goal)
+modify_food_estimation = ai_http.sync(amodify_food_estimation)
+generate_diet_advice = ai_http.sync(agenerate_diet_advice)
+
+
+def stream_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    """Blocking iterator over advice text chunks (see astream_diet_advice)."""
+    return ai_http.iterate(astream_diet_advice(foods, tdee, user_prompt, goal))
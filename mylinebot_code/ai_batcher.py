@@ -0,0 +1,153 @@
+"""
+Cross-user micro-batching of meal parsing requests.
+
+At meal-time peaks many users send "add" at once, and every parse_foods_prompt
+repeats the same long instructions around a few words of food. ai_api hands
+each parse that needs a provider to a MicroBatcher, which waits up to
+AI_BATCH_WINDOW_MS for other requests to join (or until AI_BATCH_MAX_ITEMS are
+queued) and sends them as one parse_foods_batch_prompt, giving each caller its
+own meal's foods. Identical descriptions in a batch are sent once.
+
+A request alone in its window goes out as a normal solo call, and meals the
+batch answer leaves out (or a batch that fails or can't be parsed) are retried
+solo, so batching never loses an answer the solo path would have given.
+
+Batches form on the event loop the callers await on (the ai_http loop for sync
+callers), so requests are merged within one process: concurrent threads, async
+callers and LIFF requests of the same worker. The shipped gunicorn config runs
+gthread workers, so the window defaults to 200 ms; a sync worker handles one
+request at a time and never forms a batch, so set AI_BATCH_WINDOW_MS=0 there
+rather than pay the wait.
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = float(getattr(settings, 'AI_BATCH_WINDOW_MS', 200)) / 1000
+MAX_ITEMS = int(getattr(settings, 'AI_BATCH_MAX_ITEMS', 8))
+
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'solo': 0,
+    'batches': 0,
+    'batched_requests': 0,
+    'solo_retries': 0,
+}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+class MicroBatcher:
+    """
+    Collects concurrent submit(item) calls into batch(items) calls.
+    batch returns a list aligned with items (None for an unanswered item) or None;
+    solo(item) answers one item and is used for lone and unanswered items.
+    """
+
+    def __init__(self, batch, solo, window=WINDOW_SECONDS, max_items=MAX_ITEMS):
+        self._batch = batch
+        self._solo = solo
+        self.window = window
+        self.max_items = max_items
+        self._queues = {}  # event loop -> [(item, future)]
+        self._timers = {}  # event loop -> flush TimerHandle
+        self._tasks = set()
+
+    async def submit(self, item):
+        """Answer `item`, batched with whatever other items arrive within the window."""
+        if self.window <= 0 or self.max_items < 2:
+            return await self._solo(item)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.setdefault(loop, [])
+        queue.append((item, future))
+        _count('requests')
+        if len(queue) >= self.max_items:
+            self._flush(loop)
+        elif loop not in self._timers:
+            self._timers[loop] = loop.call_later(self.window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop):
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+        # Callers that were cancelled while waiting have done futures
+        queue = [(item, future) for item, future in self._queues.pop(loop, []) if not future.done()]
+        if not queue:
+            return
+        task = loop.create_task(self._dispatch(queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, queue):
+        waiting = {}  # item -> futures, so repeated descriptions are asked once
+        for item, future in queue:
+            waiting.setdefault(item, []).append(future)
+        items = list(waiting)
+
+        if len(items) == 1:
+            _count('solo')
+            await self._answer_solo(items[0], waiting[items[0]])
+            return
+
+        _count('batches')
+        _count('batched_requests', len(queue))
+        try:
+            results = await self._batch(items)
+        except Exception as e:
+            logger.warning(f"Batch of {len(items)} items failed: {e}")
+            results = None
+        if results is None:
+            results = [None] * len(items)
+
+        retries = []
+        for item, result in zip(items, results):
+            if result is None:
+                retries.append(item)
+            else:
+                _resolve(waiting[item], result=result)
+        if retries:
+            logger.info(f"Batch left {len(retries)} of {len(items)} items unanswered, retrying solo")
+            _count('solo_retries', len(retries))
+            await asyncio.gather(*(self._answer_solo(item, waiting[item]) for item in retries))
+
+    async def _answer_solo(self, item, futures):
+        try:
+            result = await self._solo(item)
+        except Exception as e:
+            _resolve(futures, error=e)
+        else:
+            _resolve(futures, result=result)
+
+
+def _resolve(futures, result=None, error=None):
+    for future in futures:
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+def stats():
+    """Return process-local batching counters, the mean batch size and the window settings."""
+    with _stats_lock:
+        counts = dict(_stats)
+    batches = counts['batches']
+    return {
+        **counts,
+        'avg_batch_size': round(counts['batched_requests'] / batches, 2) if batches else None,
+        'window_ms': WINDOW_SECONDS * 1000,
+        'max_items': MAX_ITEMS,
+    }
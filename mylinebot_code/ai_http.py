@@ -0,0 +1,135 @@
+"""
+Shared aiohttp plumbing for the AI provider clients.
+
+All provider HTTP calls go through one aiohttp.ClientSession (keep-alive
+connection pool, AI_HTTP_POOL_SIZE connections) living on a background event
+loop thread. Async code awaits the provider coroutines directly; sync callers
+(webhook handlers, management commands) use the wrappers made by sync(), which
+hand the coroutine to the loop and block until it finishes, and iterate() for
+streamed responses. Many concurrent LLM calls therefore share one thread and
+one pool instead of one blocked thread each.
+
+The loop and session are created lazily in each process (so after gunicorn
+forks) and closed at exit.
+"""
+import asyncio
+import atexit
+import functools
+import logging
+import os
+import threading
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('AI_HTTP_POOL_SIZE', '32'))
+KEEPALIVE_SECONDS = float(os.environ.get('AI_HTTP_KEEPALIVE', '30'))
+
+_lock = threading.Lock()
+_loop = None
+_thread = None
+_session = None
+_pid = None
+
+
+def _start_loop():
+    global _loop, _thread, _session, _pid
+
+    with _lock:
+        if _loop is not None and _pid == os.getpid():
+            return _loop
+        _loop = asyncio.new_event_loop()
+        _session = None
+        _pid = os.getpid()
+        _thread = threading.Thread(target=_loop.run_forever, name='ai-http', daemon=True)
+        _thread.start()
+        return _loop
+
+
+async def session():
+    """Return the process-wide ClientSession (must be awaited on the ai-http loop)."""
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=KEEPALIVE_SECONDS)
+        _session = aiohttp.ClientSession(connector=connector, raise_for_status=False)
+    return _session
+
+
+def timeout(seconds):
+    """Per-call timeout covering connect, send and the whole response."""
+    return aiohttp.ClientTimeout(total=seconds)
+
+
+def stream_timeout(read_seconds, connect_seconds=10):
+    """Timeout for streaming calls: bounds connecting and each read, not the whole stream."""
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect_seconds, sock_read=read_seconds)
+
+
+async def sse_data(response):
+    """Yield the data field of each server-sent event in a streaming response."""
+    data = []
+    async for raw in response.content:
+        line = raw.decode('utf-8').rstrip('\r\n')
+        if not line:
+            if data:
+                yield '\n'.join(data)
+                data = []
+        elif line.startswith('data:'):
+            data.append(line[5:].removeprefix(' '))
+    if data:
+        yield '\n'.join(data)
+
+
+def run(coro):
+    """Run a coroutine on the ai-http loop from sync code and return its result."""
+    loop = _start_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("ai_http.run() called from the ai-http loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def sync(afunc):
+    """Make a blocking wrapper for an async provider function."""
+    @functools.wraps(afunc)
+    def wrapper(*args, **kwargs):
+        return run(afunc(*args, **kwargs))
+
+    wrapper.__name__ = wrapper.__qualname__ = afunc.__name__.removeprefix('a')
+    return wrapper
+
+
+def iterate(agen):
+    """Drive an async generator on the ai-http loop from sync code, yielding its items."""
+    async def step():
+        try:
+            return False, await agen.__anext__()
+        except StopAsyncIteration:
+            return True, None
+
+    try:
+        while True:
+            finished, item = run(step())
+            if finished:
+                return
+            yield item
+    finally:
+        run(agen.aclose())
+
+
+async def _close_session():
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+
+@atexit.register
+def _shutdown():
+    if _loop is None or _pid != os.getpid() or not _loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_session(), _loop).result(timeout=5)
+    except Exception as e:
+        logger.warning(f"Closing AI HTTP session failed: {e}")
+    _loop.call_soon_threadsafe(_loop.stop)
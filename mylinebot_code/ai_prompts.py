@@ -1,6 +1,7 @@
 """
 Centralized AI prompt templates for nutrition estimation.
 All prompt strings live here so providers (Gemini, OpenRouter) share identical prompts.
+The JSON answers they ask for are validated against the schemas in ai_schemas.py.
 """
 
 
@@ -29,26 +30,52 @@ def image_nutrition_prompt():
     )
 
 
+_SPLITTING_RULES = (
+    "IMPORTANT splitting rules:\n"
+    "- If the user describes ONE composite dish (e.g. \u4fbf\u7576, \u5957\u9910, a sandwich with toppings), "
+    "keep it as ONE item. Use the dish name as \"name\" and put ingredients/details in \"description\".\n"
+    "  Example: \"\u9b6a\u9b5a\u852c\u83dc\u4fbf\u7576\" \u2192 name: \"\u4fbf\u7576\", description: \"\u9b6a\u9b5a\u3001\u852c\u83dc\"\n"
+    "- Only split into multiple items when the user clearly lists SEPARATE dishes/foods "
+    "(e.g. \"\u4e00\u500b\u86cb\u548c\u4e00\u676f\u8c46\u6f3f\" \u2192 2 items).\n"
+)
+
+_FOOD_ITEM_FIELDS = (
+    '{"name": "<main food name>", "description": "<ingredients or details, or empty string>", '
+    '"calories": <number>, "protein": <number>, "carbs": <number>, "fat": <number>, "basis": "<brief explanation>"}'
+)
+
+_FOOD_ITEM_RULES = (
+    "Values should be in kcal for calories and grams for protein/carbs/fat.\n"
+    '"name" should be concise (the primary dish/food name).\n'
+    '"description" should contain composition details if relevant, or empty string if not needed.\n'
+    '"basis" should be a short explanation (under 80 chars) of what you assumed (e.g. "1\u986f\u714e\u86cb~46g").\n'
+    "If a quantity is mentioned, use it. Otherwise assume a typical single serving.\n"
+    "If you cannot estimate, use 0 for all values."
+)
+
+
 def parse_foods_prompt(text):
     """Prompt for parsing free-form text into food items with nutrition."""
     return (
         f"The user described what they ate: \"{text}\".\n"
         "Identify the food items and estimate nutritional content for each.\n"
-        "IMPORTANT splitting rules:\n"
-        "- If the user describes ONE composite dish (e.g. \u4fbf\u7576, \u5957\u9910, a sandwich with toppings), "
-        "keep it as ONE item. Use the dish name as \"name\" and put ingredients/details in \"description\".\n"
-        "  Example: \"\u9b6a\u9b5a\u852c\u83dc\u4fbf\u7576\" \u2192 name: \"\u4fbf\u7576\", description: \"\u9b6a\u9b5a\u3001\u852c\u83dc\"\n"
-        "- Only split into multiple items when the user clearly lists SEPARATE dishes/foods "
-        "(e.g. \"\u4e00\u500b\u86cb\u548c\u4e00\u676f\u8c46\u6f3f\" \u2192 2 items).\n"
-        "Return ONLY a JSON array (even for a single item) with objects containing these fields:\n"
-        '[{"name": "<main food name>", "description": "<ingredients or details, or empty string>", '
-        '"calories": <number>, "protein": <number>, "carbs": <number>, "fat": <number>, "basis": "<brief explanation>"}]\n'
-        "Values should be in kcal for calories and grams for protein/carbs/fat.\n"
-        '"name" should be concise (the primary dish/food name).\n'
-        '"description" should contain composition details if relevant, or empty string if not needed.\n'
-        '"basis" should be a short explanation (under 80 chars) of what you assumed (e.g. "1\u986f\u714e\u86cb~46g").\n'
-        "If a quantity is mentioned, use it. Otherwise assume a typical single serving.\n"
-        "If you cannot estimate, use 0 for all values."
+        + _SPLITTING_RULES
+        + "Return ONLY a JSON array (even for a single item) with objects containing these fields:\n"
+        f"[{_FOOD_ITEM_FIELDS}]\n"
+        + _FOOD_ITEM_RULES
+    )
+
+
+def parse_foods_batch_prompt(texts):
+    """Prompt for parsing several users' meal descriptions in one request (see ai_batcher)."""
+    meals = '\n'.join(f'{i}. "{text}"' for i, text in enumerate(texts, 1))
+    return (
+        f"Several users each described what they ate:\n{meals}\n"
+        "Treat every numbered meal on its own: identify its food items and estimate nutritional content for each.\n"
+        + _SPLITTING_RULES
+        + "Return ONLY a JSON object (no markdown, no extra text) with one entry per meal, in order:\n"
+        f'{{"meals": [{{"id": <meal number>, "foods": [{_FOOD_ITEM_FIELDS}]}}]}}\n'
+        + _FOOD_ITEM_RULES
     )
 
 
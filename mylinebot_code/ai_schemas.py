@@ -0,0 +1,300 @@
+"""
+Response schemas for the JSON prompts in ai_prompts, and tolerant parsing.
+
+Each prompt has a pydantic schema. Providers send it with the request (Gemini
+responseSchema; OpenRouter JSON mode) and parse every answer with parse(),
+which:
+- strips markdown fences and loads the JSON,
+- failing that, repairs it locally: takes the first balanced object/array,
+  drops trailing commas and closes a truncated answer,
+- validates against the schema, coercing numeric strings ("350 kcal", "1,200").
+  calories is required and a null number is rejected rather than read as 0,
+  so an answer without a calorie figure fails and the next model is asked;
+  a missing protein/carbs/fat defaults to 0.
+
+Only an answer that survives none of this counts as a parse failure, so a
+chatty model no longer costs a round trip to the fallback provider.
+"""
+import contextvars
+import json
+import logging
+import math
+import re
+import threading
+from typing import Annotated, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, field_validator
+
+logger = logging.getLogger(__name__)
+
+NUTRITION = 'nutrition'
+PHOTO = 'photo'
+FOODS = 'foods'
+MODIFY = 'modify'
+FOODS_BATCH = 'foods_batch'
+
+
+class SchemaError(ValueError):
+    """A model answer couldn't be parsed or repaired into its schema."""
+
+
+# ── Schemas ───────────────────────────────────────────────────────────────────
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def coerce_number(value):
+    """Non-negative float from a model number or numeric string: 350, "350", "約350 kcal", "1,200"."""
+    if value is None or isinstance(value, bool):
+        raise ValueError("expected a number")
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER.search(re.sub(r'(?<=\d),(?=\d{3})', '', str(value)))
+        if not match:
+            raise ValueError(f"no number in {value!r}")
+        number = float(match.group())
+    if not math.isfinite(number):
+        raise ValueError("expected a finite number")
+    return max(number, 0.0)
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+class _Nutrients(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
+    calories: float
+    protein: float = 0.0
+    carbs: float = 0.0
+    fat: float = 0.0
+    basis: str = ''
+
+    @field_validator('calories', 'protein', 'carbs', 'fat', mode='before')
+    @classmethod
+    def _number(cls, value):
+        return coerce_number(value)
+
+    @field_validator('basis', mode='before')
+    @classmethod
+    def _basis(cls, value):
+        return _text(value)
+
+
+class NutritionEstimate(_Nutrients):
+    """nutrition_prompt"""
+
+
+class PhotoEstimate(_Nutrients):
+    """image_nutrition_prompt — food_name is null when the photo isn't food."""
+
+    food_name: Optional[str] = None
+
+    @field_validator('food_name', mode='before')
+    @classmethod
+    def _food_name(cls, value):
+        return _text(value) or None
+
+
+class FoodItem(_Nutrients):
+    """One item of parse_foods_prompt's array."""
+
+    name: str = Field(min_length=1)
+    description: str = ''
+
+    @field_validator('name', 'description', mode='before')
+    @classmethod
+    def _strings(cls, value):
+        return _text(value)
+
+
+class ModifiedFood(_Nutrients):
+    """modify_food_prompt — an empty name means "keep the original"."""
+
+    name: str = ''
+    description: str = ''
+
+    @field_validator('name', 'description', mode='before')
+    @classmethod
+    def _strings(cls, value):
+        return _text(value)
+
+
+class MealFoods(BaseModel):
+    """One meal of parse_foods_batch_prompt's answer — empty foods means it wasn't answered."""
+
+    model_config = ConfigDict(extra='ignore')
+
+    id: int
+    foods: list[FoodItem] = []
+
+
+class FoodsBatch(BaseModel):
+    """parse_foods_batch_prompt"""
+
+    model_config = ConfigDict(extra='ignore')
+
+    meals: list[MealFoods]
+
+
+_ADAPTERS = {
+    NUTRITION: TypeAdapter(NutritionEstimate),
+    PHOTO: TypeAdapter(PhotoEstimate),
+    FOODS: TypeAdapter(Annotated[list[FoodItem], Field(min_length=1)]),
+    MODIFY: TypeAdapter(ModifiedFood),
+    FOODS_BATCH: TypeAdapter(FoodsBatch),
+}
+
+# ── Provider schema formats ───────────────────────────────────────────────────
+
+_GEMINI_KEYS = ('type', 'description', 'enum', 'format', 'minItems')
+
+
+def _to_gemini(node, defs):
+    if '$ref' in node:
+        return _to_gemini(defs[node['$ref'].rsplit('/', 1)[-1]], defs)
+    if 'anyOf' in node:
+        options = [o for o in node['anyOf'] if o.get('type') != 'null']
+        converted = _to_gemini(options[0], defs)
+        if len(options) < len(node['anyOf']):
+            converted['nullable'] = True
+        return converted
+
+    out = {k: node[k] for k in _GEMINI_KEYS if k in node}
+    if 'type' in out:
+        out['type'] = out['type'].upper()
+    if 'properties' in node:
+        out['properties'] = {name: _to_gemini(prop, defs) for name, prop in node['properties'].items()}
+        # Every field is required, so the model can't skip one and leave it at its default
+        out['required'] = list(node['properties'])
+    if 'items' in node:
+        out['items'] = _to_gemini(node['items'], defs)
+    return out
+
+
+def gemini_schema(kind):
+    """Gemini responseSchema (OpenAPI subset) for a schema kind."""
+    schema = _ADAPTERS[kind].json_schema()
+    return _to_gemini(schema, schema.get('$defs', {}))
+
+
+# ── Parsing and repair ────────────────────────────────────────────────────────
+
+_FENCE = re.compile(r'^```[a-zA-Z]*\s*|\s*```$')
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def _first_balanced(text):
+    """First balanced {...} or [...] in text (string-aware), closing it if the text is cut off."""
+    start = next((i for i, ch in enumerate(text) if ch in _CLOSERS), None)
+    if start is None:
+        return None
+
+    stack, in_string, escaped = [], False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif stack and ch == stack[-1]:
+            stack.pop()
+            if not stack:
+                return text[start:i + 1]
+    if in_string:
+        return None
+    return text[start:].rstrip().rstrip(',') + ''.join(reversed(stack))
+
+
+def _load(text):
+    """Return (json value, repaired?) or raise SchemaError."""
+    text = _FENCE.sub('', (text or '').strip()).strip()
+    if text.lower().startswith('json'):
+        text = text[4:].strip()
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+
+    candidate = _first_balanced(text)
+    if candidate is None:
+        raise SchemaError("no JSON value in the answer")
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', candidate)), True
+    except ValueError as e:
+        raise SchemaError(f"unrepairable JSON: {e}")
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+
+_stats_lock = threading.Lock()
+_stats = {kind: {'ok': 0, 'repaired': 0, 'failed': 0} for kind in _ADAPTERS}
+_fallbacks = {'after_parse_failure': 0}
+
+# Set by ai_api around one provider call; parse() appends the kind on each failure
+parse_failures = contextvars.ContextVar('parse_failures', default=None)
+
+
+def _count(kind, outcome):
+    with _stats_lock:
+        _stats[kind][outcome] += 1
+
+
+def record_fallback():
+    """Count a fallback-provider call caused by the primary's unparseable answers."""
+    with _stats_lock:
+        _fallbacks['after_parse_failure'] += 1
+
+
+def parse(kind, text):
+    """Parse a model answer into plain data for schema `kind` (a list for FOODS). Raises SchemaError."""
+    try:
+        data, repaired = _load(text)
+        if kind == FOODS and isinstance(data, dict):
+            # A single item, or an array wrapped in an object by JSON mode ({"foods": [...]})
+            wrapped = [v for v in data.values() if isinstance(v, list)]
+            data = wrapped[0] if 'name' not in data and wrapped else [data]
+        elif kind == FOODS_BATCH and isinstance(data, list):
+            data = {'meals': data}
+        value = _ADAPTERS[kind].validate_python(data)
+    except (SchemaError, ValidationError) as e:
+        _count(kind, 'failed')
+        failures = parse_failures.get()
+        if failures is not None:
+            failures.append(kind)
+        raise SchemaError(f"{kind}: {e}") from e
+
+    _count(kind, 'repaired' if repaired else 'ok')
+    if repaired:
+        logger.info(f"Repaired malformed {kind} JSON from model")
+    return _ADAPTERS[kind].dump_python(value)
+
+
+def unpack_batch(answer, count):
+    """Food lists of a parsed FOODS_BATCH answer by meal position (None for meals it left out)."""
+    foods = [None] * count
+    for meal in answer['meals']:
+        if 1 <= meal['id'] <= count and meal['foods']:
+            foods[meal['id'] - 1] = meal['foods']
+    return foods
+
+
+def stats():
+    """Return process-local parse outcomes per schema and the fallbacks they caused."""
+    with _stats_lock:
+        per_kind = {kind: dict(counts) for kind, counts in _stats.items()}
+        fallbacks = dict(_fallbacks)
+    for counts in per_kind.values():
+        total = sum(counts.values())
+        counts['failure_rate'] = round(counts['failed'] / total, 3) if total else None
+    return {'schemas': per_kind, 'fallbacks': fallbacks}
@@ -28,3 +28,10 @@ class MylinebotCodeConfig(AppConfig):
         except Exception as e:
             import logging
             logging.getLogger(__name__).warning(f"Failed to load from Gist on startup: {e}")
+
+        try:
+            from .backup_journal import replay_on_boot
+            replay_on_boot()
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning(f"Failed to replay backup journal on startup: {e}")
@@ -0,0 +1,285 @@
+"""
+Local write-ahead journal for Gist backups.
+
+Storage functions call record_mutation() instead of pushing to Gist inline.
+Each call appends an fsynced line to an append-only journal file, and a
+background syncer thread drains pending datasets to Gist. Anything still
+unacknowledged when the process dies is replayed by the syncer on next boot.
+
+Management commands exit before the syncer would run, so they call flush()
+at the end to upload what they changed synchronously.
+
+With several workers, only the holder of the 'backup-syncer' lease (see
+backup_lease.py) drains the journal; the other workers only append marks,
+which the holder picks up because they share the journal file and SQLite DB.
+
+Journal lines are JSON objects:
+    {"op": "mark", "dataset": "dietary", "ts": 1711111111.5}
+    {"op": "ack",  "dataset": "dietary", "ts": 1711111112.0}
+An ack covers every mark of that dataset with ts <= ack ts, because the
+Gist save that produced it snapshotted the DB after that point.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = str(getattr(settings, 'BACKUP_JOURNAL_PATH', 'backup_journal.log'))
+SYNC_INTERVAL = float(getattr(settings, 'BACKUP_SYNC_INTERVAL', 5))
+LEASE_NAME = 'backup-syncer'
+
+_wake = threading.Event()
+_drain_lock = threading.Lock()
+_syncer_lock = threading.Lock()
+_syncer_thread = None
+
+# Process-local counters, reported by stats()
+_stats = {
+    'marks': 0,
+    'syncs': 0,
+    'sync_failures': 0,
+    'last_sync_at': None,
+}
+
+
+def _savers():
+    """Map dataset name → Gist save function."""
+    from . import gist_storage
+
+    return {
+        'articles': gist_storage.save_articles_to_gist,
+        'users': gist_storage.save_users_to_gist,
+        'targets': gist_storage.save_targets_to_gist,
+        'dietary': gist_storage.save_dietary_to_gist,
+        'profiles': gist_storage.save_profiles_to_gist,
+    }
+
+
+def _gist_configured():
+    from .gist_storage import GITHUB_TOKEN, GIST_ID
+
+    return bool(GITHUB_TOKEN and GIST_ID)
+
+
+def _append(record):
+    """Append one record to the journal and fsync before returning."""
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    with open(JOURNAL_PATH, 'a+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            # A crash mid-append leaves a torn line; start on a fresh one so this record survives
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_records():
+    """Return all parseable journal records (a torn last line is ignored)."""
+    if not os.path.exists(JOURNAL_PATH):
+        return []
+
+    records = []
+    with open(JOURNAL_PATH, 'r', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning("Skipping corrupt backup journal line")
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return records
+
+
+def _pending_from(records):
+    """Return {dataset: oldest unacknowledged mark ts}."""
+    acked = {}
+    for r in records:
+        if r.get('op') == 'ack':
+            acked[r['dataset']] = max(acked.get(r['dataset'], 0), r['ts'])
+
+    pending = {}
+    for r in records:
+        if r.get('op') != 'mark':
+            continue
+        dataset, ts = r['dataset'], r['ts']
+        if ts > acked.get(dataset, 0) and (dataset not in pending or ts < pending[dataset]):
+            pending[dataset] = ts
+    return pending
+
+
+def pending_datasets():
+    """Return {dataset: oldest pending mark ts} for datasets not yet synced."""
+    return _pending_from(_read_records())
+
+
+def _compact():
+    """Rewrite the journal keeping only marks that are still pending."""
+    if not os.path.exists(JOURNAL_PATH):
+        return
+
+    with open(JOURNAL_PATH, 'r+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+            pending = _pending_from(records)
+            keep = [
+                r for r in records
+                if r.get('op') == 'mark' and r['dataset'] in pending and r['ts'] >= pending[r['dataset']]
+            ]
+            f.seek(0)
+            f.truncate()
+            for r in keep:
+                f.write(json.dumps(r) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def record_mutation(dataset):
+    """
+    Durably note that `dataset` changed and needs a Gist backup.
+    Returns immediately; the background syncer does the upload.
+    """
+    if not _gist_configured():
+        return False
+
+    _append({'op': 'mark', 'dataset': dataset, 'ts': time.time()})
+    _stats['marks'] += 1
+    start_syncer()
+    _wake.set()
+    return True
+
+
+def drain():
+    """
+    Upload every pending dataset to Gist once. Returns the number synced.
+    Failed datasets stay in the journal and are retried on the next pass.
+    Does nothing unless this worker holds the backup-syncer lease.
+    """
+    from django.db import close_old_connections
+    from .backup_lease import acquire_lease
+
+    # One pass at a time per process (the syncer thread and flush() may overlap)
+    with _drain_lock:
+        pending = pending_datasets()
+        if not pending:
+            return 0
+
+        savers = _savers()
+        synced = 0
+        try:
+            for dataset in pending:
+                # (Re)acquire before each upload so a slow Gist call can't outlive the lease
+                if not acquire_lease(LEASE_NAME):
+                    break
+                saver = savers.get(dataset)
+                if saver is None:
+                    logger.warning(f"Unknown dataset '{dataset}' in backup journal, dropping")
+                    _append({'op': 'ack', 'dataset': dataset, 'ts': time.time()})
+                    continue
+
+                started = time.time()
+                if saver():
+                    _append({'op': 'ack', 'dataset': dataset, 'ts': started})
+                    _stats['syncs'] += 1
+                    _stats['last_sync_at'] = started
+                    synced += 1
+                else:
+                    _stats['sync_failures'] += 1
+                    logger.warning(f"Backup sync failed for '{dataset}', will retry")
+        finally:
+            close_old_connections()
+
+        if synced:
+            _compact()
+        return synced
+
+
+def flush():
+    """
+    Upload pending datasets now and give up the lease, for processes that exit
+    before the background syncer runs (management commands). If a web worker
+    holds the lease, nothing is uploaded here: its syncer drains the shared
+    journal instead. Returns the number synced.
+    """
+    from .backup_lease import release_lease
+
+    if not _gist_configured():
+        return 0
+    try:
+        return drain()
+    finally:
+        release_lease(LEASE_NAME)
+
+
+def _run():
+    while True:
+        _wake.wait(SYNC_INTERVAL)
+        _wake.clear()
+        try:
+            drain()
+        except Exception as e:
+            logger.error(f"Backup syncer error: {e}")
+
+
+def start_syncer():
+    """Start the background syncer thread once per process."""
+    global _syncer_thread
+
+    with _syncer_lock:
+        if _syncer_thread is not None and _syncer_thread.is_alive():
+            return
+        _syncer_thread = threading.Thread(target=_run, name='backup-syncer', daemon=True)
+        _syncer_thread.start()
+
+
+def replay_on_boot():
+    """Start the syncer and wake it so entries left by a crashed process are sent."""
+    if not _gist_configured():
+        return
+
+    pending = pending_datasets()
+    if pending:
+        logger.info(f"Replaying {len(pending)} unsent backup dataset(s) from journal: {', '.join(pending)}")
+    start_syncer()
+    _wake.set()
+
+
+def stats():
+    """Return backup sync metrics, including sync lag in seconds."""
+    from .backup_lease import current_holder, holder_id
+
+    pending = pending_datasets()
+    now = time.time()
+    leader = current_holder(LEASE_NAME)
+    return {
+        'leader': leader,
+        'is_leader': leader == holder_id(),
+        'pending': sorted(pending),
+        'sync_lag_seconds': round(now - min(pending.values()), 1) if pending else 0,
+        'marks': _stats['marks'],
+        'syncs': _stats['syncs'],
+        'sync_failures': _stats['sync_failures'],
+        'last_sync_at': _stats['last_sync_at'],
+    }
@@ -0,0 +1,70 @@
+"""
+DB-backed lease so exactly one worker at a time writes Gist backups.
+
+Every gunicorn worker runs a backup syncer, but only the lease holder drains
+the journal; the others just append marks to it. The lease is one BackupLease
+row whose expiry the holder keeps pushing forward; if the holder dies, the
+row expires and the next worker to ask takes over.
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL = float(getattr(settings, 'BACKUP_LEASE_TTL', 60))
+
+
+def holder_id():
+    """Identify this worker process (computed per call so forked workers differ)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(name, holder=None, ttl=None):
+    """
+    Take or renew the named lease. Returns True if `holder` now holds it.
+    A single conditional UPDATE renews our own lease or steals an expired one;
+    if the row doesn't exist yet, the unique constraint arbitrates the INSERT.
+    """
+    from django.db import IntegrityError, transaction
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import BackupLease
+
+    holder = holder or holder_id()
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl or LEASE_TTL)
+
+    updated = BackupLease.objects.filter(name=name).filter(
+        Q(holder=holder) | Q(expires_at__lt=now)
+    ).update(holder=holder, expires_at=expires_at)
+    if updated:
+        return True
+
+    try:
+        with transaction.atomic():
+            BackupLease.objects.create(name=name, holder=holder, expires_at=expires_at)
+        logger.info(f"Acquired lease '{name}' as {holder}")
+        return True
+    except IntegrityError:
+        return False
+
+
+def release_lease(name, holder=None):
+    """Give up the named lease if we hold it."""
+    from django.utils import timezone
+    from .models import BackupLease
+
+    BackupLease.objects.filter(name=name, holder=holder or holder_id()).update(expires_at=timezone.now())
+
+
+def current_holder(name):
+    """Return the holder id of an unexpired lease, or None."""
+    from django.utils import timezone
+    from .models import BackupLease
+
+    lease = BackupLease.objects.filter(name=name, expires_at__gte=timezone.now()).first()
+    return lease.holder if lease else None
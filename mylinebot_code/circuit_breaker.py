@@ -0,0 +1,171 @@
+"""
+Per-model circuit breakers for the AI providers, shared across workers via the cache.
+
+Each (provider, model) pair has a breaker:
+- closed    → calls go through; 5xx/timeouts are counted, a 429 trips it at once
+- open      → the model is skipped without a request until the cooldown ends
+- half-open → after the cooldown, one caller (across all workers) probes the
+              model; success closes the breaker, failure re-opens it with a
+              longer cooldown
+
+Cooldowns come from the Retry-After header when the provider sends one,
+otherwise a per-failure default, doubled on each consecutive trip up to
+AI_BREAKER_MAX_COOLDOWN. State lives in Django's cache (the shared file cache
+by default), so a quota outage costs one failed call, not one per message.
+
+The providers call the a* variants from the ai_http event loop; they run the
+cache I/O in a worker thread so a slow file cache never stalls other requests
+on the loop. Consecutive failures are counted with cache.add()/incr(), which
+is atomic on memcached/Redis. The file cache implements incr() as a read and
+a write, so two workers failing at the same moment may count one failure, and
+a trip after FAILURE_THRESHOLD failures may come one failure late (a 429 still
+trips at once). The trip itself is last-writer-wins across workers, which at
+worst records the same cooldown twice.
+"""
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Consecutive 5xx/timeout failures that trip a closed breaker (429 always trips)
+FAILURE_THRESHOLD = int(getattr(settings, 'AI_BREAKER_FAILURE_THRESHOLD', 2))
+DEFAULT_COOLDOWN = float(getattr(settings, 'AI_BREAKER_COOLDOWN', 30))
+RATE_LIMIT_COOLDOWN = float(getattr(settings, 'AI_BREAKER_RATE_LIMIT_COOLDOWN', 60))
+MAX_COOLDOWN = float(getattr(settings, 'AI_BREAKER_MAX_COOLDOWN', 900))
+# How long a half-open probe may take before another worker may probe
+PROBE_TTL = 60
+
+
+class CircuitOpenError(Exception):
+    """Raised by a provider when every one of its models is circuit-open."""
+
+
+def _key(provider, model):
+    return f'breaker:{provider}:{model}'
+
+
+def _retry_after(value):
+    """Seconds from a Retry-After header value (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _state(key):
+    """Return (trip state dict or None, consecutive failure count)."""
+    found = cache.get_many([key, f'{key}:failures'])
+    return found.get(key), found.get(f'{key}:failures', 0)
+
+
+def _count_failure(key):
+    """Add one to the consecutive failure counter and return the new count."""
+    failures_key = f'{key}:failures'
+    cache.add(failures_key, 0, MAX_COOLDOWN * 2)
+    try:
+        return cache.incr(failures_key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(failures_key, 1, MAX_COOLDOWN * 2)
+        return 1
+
+
+def allow(provider, model):
+    """Return True if a request to this model should be attempted now."""
+    state = cache.get(_key(provider, model))
+    if not state or state.get('open_until') is None:
+        return True
+    if time.time() < state['open_until']:
+        return False
+    # Cooldown over: half-open, let exactly one caller probe
+    return cache.add(f'{_key(provider, model)}:probe', 1, PROBE_TTL)
+
+
+def record_success(provider, model):
+    """Close the breaker (and forget counted failures)."""
+    key = _key(provider, model)
+    state, failures = _state(key)
+    if state or failures:
+        if state and state.get('open_until') is not None:
+            logger.info(f"Circuit closed for {provider}/{model}")
+        cache.delete_many([key, f'{key}:probe', f'{key}:failures'])
+
+
+def record_failure(provider, model, status=None, retry_after=None):
+    """
+    Count a 429/5xx/timeout (status None for timeouts and connection errors;
+    retry_after is the raw Retry-After header). Trips the breaker on a 429 or
+    after FAILURE_THRESHOLD consecutive failures, or again if a half-open probe failed.
+    """
+    key = _key(provider, model)
+    failures = _count_failure(key)
+    state = cache.get(key) or {'trips': 0, 'open_until': None}
+
+    probing = state['open_until'] is not None
+    if not (status == 429 or probing or failures >= FAILURE_THRESHOLD):
+        return
+
+    state['trips'] += 1
+    cooldown = _retry_after(retry_after)
+    if cooldown is None:
+        base = RATE_LIMIT_COOLDOWN if status == 429 else DEFAULT_COOLDOWN
+        cooldown = base * 2 ** (state['trips'] - 1)
+    cooldown = min(cooldown, MAX_COOLDOWN)
+    state['open_until'] = time.time() + cooldown
+    state['last_status'] = status
+
+    cache.set(key, state, MAX_COOLDOWN * 2)
+    cache.delete(f'{key}:probe')
+    logger.warning(f"Circuit open for {provider}/{model} for {cooldown:.0f}s (status {status or 'timeout/error'})")
+
+
+async def aallow(provider, model):
+    """allow() for coroutines: the cache I/O runs off the event loop."""
+    return await asyncio.to_thread(allow, provider, model)
+
+
+async def arecord_success(provider, model):
+    """record_success() for coroutines."""
+    await asyncio.to_thread(record_success, provider, model)
+
+
+async def arecord_failure(provider, model, status=None, retry_after=None):
+    """record_failure() for coroutines."""
+    await asyncio.to_thread(record_failure, provider, model, status, retry_after)
+
+
+def stats():
+    """Return {'provider/model': breaker state} for every configured model."""
+    from .gemini_api import GEMINI_MODELS
+    from .openrouter_api import TEXT_MODELS, VISION_MODELS
+
+    now = time.time()
+    result = {}
+    openrouter_models = dict.fromkeys(TEXT_MODELS + VISION_MODELS)
+    models = [('gemini', m) for m in GEMINI_MODELS] + [('openrouter', m) for m in openrouter_models]
+    for provider, model in models:
+        state, failures = _state(_key(provider, model))
+        if not state or state.get('open_until') is None:
+            label = 'closed'
+        elif now < state['open_until']:
+            label = 'open'
+        else:
+            label = 'half-open'
+        result[f'{provider}/{model}'] = {
+            'state': label,
+            'failures': failures,
+            'trips': state['trips'] if state else 0,
+            'reopens_in': round(state['open_until'] - now, 1) if label == 'open' else None,
+        }
+    return result
@@ -1,16 +1,30 @@
 """
-DB-primary storage for dietary logs, with Gist write-through backup.
+DB-primary storage for dietary logs, with journaled Gist backup (see backup_journal.py).
 Each user's food entries are stored per-date in the FoodEntry model.
 """
+import hashlib
 import logging
+import uuid
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
 # Taiwan timezone (UTC+8)
 TW_TZ = timezone(timedelta(hours=8))
 
+# Seconds a cached food log stays valid (mutations invalidate it sooner)
+LOG_CACHE_TTL = 600
+
+# Seconds AI advice for an unchanged log is reused (mutations invalidate it sooner)
+ADVICE_CACHE_TTL = 6 * 3600
+
+# Process-local food log cache counters, reported by cache_stats()
+_cache_stats = {'hits': 0, 'misses': 0}
+
 
 def _today_date():
     """Get today's date object in Taiwan timezone."""
@@ -31,50 +45,195 @@ def _entry_to_dict(entry):
     }
 
 
+_NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+
+
+# ── Food log cache ────────────────────────────────────────────────────────────
+# Serialised logs are cached per user under a version token. Every mutation
+# replaces the token, so stale entries are simply never read again. A fresh
+# random token (rather than incr) keeps this correct on backends without
+# atomic increments, e.g. the shared file cache used across workers.
+
+def _log_version(user_id):
+    """Return the user's current log version token, creating one if missing."""
+    key = f'dietary:ver:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_log_version(user_id):
+    """Invalidate every cached log view for a user."""
+    cache.set(f'dietary:ver:{user_id}', uuid.uuid4().hex, None)
+
+
+def _cached_log(user_id, name, build):
+    """
+    Read-through cache for a serialised log view. `name` must identify the view
+    (including its date); `build` produces the value on a miss.
+    Falls back to `build` if the cache backend is unavailable.
+    """
+    try:
+        key = f'dietary:{name}:{user_id}:{_log_version(user_id)}'
+        value = cache.get(key)
+        if value is not None:
+            _cache_stats['hits'] += 1
+            return value
+        _cache_stats['misses'] += 1
+    except Exception as e:
+        logger.warning(f"Food log cache unavailable: {e}")
+        return build()
+
+    value = build()
+    cache.set(key, value, LOG_CACHE_TTL)
+    return value
+
+
+def cache_stats():
+    """Return this process's food log cache hit/miss counts and hit rate."""
+    hits, misses = _cache_stats['hits'], _cache_stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 3) if total else None,
+    }
+
+
+# Advice is keyed by the same version token, so the LINE report can reuse what
+# the LIFF page just streamed until the user's log changes.
+
+def _advice_key(user_id, tdee, user_prompt, goal):
+    context = hashlib.sha1(f'{tdee}|{goal}|{user_prompt}'.encode('utf-8')).hexdigest()[:16]
+    return f'dietary:advice:{user_id}:{_today_date().isoformat()}:{_log_version(user_id)}:{context}'
+
+
+def get_cached_advice(user_id, tdee=None, user_prompt='', goal=''):
+    """Return AI advice cached for the user's current log and this context, or None."""
+    try:
+        return cache.get(_advice_key(user_id, tdee, user_prompt, goal))
+    except Exception as e:
+        logger.warning(f"Advice cache unavailable: {e}")
+        return None
+
+
+def cache_advice(user_id, advice, tdee=None, user_prompt='', goal=''):
+    """Cache AI advice for the user's current log and this context."""
+    try:
+        cache.set(_advice_key(user_id, tdee, user_prompt, goal), advice, ADVICE_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Advice cache unavailable: {e}")
+
+
+def _log_changed(user_id):
+    """
+    After a committed FoodEntry write: invalidate cached logs and schedule a backup.
+    Both are deferred to the unit of work, so a request touching the log several
+    times invalidates and journals once.
+    """
+    from .unit_of_work import defer, defer_backup
+
+    defer(('log-version', user_id), partial(_bump_log_version, user_id))
+    defer_backup('dietary')
+
+
+def _streak_changed(user_id):
+    """Update the user's streak once, inside the transaction of the storage write that called this."""
+    from .unit_of_work import defer
+
+    defer(('streak', user_id), partial(update_streak, user_id), before_commit=True)
+
+
+def _nutrient_delta(entries, sign=1):
+    """Sum nutrients over FoodEntry instances or dicts (None counts as 0), times sign."""
+    delta = dict.fromkeys(_NUTRIENTS, 0.0)
+    for e in entries:
+        for key in _NUTRIENTS:
+            value = e.get(key) if isinstance(e, dict) else getattr(e, key)
+            delta[key] += sign * (value or 0)
+    return delta
+
+
+def _apply_totals_delta(user_id, day, delta, items=0):
+    """
+    Add nutrient/item deltas to the user's DailyTotals row for `day`.
+    Call inside the transaction of the FoodEntry write it mirrors.
+    """
+    from django.db import IntegrityError, transaction
+    from django.db.models import F
+    from .models import DailyTotals
+
+    changes = {key: F(key) + value for key, value in delta.items()}
+    changes['item_count'] = F('item_count') + items
+    if DailyTotals.objects.filter(user_id=user_id, date=day).update(**changes):
+        return
+
+    if items <= 0:
+        # Nothing to subtract from; rebuild_daily_totals() repairs a missing row
+        logger.warning(f"DailyTotals row missing for {user_id} on {day}")
+        return
+
+    try:
+        with transaction.atomic():
+            DailyTotals.objects.create(user_id=user_id, date=day, item_count=items, **delta)
+    except IntegrityError:
+        # Created concurrently by another request — apply on top of it
+        DailyTotals.objects.filter(user_id=user_id, date=day).update(**changes)
+
+
 def update_streak(user_id):
     """
     Update user's streak count based on today's date.
-    Called whenever a food entry is added.
+    Called (via the unit of work) whenever a food entry is added.
     - If streak_last_date == today → no change
     - If streak_last_date == yesterday → increment streak
     - Otherwise → reset to 1
+    One statement, no read: an INSERT of a fresh profile whose ON CONFLICT branch
+    applies the date-guarded CASE update, RETURNING the new count (SQLite 3.35+).
+    Concurrent adds from chat and LIFF can't lose an increment, and a same-day
+    repeat matches the guard's WHERE and returns nothing.
+    Returns the new streak count, or None if it was already counted today.
     """
+    from django.db import connection
     from .models import UserProfile
-    from .gist_storage import save_profiles_to_gist
+    from .unit_of_work import defer_backup
 
     today = _today_date()
-    profile, created = UserProfile.objects.get_or_create(
-        user_id=user_id,
-        defaults={
-            'gender': '',
-            'height': 0,
-            'weight': 0,
-            'age': 0,
-            'streak_count': 1,
-            'streak_last_date': today,
-        }
-    )
-
-    if created:
-        # New profile, streak already set to 1
-        save_profiles_to_gist()
-        return
-
-    if profile.streak_last_date == today:
-        # Already logged today, no change
-        return
-
     yesterday = today - timedelta(days=1)
-    if profile.streak_last_date == yesterday:
-        # Consecutive day, increment
-        profile.streak_count += 1
-    else:
-        # Streak broken, reset to 1
-        profile.streak_count = 1
 
-    profile.streak_last_date = today
-    profile.save()
-    save_profiles_to_gist()
+    # Column values for a new profile, from the model's defaults (auto_now included)
+    fresh = UserProfile(
+        user_id=user_id, gender='', height=0, weight=0, age=0,
+        streak_count=1, streak_last_date=today,
+    )
+    fields = [f for f in UserProfile._meta.concrete_fields if not f.primary_key]
+    values = [f.get_db_prep_save(f.pre_save(fresh, True), connection) for f in fields]
+
+    qn = connection.ops.quote_name
+    last_date = UserProfile._meta.get_field('streak_last_date')
+    count, last = qn('streak_count'), qn(last_date.column)
+    updated = qn(UserProfile._meta.get_field('updated_at').column)
+    sql = (
+        f"INSERT INTO {qn(UserProfile._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))}) "
+        f"ON CONFLICT ({qn('user_id')}) DO UPDATE SET "
+        f"{count} = CASE WHEN {last} = %s THEN {count} + 1 ELSE 1 END, "
+        f"{last} = excluded.{last}, "
+        f"{updated} = excluded.{updated} "
+        f"WHERE {last} IS NULL OR {last} <> excluded.{last} "
+        f"RETURNING {count}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*values, last_date.get_db_prep_value(yesterday, connection)])
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    defer_backup('profiles')
+    return row[0]
 
 
 def get_streak(user_id):
@@ -93,38 +252,21 @@ def get_streak(user_id):
 
 def add_food_entry(user_id, food_entry):
     """
-    Append a food entry to today's log for a user, then sync to Gist.
+    Append a food entry to today's log for a user, then schedule a Gist backup.
     food_entry: dict with keys name, description, calories, protein, carbs, fat
     Returns True on success.
     """
-    from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
-
-    FoodEntry.objects.create(
-        user_id=user_id,
-        date=_today_date(),
-        name=food_entry.get('name', ''),
-        description=food_entry.get('description', ''),
-        calories=food_entry.get('calories'),
-        protein=food_entry.get('protein'),
-        carbs=food_entry.get('carbs'),
-        fat=food_entry.get('fat'),
-        basis=food_entry.get('basis', ''),
-    )
-
-    update_streak(user_id)
-    save_dietary_to_gist()
-    return True
+    return add_food_entries(user_id, [food_entry])
 
 
 def add_food_entries(user_id, food_entries):
     """
-    Batch-insert multiple food entries to today's log, then sync to Gist once.
+    Batch-insert multiple food entries to today's log, then schedule one Gist backup.
     food_entries: list of dicts with keys name, calories, protein, carbs, fat, basis
     Returns True on success.
     """
+    from .unit_of_work import atomic
     from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
 
     today = _today_date()
     objects = [
@@ -141,62 +283,64 @@ def add_food_entries(user_id, food_entries):
         )
         for entry in food_entries
     ]
-    FoodEntry.objects.bulk_create(objects)
+    with atomic():
+        FoodEntry.objects.bulk_create(objects)
+        _apply_totals_delta(user_id, today, _nutrient_delta(objects), len(objects))
+        _streak_changed(user_id)
 
-    update_streak(user_id)
-    save_dietary_to_gist()
+    _log_changed(user_id)
     return True
 
 
-def remove_food_entry(user_id, index):
+# Fields a caller may change on an existing entry
+_EDITABLE_FIELDS = ('name', 'description', 'calories', 'protein', 'carbs', 'fat', 'basis')
+
+
+def _today_ids_at(user_id, indices):
     """
-    Remove a food entry by 1-based index from today's log.
-    Returns the removed food dict on success, None if index is invalid.
+    Resolve 1-based positions in today's log to FoodEntry primary keys.
+    One ordered values_list query, however many entries exist.
+    Returns {index: pk} for the valid indices only.
     """
     from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
 
-    today = _today_date()
-    entries = list(FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at'))
-
-    if not entries or index < 1 or index > len(entries):
-        return None
+    ids = list(
+        FoodEntry.objects.filter(user_id=user_id, date=_today_date())
+        .order_by('added_at')
+        .values_list('id', flat=True)
+    )
+    return {i: ids[i - 1] for i in indices if 1 <= i <= len(ids)}
 
-    entry = entries[index - 1]
-    removed = _entry_to_dict(entry)
-    entry.delete()
 
-    save_dietary_to_gist()
-    return removed
+def remove_food_entry(user_id, index):
+    """
+    Remove a food entry by 1-based index from today's log.
+    Returns the removed food dict on success, None if index is invalid.
+    """
+    removed = remove_food_entries(user_id, [index])
+    return removed[0] if removed else None
 
 
 def remove_food_entries(user_id, indices):
     """
     Remove multiple food entries by 1-based indices from today's log.
-    Indices are processed in descending order so earlier indices stay valid.
-    Returns list of removed food dicts. Invalid indices are skipped.
+    Positions are resolved to PKs up front, then deleted with a single DELETE.
+    Returns list of removed food dicts in index order. Invalid indices are skipped.
     """
+    from .unit_of_work import atomic
     from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
-
-    today = _today_date()
-    entries = list(FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at'))
-
-    if not entries:
-        return []
 
-    removed = []
-    for index in sorted(set(indices), reverse=True):
-        if index < 1 or index > len(entries):
-            continue
-        entry = entries[index - 1]
-        removed.append(_entry_to_dict(entry))
-        entry.delete()
+    with atomic():
+        id_map = _today_ids_at(user_id, set(indices))
+        if not id_map:
+            return []
 
-    if removed:
-        save_dietary_to_gist()
+        entries = FoodEntry.objects.in_bulk(list(id_map.values()))
+        removed = [_entry_to_dict(entries[id_map[i]]) for i in sorted(id_map)]
+        FoodEntry.objects.filter(id__in=id_map.values()).delete()
+        _apply_totals_delta(user_id, _today_date(), _nutrient_delta(entries.values(), sign=-1), -len(entries))
 
-    removed.reverse()  # return in original index order
+    _log_changed(user_id)
     return removed
 
 
@@ -207,63 +351,173 @@ def get_food_entry_by_index(user_id, index):
     """
     from .models import FoodEntry
 
-    today = _today_date()
-    entries = list(FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at'))
-
-    if not entries or index < 1 or index > len(entries):
+    if index < 1:
         return None
 
-    return _entry_to_dict(entries[index - 1])
+    today = _today_date()
+    entry = FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at')[index - 1:index].first()
+    return _entry_to_dict(entry) if entry else None
 
 
 def update_food_entry(user_id, index, updated_food):
     """
-    Update a food entry by 1-based index from today's log, then sync to Gist.
+    Update a food entry by 1-based index from today's log, then schedule a Gist backup.
     updated_food: dict with keys name, description, calories, protein, carbs, fat, basis
+    Applied as a single UPDATE; keys missing from updated_food are left unchanged.
     Returns True on success, False if index is invalid.
     """
-    from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
+    from .unit_of_work import atomic
 
-    today = _today_date()
-    entries = list(FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at'))
-
-    if not entries or index < 1 or index > len(entries):
-        return False
-
-    entry = entries[index - 1]
-    entry.name = updated_food.get('name', entry.name)
-    entry.description = updated_food.get('description', entry.description)
-    entry.calories = updated_food.get('calories', entry.calories)
-    entry.protein = updated_food.get('protein', entry.protein)
-    entry.carbs = updated_food.get('carbs', entry.carbs)
-    entry.fat = updated_food.get('fat', entry.fat)
-    entry.basis = updated_food.get('basis', entry.basis)
-    entry.save()
-
-    save_dietary_to_gist()
+    fields = {k: updated_food[k] for k in _EDITABLE_FIELDS if k in updated_food}
+
+    with atomic():
+        pk = _today_ids_at(user_id, [index]).get(index)
+        if pk is None:
+            return False
+        if fields:
+            _update_entry_fields(user_id, pk, _today_date(), fields)
+
+    _log_changed(user_id)
     return True
 
 
-def get_today_log(user_id):
-    """Return today's food list for a user, or empty list."""
+def _update_entry_fields(user_id, pk, day, fields):
+    """UPDATE one FoodEntry and shift its day's totals by the nutrient change."""
     from .models import FoodEntry
 
-    today = _today_date()
-    entries = FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at')
-    return [_entry_to_dict(e) for e in entries]
+    changed = [key for key in _NUTRIENTS if key in fields]
+    if changed:
+        old = FoodEntry.objects.filter(id=pk).values(*changed).first() or {}
+        delta = dict.fromkeys(_NUTRIENTS, 0.0)
+        for key in changed:
+            delta[key] = (fields[key] or 0) - (old.get(key) or 0)
+        _apply_totals_delta(user_id, day, delta)
+
+    FoodEntry.objects.filter(id=pk).update(**fields)
+
 
+def get_daily_totals(user_id, day=None):
+    """
+    Return {'calories', 'protein', 'carbs', 'fat', 'item_count'} for a user's day
+    (today by default) from DailyTotals — one row, no entry scan. Zeros if nothing logged.
+    """
+    from .models import DailyTotals
 
-def get_history(user_id):
-    """Return dict of {date: foods} for all dates the user has data, sorted newest first."""
+    row = DailyTotals.objects.filter(
+        user_id=user_id, date=day or _today_date(),
+    ).values(*_NUTRIENTS, 'item_count').first()
+    return row or {**dict.fromkeys(_NUTRIENTS, 0.0), 'item_count': 0}
+
+
+def get_daily_summaries(user_id, start=None, end=None):
+    """
+    Return {date_str: {'calories', 'protein', 'carbs', 'fat', 'item_count'}} for each
+    day in [start, end] that has entries, newest first. Defaults to the last 7 days.
+    Aggregated in SQL with values('date').annotate(), so no FoodEntry objects are built.
+    Days older than the retention window come from their compacted DailyTotals rollup.
+    """
+    from django.db.models import Count, Sum
+    from .models import DailyTotals, FoodEntry
+
+    end = end or _today_date()
+    start = start or end - timedelta(days=7)
+
+    rows = FoodEntry.objects.filter(
+        user_id=user_id, date__gte=start, date__lte=end,
+    ).values('date').annotate(
+        calories=Sum('calories'), protein=Sum('protein'), carbs=Sum('carbs'), fat=Sum('fat'),
+        item_count=Count('id'),
+    ).order_by('-date')
+
+    summaries = {
+        row['date'].isoformat(): {
+            'calories': row['calories'] or 0,
+            'protein': row['protein'] or 0,
+            'carbs': row['carbs'] or 0,
+            'fat': row['fat'] or 0,
+            'item_count': row['item_count'],
+        }
+        for row in rows
+    }
+
+    # A compacted row also counts any entries added to that day after compaction
+    rolled = DailyTotals.objects.filter(
+        user_id=user_id, compacted=True, date__gte=start, date__lte=end,
+    ).values('date', *_NUTRIENTS, 'item_count')
+    if not rolled:
+        return summaries
+    for row in rolled:
+        summaries[row.pop('date').isoformat()] = row
+    return dict(sorted(summaries.items(), reverse=True))
+
+
+def get_weekly_rollups(user_id, weeks=12):
+    """
+    Return {week_start_str: {'calories', 'protein', 'carbs', 'fat', 'item_count',
+    'day_count', 'top_foods'}} for the user's compacted weeks, newest first.
+    Only covers days retention has already rolled up; recent days live in FoodEntry.
+    """
+    from .models import WeeklyRollup
+
+    since = _week_start(_today_date()) - timedelta(weeks=weeks)
+    rows = WeeklyRollup.objects.filter(
+        user_id=user_id, week_start__gte=since,
+    ).order_by('-week_start').values('week_start', *_NUTRIENTS, 'item_count', 'day_count', 'top_foods')
+    return {row.pop('week_start').isoformat(): row for row in rows}
+
+
+def rebuild_daily_totals(user_id=None):
+    """
+    Recompute DailyTotals from FoodEntry rows (repair tool).
+    Limited to one user if user_id is given. Returns the number of rows written.
+    Compacted rollup rows are left alone: their raw entries no longer exist.
+    """
+    from django.db import transaction
+    from django.db.models import Count, Sum
+    from .models import DailyTotals, FoodEntry
+
+    totals = DailyTotals.objects.filter(compacted=False)
+    rollups = DailyTotals.objects.filter(compacted=True)
+    entries = FoodEntry.objects.all()
+    if user_id:
+        totals = totals.filter(user_id=user_id)
+        rollups = rollups.filter(user_id=user_id)
+        entries = entries.filter(user_id=user_id)
+
+    rows = entries.values('user_id', 'date').annotate(
+        calories=Sum('calories'), protein=Sum('protein'), carbs=Sum('carbs'), fat=Sum('fat'),
+        item_count=Count('id'),
+    ).order_by()
+
+    with transaction.atomic():
+        compacted = set(rollups.values_list('user_id', 'date'))
+        totals.delete()
+        created = DailyTotals.objects.bulk_create([
+            DailyTotals(
+                user_id=r['user_id'], date=r['date'],
+                calories=r['calories'] or 0, protein=r['protein'] or 0,
+                carbs=r['carbs'] or 0, fat=r['fat'] or 0,
+                item_count=r['item_count'],
+            )
+            for r in rows
+            if (r['user_id'], r['date']) not in compacted
+        ])
+
+    logger.info(f"Rebuilt {len(created)} DailyTotals rows")
+    return len(created)
+
+
+def get_today_log(user_id):
+    """Return today's food list for a user, or empty list. Served from cache when fresh."""
     from .models import FoodEntry
 
-    entries = FoodEntry.objects.filter(user_id=user_id).order_by('-date', 'added_at')
-    result = defaultdict(list)
-    for entry in entries:
-        result[entry.date.isoformat()].append(_entry_to_dict(entry))
+    today = _today_date()
+
+    def build():
+        entries = FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at')
+        return [_entry_to_dict(e) for e in entries]
 
-    return dict(sorted(result.items(), reverse=True))
+    return _cached_log(user_id, f'today:{today.isoformat()}', build)
 
 
 def get_all_users_today():
@@ -281,16 +535,17 @@ def get_all_users_today():
 
 
 def set_tdee(user_id, tdee):
-    """Set TDEE for a user and sync to Gist."""
+    """Set TDEE for a user and schedule a Gist backup."""
     from .models import UserTdee
-    from .gist_storage import save_dietary_to_gist
+    from .unit_of_work import atomic, defer_backup
 
-    UserTdee.objects.update_or_create(
-        user_id=user_id,
-        defaults={'tdee': tdee},
-    )
+    with atomic():
+        UserTdee.objects.update_or_create(
+            user_id=user_id,
+            defaults={'tdee': tdee},
+        )
 
-    save_dietary_to_gist()
+    defer_backup('dietary')
     return True
 
 
@@ -310,19 +565,24 @@ def _entry_to_dict_with_id(entry):
 
 
 def get_entries_with_ids(user_id, days=7):
-    """Return {date_str: [entry dicts with id]} for the last N days, newest first."""
+    """Return {date_str: [entry dicts with id]} for the last N days, newest first. Cached."""
     from .models import FoodEntry
 
-    cutoff = _today_date() - timedelta(days=days)
-    entries = FoodEntry.objects.filter(
-        user_id=user_id, date__gte=cutoff,
-    ).order_by('-date', 'added_at')
+    today = _today_date()
+    cutoff = today - timedelta(days=days)
 
-    result = defaultdict(list)
-    for entry in entries:
-        result[entry.date.isoformat()].append(_entry_to_dict_with_id(entry))
+    def build():
+        entries = FoodEntry.objects.filter(
+            user_id=user_id, date__gte=cutoff,
+        ).order_by('-date', 'added_at')
+
+        result = defaultdict(list)
+        for entry in entries:
+            result[entry.date.isoformat()].append(_entry_to_dict_with_id(entry))
 
-    return dict(sorted(result.items(), reverse=True))
+        return dict(sorted(result.items(), reverse=True))
+
+    return _cached_log(user_id, f'entries:{today.isoformat()}:{days}', build)
 
 
 def update_entry_by_id(entry_id, user_id, updated_fields):
@@ -330,19 +590,24 @@ def update_entry_by_id(entry_id, user_id, updated_fields):
     Update a FoodEntry by its primary key. Verifies user_id ownership.
     Returns the updated dict, or None if not found / wrong user.
     """
+    from .unit_of_work import atomic
     from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
 
-    entry = FoodEntry.objects.filter(id=entry_id, user_id=user_id).first()
-    if not entry:
-        return None
+    with atomic():
+        entry = FoodEntry.objects.filter(id=entry_id, user_id=user_id).first()
+        if not entry:
+            return None
+
+        old = _nutrient_delta([entry], sign=-1)
+        for field in _EDITABLE_FIELDS:
+            if field in updated_fields:
+                setattr(entry, field, updated_fields[field])
+        entry.save()
 
-    for field in ('name', 'description', 'calories', 'protein', 'carbs', 'fat', 'basis'):
-        if field in updated_fields:
-            setattr(entry, field, updated_fields[field])
-    entry.save()
+        new = _nutrient_delta([entry])
+        _apply_totals_delta(user_id, entry.date, {key: new[key] + old[key] for key in _NUTRIENTS})
 
-    save_dietary_to_gist()
+    _log_changed(user_id)
     return _entry_to_dict_with_id(entry)
 
 
@@ -351,17 +616,19 @@ def delete_entry_by_id(entry_id, user_id):
     Delete a FoodEntry by its primary key. Verifies user_id ownership.
     Returns the removed dict, or None if not found / wrong user.
     """
+    from .unit_of_work import atomic
     from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
 
-    entry = FoodEntry.objects.filter(id=entry_id, user_id=user_id).first()
-    if not entry:
-        return None
+    with atomic():
+        entry = FoodEntry.objects.filter(id=entry_id, user_id=user_id).first()
+        if not entry:
+            return None
 
-    removed = _entry_to_dict_with_id(entry)
-    entry.delete()
+        removed = _entry_to_dict_with_id(entry)
+        entry.delete()
+        _apply_totals_delta(user_id, entry.date, _nutrient_delta([entry], sign=-1), -1)
 
-    save_dietary_to_gist()
+    _log_changed(user_id)
     return removed
 
 
@@ -371,35 +638,194 @@ def add_entry_for_date(user_id, date_str, food_entry):
     date_str: ISO format date string (e.g. '2026-03-25')
     Returns the created entry dict with id.
     """
+    return add_entries_for_date(user_id, date_str, [food_entry])[0]
+
+
+def add_entries_for_date(user_id, date_str, food_entries):
+    """
+    Add several food entries for a specific date in one transaction.
+    Returns the created entry dicts with ids.
+    """
     from datetime import date as date_type
+    from .unit_of_work import atomic
     from .models import FoodEntry
-    from .gist_storage import save_dietary_to_gist
-
-    entry = FoodEntry.objects.create(
-        user_id=user_id,
-        date=date_type.fromisoformat(date_str),
-        name=food_entry.get('name', ''),
-        description=food_entry.get('description', ''),
-        calories=food_entry.get('calories'),
-        protein=food_entry.get('protein'),
-        carbs=food_entry.get('carbs'),
-        fat=food_entry.get('fat'),
-        basis=food_entry.get('basis', ''),
-    )
 
-    # Update streak if this is today's date
-    if date_type.fromisoformat(date_str) == _today_date():
-        update_streak(user_id)
+    day = date_type.fromisoformat(date_str)
+    with atomic():
+        # create() rather than bulk_create() so each entry gets its PK back on SQLite
+        entries = [
+            FoodEntry.objects.create(
+                user_id=user_id,
+                date=day,
+                name=f.get('name', ''),
+                description=f.get('description', ''),
+                calories=f.get('calories'),
+                protein=f.get('protein'),
+                carbs=f.get('carbs'),
+                fat=f.get('fat'),
+                basis=f.get('basis', ''),
+            )
+            for f in food_entries
+        ]
+        _apply_totals_delta(user_id, day, _nutrient_delta(entries), len(entries))
+        # Update streak if this is today's date
+        if entries and day == _today_date():
+            _streak_changed(user_id)
 
-    save_dietary_to_gist()
-    return _entry_to_dict_with_id(entry)
+    if not entries:
+        return []
 
+    _log_changed(user_id)
+    return [_entry_to_dict_with_id(e) for e in entries]
 
-def prune_old_entries():
-    """Remove entries older than 7 days."""
+
+def bulk_insert_entries(user_id, entries):
+    """
+    Insert unsaved FoodEntry objects for one user, on any dates, and fold them into
+    DailyTotals. Used by bulk import, which calls it once per batch inside its own
+    transaction. Returns the number inserted.
+    """
+    from .unit_of_work import atomic
     from .models import FoodEntry
 
-    cutoff = _today_date() - timedelta(days=7)
-    deleted, _ = FoodEntry.objects.filter(date__lt=cutoff).delete()
-    if deleted:
-        logger.info(f"Pruned {deleted} old food entries")
+    by_date = defaultdict(list)
+    for entry in entries:
+        by_date[entry.date].append(entry)
+
+    with atomic():
+        FoodEntry.objects.bulk_create(entries)
+        for day, day_entries in by_date.items():
+            _apply_totals_delta(user_id, day, _nutrient_delta(day_entries), len(day_entries))
+
+    _log_changed(user_id)
+    return len(entries)
+
+
+# ── Retention ────────────────────────────────────────────────────────────────
+# A scheduled job (see compact_old_entries) rolls raw entries older than the
+# retention window into DailyTotals / WeeklyRollup rows and then deletes them,
+# so the write path never pays for pruning and long-range history stays cheap.
+
+# Foods kept per rollup row, ranked by how often they were logged
+TOP_FOODS_LIMIT = 5
+
+
+def _week_start(day):
+    """Monday of the week containing `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def _merge_top_foods(*food_lists):
+    """Merge [{'name', 'count', 'calories'}] lists and keep the TOP_FOODS_LIMIT most logged."""
+    merged = {}
+    for foods in food_lists:
+        for f in foods:
+            m = merged.setdefault(f['name'], {'name': f['name'], 'count': 0, 'calories': 0.0})
+            m['count'] += f['count']
+            m['calories'] = round(m['calories'] + (f['calories'] or 0), 1)
+    ranked = sorted(merged.values(), key=lambda f: (-f['count'], -f['calories'], f['name']))
+    return ranked[:TOP_FOODS_LIMIT]
+
+
+def _rebuild_weekly_rollups(weeks):
+    """Recompute WeeklyRollup rows for {(user_id, week_start)} from compacted DailyTotals."""
+    from .models import DailyTotals, WeeklyRollup
+
+    if not weeks:
+        return
+    first = min(w for _, w in weeks)
+    last = max(w for _, w in weeks) + timedelta(days=6)
+    days = DailyTotals.objects.filter(
+        user_id__in={u for u, _ in weeks}, compacted=True, date__gte=first, date__lte=last,
+    )
+
+    grouped = defaultdict(list)
+    for day in days:
+        key = (day.user_id, _week_start(day.date))
+        if key in weeks:
+            grouped[key].append(day)
+
+    for (user_id, week_start), rows in grouped.items():
+        defaults = {n: sum(getattr(r, n) for r in rows) for n in _NUTRIENTS}
+        defaults.update(
+            item_count=sum(r.item_count for r in rows),
+            day_count=len(rows),
+            top_foods=_merge_top_foods(*(r.top_foods for r in rows)),
+        )
+        WeeklyRollup.objects.update_or_create(user_id=user_id, week_start=week_start, defaults=defaults)
+
+
+def compact_old_entries(keep_days=None):
+    """
+    Roll FoodEntry rows older than `keep_days` (FOOD_RETENTION_DAYS by default) up
+    into their DailyTotals row (marked compacted, with top foods) and WeeklyRollup,
+    then delete them. Returns the number of entries deleted.
+    """
+    from django.conf import settings
+    from django.db import transaction
+    from django.db.models import Count, Sum
+    from .models import DailyTotals, FoodEntry
+    from .unit_of_work import defer, defer_backup
+
+    if keep_days is None:
+        keep_days = getattr(settings, 'FOOD_RETENTION_DAYS', 7)
+    cutoff = _today_date() - timedelta(days=keep_days)
+    old = FoodEntry.objects.filter(date__lt=cutoff)
+
+    with transaction.atomic():
+        day_rows = {
+            (r['user_id'], r['date']): r
+            for r in old.values('user_id', 'date').annotate(
+                calories=Sum('calories'), protein=Sum('protein'), carbs=Sum('carbs'), fat=Sum('fat'),
+                item_count=Count('id'),
+            ).order_by()
+        }
+        if not day_rows:
+            return 0
+
+        foods = defaultdict(list)
+        for r in old.values('user_id', 'date', 'name').annotate(
+            count=Count('id'), calories=Sum('calories'),
+        ).order_by():
+            foods[(r['user_id'], r['date'])].append(
+                {'name': r['name'], 'count': r['count'], 'calories': r['calories'] or 0}
+            )
+
+        user_ids = {u for u, _ in day_rows}
+        existing = {
+            (t.user_id, t.date): t
+            for t in DailyTotals.objects.filter(
+                user_id__in=user_ids, date__gte=min(d for _, d in day_rows), date__lt=cutoff,
+            )
+        }
+
+        to_create, to_update = [], []
+        for key, r in day_rows.items():
+            top = _merge_top_foods(foods[key])
+            row = existing.get(key)
+            if row is None:
+                row = DailyTotals(user_id=key[0], date=key[1])
+                to_create.append(row)
+            else:
+                to_update.append(row)
+            if row.compacted:
+                # Late entries for an already-compacted day were added to its totals on write
+                row.top_foods = _merge_top_foods(row.top_foods, top)
+            else:
+                for n in _NUTRIENTS:
+                    setattr(row, n, r[n] or 0)
+                row.item_count = r['item_count']
+                row.top_foods = top
+            row.compacted = True
+
+        DailyTotals.objects.bulk_create(to_create)
+        DailyTotals.objects.bulk_update(to_update, [*_NUTRIENTS, 'item_count', 'top_foods', 'compacted'])
+        _rebuild_weekly_rollups({(u, _week_start(d)) for u, d in day_rows})
+        deleted, _ = old.delete()
+
+    for user_id in user_ids:
+        defer(('log-version', user_id), partial(_bump_log_version, user_id))
+    defer_backup('dietary')
+
+    logger.info(f"Compacted {deleted} food entries before {cutoff} into {len(day_rows)} daily rollups")
+    return deleted
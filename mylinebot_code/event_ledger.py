@@ -0,0 +1,122 @@
+"""
+Idempotency ledger for LINE webhook events.
+
+LINE redelivers a webhook when our response is slow, and each redelivery
+would otherwise repeat the AI call and insert duplicate food entries.
+Handlers wrapped in once_per_event() first claim the event's webhookEventId
+by inserting a ProcessedWebhookEvent row; the unique constraint makes the
+claim atomic across workers, and a losing claim skips the event before any
+AI or DB work. Rows older than WEBHOOK_EVENT_TTL are purged periodically.
+"""
+import functools
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EVENT_TTL = float(getattr(settings, 'WEBHOOK_EVENT_TTL', 24 * 3600))
+# Seconds between opportunistic purges of expired ledger rows (per process)
+PURGE_INTERVAL = 3600
+
+_lock = threading.Lock()
+_last_purge = 0.0
+_stats = {
+    'claimed': 0,
+    'duplicates': 0,
+    'released': 0,
+    'purged': 0,
+}
+
+
+def claim_event(event_id):
+    """Record event_id as being handled. Returns False if it was already claimed."""
+    from django.db import IntegrityError, transaction
+    from django.utils import timezone
+    from .models import ProcessedWebhookEvent
+
+    try:
+        with transaction.atomic():
+            ProcessedWebhookEvent.objects.create(event_id=event_id, received_at=timezone.now())
+    except IntegrityError:
+        _stats['duplicates'] += 1
+        return False
+
+    _stats['claimed'] += 1
+    _maybe_purge()
+    return True
+
+
+def release_event(event_id):
+    """Forget a claim so a redelivery of the event is handled again."""
+    from .models import ProcessedWebhookEvent
+
+    ProcessedWebhookEvent.objects.filter(event_id=event_id).delete()
+    _stats['released'] += 1
+
+
+def purge_expired():
+    """Delete ledger rows older than EVENT_TTL. Returns the number deleted."""
+    from django.utils import timezone
+    from .models import ProcessedWebhookEvent
+
+    cutoff = timezone.now() - timedelta(seconds=EVENT_TTL)
+    deleted, _ = ProcessedWebhookEvent.objects.filter(received_at__lt=cutoff).delete()
+    _stats['purged'] += deleted
+    return deleted
+
+
+def _maybe_purge():
+    global _last_purge
+
+    with _lock:
+        if time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return
+        _last_purge = time.monotonic()
+    try:
+        purge_expired()
+    except Exception as e:
+        logger.warning(f"Failed to purge webhook event ledger: {e}")
+
+
+def once_per_event(fn):
+    """
+    Decorator for webhook handlers: run fn(event) only for the first delivery
+    of each webhookEventId. If fn raises before committing any write, the claim
+    is released so LINE's redelivery gets another try; once a write committed,
+    the claim is kept so a redelivery can't repeat it. Events without an id are
+    always handled.
+    """
+    from .unit_of_work import committed_writes
+
+    @functools.wraps(fn)
+    def wrapper(event, *args, **kwargs):
+        event_id = getattr(event, 'webhook_event_id', None)
+        if not event_id:
+            return fn(event, *args, **kwargs)
+
+        if not claim_event(event_id):
+            delivery = getattr(event, 'delivery_context', None)
+            redelivery = getattr(delivery, 'is_redelivery', None)
+            logger.info(f"Skipping duplicate webhook event {event_id} (redelivery={redelivery})")
+            return None
+
+        writes = committed_writes()
+        try:
+            return fn(event, *args, **kwargs)
+        except Exception:
+            if committed_writes() == writes:
+                release_event(event_id)
+            else:
+                logger.warning(f"Webhook event {event_id} failed after committing writes, keeping its claim")
+            raise
+
+    return wrapper
+
+
+def stats():
+    """Return process-local ledger counters."""
+    return dict(_stats)
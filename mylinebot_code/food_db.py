@@ -0,0 +1,274 @@
+"""
+Offline nutrition database for common Taiwanese foods.
+
+The bundled CSV (data/tw_foods.csv: name, |-separated aliases, serving and
+per-serving calories/protein/carbs/fat) is compiled into a compact binary
+index that is memory-mapped, so every gunicorn worker shares the same pages
+and nothing is parsed per process. lookup() finds candidate names through a
+character-bigram index and answers only when the normalised description equals
+a name or alias: near-identical names are often different foods (雞排便當 vs
+雞腿便當), so anything else is left to the LLM. It scales the serving when the
+quantity uses the same unit ("2碗滷肉飯", "半碗"), and keeps the user's wording
+as the entry name.
+
+ai_api answers foods found here without calling any provider. The index is
+(re)built automatically when missing or older than the CSV; build_food_index
+prebuilds it at deploy time.
+
+Index layout (little-endian):
+    header    '<4sIIII'  magic, foods, names, grams, postings
+    foods     '<4fII'    calories, protein, carbs, fat, name offset, serving offset
+    names     '<II'      food id, text offset
+    grams     '<III'     bigram hash (sorted), first posting, posting count
+    postings  '<I'       name id
+    strings   '<H' byte length + UTF-8, addressed by offset from the section start
+"""
+import csv
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .nutrition_cache import normalize
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = str(getattr(settings, 'FOOD_DB_PATH', os.path.join(os.path.dirname(__file__), 'data', 'tw_foods.csv')))
+INDEX_PATH = str(getattr(settings, 'FOOD_DB_INDEX_PATH', os.path.join(os.path.dirname(__file__), 'data', 'tw_foods.idx')))
+
+_MAGIC = b'FDB1'
+_HEADER = struct.Struct('<4sIIII')
+_FOOD = struct.Struct('<4fII')
+_NAME = struct.Struct('<II')
+_GRAM = struct.Struct('<III')
+_POSTING = struct.Struct('<I')
+_STRLEN = struct.Struct('<H')
+
+_NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+
+# "2碗", "0.5 杯", "150g" at the start of a normalised description
+_QUANTITY = re.compile(r'^(\d+(?:\.\d+)?)\s*(ml|g|[^\d\s.a-z])')
+# "~250g" / "400ml" anywhere in a serving
+_WEIGHT = re.compile(r'(\d+(?:\.\d+)?)\s*(ml|g)\b')
+# Item separators in free text ("蛋餅、奶茶", "飯+湯"); normalize() already turned 、; into commas.
+# Only punctuation: 和/跟/and also occur inside food names (和牛, fish and chips)
+_ITEM_SEPARATORS = re.compile(r'\s*[,，+＋/]\s*')
+
+_lock = threading.Lock()
+_index = None
+_stats = {'hits': 0, 'misses': 0, 'total_us': 0.0}
+
+
+def _grams(text):
+    """Character bigrams of text padded with start/end markers."""
+    padded = f'\x02{text}\x03'
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _gram_hash(gram):
+    return zlib.crc32(gram.encode('utf-8'))
+
+
+# ── Build ─────────────────────────────────────────────────────────────────────
+
+def build_index(data_path=DATA_PATH, index_path=INDEX_PATH):
+    """Compile the CSV into the binary index (written atomically). Returns the number of foods."""
+    strings = bytearray()
+
+    def add_string(text):
+        offset = len(strings)
+        raw = text.encode('utf-8')
+        strings.extend(_STRLEN.pack(len(raw)))
+        strings.extend(raw)
+        return offset
+
+    foods, names = [], []
+    postings = defaultdict(set)
+    with open(data_path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            food_id = len(foods)
+            foods.append(_FOOD.pack(
+                *(float(row[n]) for n in _NUTRIENTS),
+                add_string(row['name'].strip()), add_string(row['serving'].strip()),
+            ))
+            aliases = [a for a in (row.get('aliases') or '').split('|') if a.strip()]
+            for alias in {normalize(n) for n in [row['name'], *aliases]} - {''}:
+                name_id = len(names)
+                names.append(_NAME.pack(food_id, add_string(alias)))
+                for gram in _grams(alias):
+                    postings[_gram_hash(gram)].add(name_id)
+
+    grams, posting_list = [], []
+    for gram_hash in sorted(postings):
+        ids = sorted(postings[gram_hash])
+        grams.append(_GRAM.pack(gram_hash, len(posting_list), len(ids)))
+        posting_list.extend(ids)
+
+    body = b''.join([
+        _HEADER.pack(_MAGIC, len(foods), len(names), len(grams), len(posting_list)),
+        *foods, *names, *grams,
+        *(_POSTING.pack(i) for i in posting_list),
+        bytes(strings),
+    ])
+    directory = os.path.dirname(os.path.abspath(index_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.food_db.')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Built food index: {len(foods)} foods, {len(names)} names, {len(body) // 1024} KB")
+    return len(foods)
+
+
+# ── Memory-mapped index ───────────────────────────────────────────────────────
+
+class _Index:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_foods, self.n_names, self.n_grams, n_postings = _HEADER.unpack_from(self.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a food index")
+        self.foods_at = _HEADER.size
+        self.names_at = self.foods_at + self.n_foods * _FOOD.size
+        self.grams_at = self.names_at + self.n_names * _NAME.size
+        self.postings_at = self.grams_at + self.n_grams * _GRAM.size
+        self.strings_at = self.postings_at + n_postings * _POSTING.size
+
+    def string(self, offset):
+        start = self.strings_at + offset
+        (length,) = _STRLEN.unpack_from(self.buf, start)
+        return self.buf[start + _STRLEN.size:start + _STRLEN.size + length].decode('utf-8')
+
+    def food(self, food_id):
+        *nutrients, name_off, serving_off = _FOOD.unpack_from(self.buf, self.foods_at + food_id * _FOOD.size)
+        return self.string(name_off), self.string(serving_off), nutrients
+
+    def name(self, name_id):
+        food_id, text_off = _NAME.unpack_from(self.buf, self.names_at + name_id * _NAME.size)
+        return food_id, self.string(text_off)
+
+    def postings(self, gram_hash):
+        """Name ids containing a bigram (binary search over the sorted gram table)."""
+        lo, hi = 0, self.n_grams
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value, start, count = _GRAM.unpack_from(self.buf, self.grams_at + mid * _GRAM.size)
+            if value < gram_hash:
+                lo = mid + 1
+            elif value > gram_hash:
+                hi = mid
+            else:
+                at = self.postings_at + start * _POSTING.size
+                return struct.unpack_from(f'<{count}I', self.buf, at)
+        return ()
+
+    def match(self, query):
+        """Return the food id whose name or alias equals query, or None."""
+        query_grams = _grams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings(_gram_hash(gram)))
+
+        # An equal name contains every bigram of the query, markers included
+        for name_id, count in shared.items():
+            if count == len(query_grams):
+                food_id, text = self.name(name_id)
+                if text == query:
+                    return food_id
+        return None
+
+
+def _get_index():
+    global _index
+
+    if _index is not None:
+        return _index
+    with _lock:
+        if _index is None:
+            stale = not os.path.exists(INDEX_PATH) or os.path.getmtime(INDEX_PATH) < os.path.getmtime(DATA_PATH)
+            if stale:
+                build_index()
+            _index = _Index(INDEX_PATH)
+    return _index
+
+
+# ── Lookup ────────────────────────────────────────────────────────────────────
+
+def _serving_units(serving):
+    """Amount of a serving per unit, e.g. '10顆 ~250g' → {'顆': 10.0, 'g': 250.0}."""
+    units = {unit: float(amount) for amount, unit in _WEIGHT.findall(serving)}
+    match = _QUANTITY.match(serving)
+    if match:
+        units[match.group(2)] = float(match.group(1))
+    return units
+
+
+def lookup(text):
+    """
+    Nutrition for one food description from the local DB, or None unless it names
+    a known food exactly. Returns {name, description, calories, protein, carbs, fat, basis}
+    with the user's food name and quantity as name and description.
+    """
+    started = time.perf_counter()
+    result = _lookup(normalize(text))
+    _stats['hits' if result else 'misses'] += 1
+    _stats['total_us'] += (time.perf_counter() - started) * 1e6
+    return result
+
+
+def _lookup(query):
+    if not query:
+        return None
+    scale, amount, description = 1.0, None, ''
+    quantity = _QUANTITY.match(query)
+    if quantity:
+        amount = (float(quantity.group(1)), quantity.group(2))
+        description = quantity.group().replace(' ', '')
+        query = query[quantity.end():].lstrip()
+
+    try:
+        food_id = _get_index().match(query)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Food index unavailable: {e}")
+        return None
+    if food_id is None:
+        return None
+
+    name, serving, nutrients = _get_index().food(food_id)
+    if amount is not None:
+        per_serving = _serving_units(serving).get(amount[1])
+        if not per_serving:
+            return None  # "2盤" of something served by the bowl: leave it to the LLM
+        scale = amount[0] / per_serving
+
+    portion = serving if scale == 1 else f"{serving} ×{scale:g}"
+    return {
+        'name': query,
+        'description': description,
+        **{n: round(v * scale, 1) for n, v in zip(_NUTRIENTS, nutrients)},
+        'basis': f"{name} {portion}（本地營養資料庫）",
+    }
+
+
+def split_items(text):
+    """Split a free-text meal description into item strings (normalised)."""
+    return [item for item in _ITEM_SEPARATORS.split(normalize(text)) if item]
+
+
+def stats():
+    """Return process-local lookup counters, hit rate and mean lookup time in microseconds."""
+    lookups = _stats['hits'] + _stats['misses']
+    return {
+        'hits': _stats['hits'],
+        'misses': _stats['misses'],
+        'hit_rate': round(_stats['hits'] / lookups, 3) if lookups else None,
+        'avg_us': round(_stats['total_us'] / lookups, 1) if lookups else None,
+    }
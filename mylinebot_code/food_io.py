@@ -0,0 +1,239 @@
+"""
+Streaming bulk export/import of food logs as CSV or NDJSON.
+
+Export walks FoodEntry rows with a chunked queryset iterator and yields text
+chunks, so a StreamingHttpResponse never holds a whole log in memory.
+Import reads its input line by line, validates rows into batches and inserts
+each batch with bulk_create inside one transaction; memory stays bounded by
+the batch size however large the file is.
+"""
+import codecs
+import csv
+import json
+import logging
+import math
+import tempfile
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+EXPORT_FIELDS = ('date', 'name', 'description', 'calories', 'protein', 'carbs', 'fat', 'basis', 'added_at')
+EXPORT_CHUNK_SIZE = 2000   # rows fetched per DB round trip
+EXPORT_BUFFER_SIZE = 64 * 1024  # characters per yielded chunk
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 20  # further invalid rows are only counted
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+_SPOOL_MEMORY_BYTES = 1024 * 1024
+
+_NUMERIC_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+_TEXT_LIMITS = {'name': 200, 'description': 500, 'basis': 200}
+
+
+class ImportFormatError(ValueError):
+    """The input can't be read as the requested format at all; nothing was imported."""
+
+
+# ── Export ─────────────────────────────────────────────────────────────────────
+
+class _Echo:
+    """Pseudo-buffer whose write() hands the value back, so csv.writer can stream."""
+
+    def write(self, value):
+        return value
+
+
+def _export_records(user_id, start=None, end=None):
+    """Yield one dict per FoodEntry (oldest first), fetched in chunks."""
+    from .dietary_storage import TW_TZ
+    from .models import FoodEntry
+
+    entries = FoodEntry.objects.filter(user_id=user_id)
+    if start:
+        entries = entries.filter(date__gte=start)
+    if end:
+        entries = entries.filter(date__lte=end)
+
+    rows = entries.order_by('date', 'added_at').values_list(*EXPORT_FIELDS)
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        record = dict(zip(EXPORT_FIELDS, row))
+        record['date'] = record['date'].isoformat()
+        added_at = record['added_at']
+        record['added_at'] = added_at.astimezone(TW_TZ).strftime('%Y-%m-%dT%H:%M:%S') if added_at else ''
+        yield record
+
+
+def _buffered(lines):
+    """Join small text lines into chunks of about EXPORT_BUFFER_SIZE characters."""
+    buf, size = [], 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield ''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
+def iter_export(user_id, fmt='csv', start=None, end=None):
+    """
+    Yield a user's food log (raw entries in [start, end]) as CSV or NDJSON text chunks.
+    Days already compacted by retention only exist as rollups and aren't exported.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}")
+
+    records = _export_records(user_id, start, end)
+    if fmt == 'ndjson':
+        lines = (json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+    else:
+        writer = csv.writer(_Echo())
+        header = (writer.writerow(EXPORT_FIELDS),)
+        rows = (writer.writerow(['' if r[f] is None else r[f] for f in EXPORT_FIELDS]) for r in records)
+        lines = (line for part in (header, rows) for line in part)
+    return _buffered(lines)
+
+
+# ── Import ─────────────────────────────────────────────────────────────────────
+
+def spool_upload(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Copy an upload stream (e.g. the request) to a spooled temp file and return it rewound.
+    Lets the import transaction run at disk speed instead of holding the SQLite write
+    lock while a slow client uploads. Raises ImportFormatError past max_bytes.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MEMORY_BYTES)
+    copied = 0
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        copied += len(chunk)
+        if copied > max_bytes:
+            spooled.close()
+            raise ImportFormatError(f"Upload larger than {max_bytes // (1024 * 1024)} MB")
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def _records(stream, fmt):
+    """Yield (line_no, raw record) from a binary line stream; CSV rows as dicts, NDJSON as text."""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+
+    if fmt == 'ndjson':
+        for line_no, line in enumerate(lines, 1):
+            if line.strip():
+                yield line_no, line
+        return
+
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or not {'date', 'name'} <= {f.strip() for f in reader.fieldnames}:
+        raise ImportFormatError("CSV header must include at least 'date' and 'name' columns")
+    reader.fieldnames = [f.strip() for f in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _parse_record(user_id, raw, today):
+    """Validate one raw record into an unsaved FoodEntry, or raise ValueError saying why."""
+    from .models import FoodEntry
+
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise ValueError("not valid JSON")
+    if not isinstance(raw, dict):
+        raise ValueError("expected an object with date and name")
+
+    try:
+        day = date.fromisoformat(str(raw.get('date') or '').strip())
+    except ValueError:
+        raise ValueError(f"invalid date {raw.get('date')!r} (expected YYYY-MM-DD)")
+    if day > today:
+        raise ValueError(f"date {day.isoformat()} is in the future")
+
+    values = {}
+    for field, limit in _TEXT_LIMITS.items():
+        text = str(raw.get(field) or '').strip()
+        if len(text) > limit:
+            raise ValueError(f"{field} is longer than {limit} characters")
+        values[field] = text
+    if not values['name']:
+        raise ValueError("missing name")
+
+    for field in _NUMERIC_FIELDS:
+        value = raw.get(field)
+        if value is None or value == '':
+            values[field] = None
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} is not a number: {value!r}")
+        if not math.isfinite(number) or number < 0:
+            raise ValueError(f"{field} must be a non-negative number")
+        values[field] = number
+
+    return FoodEntry(user_id=user_id, date=day, **values)
+
+
+def import_entries(user_id, stream, fmt='csv', batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Import food entries for one user from a binary stream of CSV or NDJSON lines.
+
+    Rows are validated as they are read; invalid rows are skipped and reported
+    (up to MAX_REPORTED_ERRORS). Valid rows are inserted batch_size at a time,
+    all inside one transaction. progress(imported, skipped) is called after
+    each batch. Imported entries get the import time as added_at.
+
+    Returns {'imported', 'skipped', 'errors': [{'line', 'error'}]}.
+    Raises ImportFormatError (and imports nothing) if the input is unreadable.
+    """
+    from django.db import transaction
+    from .dietary_storage import TW_TZ, bulk_insert_entries
+
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unsupported import format {fmt!r}")
+
+    today = datetime.now(TW_TZ).date()
+    imported = skipped = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal imported
+        imported += bulk_insert_entries(user_id, batch)
+        batch.clear()
+        if progress:
+            progress(imported, skipped)
+
+    try:
+        with transaction.atomic():
+            for line_no, raw in _records(stream, fmt):
+                try:
+                    batch.append(_parse_record(user_id, raw, today))
+                except ValueError as e:
+                    skipped += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({'line': line_no, 'error': str(e)})
+                    continue
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+    except UnicodeDecodeError:
+        raise ImportFormatError("File is not UTF-8 text")
+    except csv.Error as e:
+        raise ImportFormatError(f"Malformed CSV: {e}")
+
+    logger.info(f"Imported {imported} food entries for {user_id} ({skipped} skipped)")
+    return {'imported': imported, 'skipped': skipped, 'errors': errors}
@@ -1,17 +1,24 @@
 """
 Google Gemini API client for nutrition estimation.
 Tries multiple models with automatic fallback on rate limit / quota errors.
+
+The a*() functions are coroutines on the shared ai_http session; the plain
+names are blocking wrappers for sync callers.
 """
+import asyncio
 import base64
 import json
 import logging
 import os
+import time
+from functools import partial
 
-import requests
+import aiohttp
 
+from . import ai_http, ai_schemas, circuit_breaker, model_scoreboard
 from .ai_prompts import (
     nutrition_prompt, image_nutrition_prompt, parse_foods_prompt,
-    modify_food_prompt, diet_advice_prompt,
+    parse_foods_batch_prompt, modify_food_prompt, diet_advice_prompt,
 )
 
 logger = logging.getLogger(__name__)
@@ -27,60 +34,106 @@ GEMINI_MODELS = [
 ]
 
 # HTTP status codes that trigger fallback to next model
-_RETRYABLE_STATUS_CODES = {429, 500, 503, 403}
+_RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 403}
+
 
+def _status_error(response, model):
+    return aiohttp.ClientResponseError(
+        response.request_info, response.history,
+        status=response.status, message=f"{response.status} for model {model}", headers=response.headers,
+    )
 
-def _gemini_request(payload, timeout=15):
+
+async def _gemini_request(payload, timeout=15, task='text', parse=None):
     """
-    Send a request to Gemini API, trying each model in GEMINI_MODELS until one succeeds.
-    Returns the parsed JSON response data, or raises the last exception on total failure.
+    Send a request to Gemini API, trying models best-ranked first until one succeeds.
+    If parse is given it is applied to the response JSON, and a model whose answer
+    can't be parsed counts as failed and the next model is tried.
+    Returns the parsed result (or raw JSON), or raises the last exception on total failure.
     """
+    session = await ai_http.session()
     last_error = None
-    for model in GEMINI_MODELS:
+    for model in model_scoreboard.rank('gemini', task, GEMINI_MODELS):
+        if not await circuit_breaker.aallow('gemini', model):
+            logger.info(f"Gemini model {model} circuit open, skipping")
+            continue
         url = f'{GEMINI_BASE_URL}/{model}:generateContent'
+        started = time.monotonic()
         try:
-            response = requests.post(
+            async with session.post(
                 url,
                 params={'key': GEMINI_API_KEY},
                 json=payload,
-                timeout=timeout,
-            )
-            if response.status_code in _RETRYABLE_STATUS_CODES:
-                logger.warning(f"Gemini model {model} returned {response.status_code}, trying next model")
-                last_error = requests.exceptions.HTTPError(
-                    f"{response.status_code} for model {model}", response=response
-                )
-                continue
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout as e:
+                timeout=ai_http.timeout(timeout),
+            ) as response:
+                if response.status in _RETRYABLE_STATUS_CODES:
+                    logger.warning(f"Gemini model {model} returned {response.status}, trying next model")
+                    await circuit_breaker.arecord_failure('gemini', model, response.status, response.headers.get('Retry-After'))
+                    model_scoreboard.record('gemini', task, model, ok=False)
+                    last_error = _status_error(response, model)
+                    continue
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            await circuit_breaker.arecord_success('gemini', model)
+            latency = time.monotonic() - started
+        except asyncio.TimeoutError as e:
             logger.warning(f"Gemini model {model} timed out, trying next model")
+            await circuit_breaker.arecord_failure('gemini', model)
+            model_scoreboard.record('gemini', task, model, ok=False)
             last_error = e
             continue
-        except requests.exceptions.HTTPError:
+        except aiohttp.ClientResponseError:
             raise
+        except aiohttp.ClientConnectionError as e:
+            logger.warning(f"Gemini model {model} unreachable: {e}, trying next model")
+            await circuit_breaker.arecord_failure('gemini', model)
+            model_scoreboard.record('gemini', task, model, ok=False)
+            last_error = e
+            continue
         except Exception as e:
             logger.warning(f"Gemini model {model} failed: {e}, trying next model")
             last_error = e
             continue
+
+        if parse is None:
+            model_scoreboard.record('gemini', task, model, ok=True, latency=latency)
+            return data
+        try:
+            result = parse(data)
+        except Exception as e:
+            logger.warning(f"Gemini model {model} returned an unusable answer: {e}, trying next model")
+            model_scoreboard.record('gemini', task, model, ok=True, latency=latency, parsed=False)
+            last_error = e
+            continue
+        model_scoreboard.record('gemini', task, model, ok=True, latency=latency)
+        return result
+    if last_error is None:
+        raise circuit_breaker.CircuitOpenError("All Gemini models are circuit-open")
     raise last_error
 
 
-def _parse_gemini_json(data):
-    """Extract and parse JSON from Gemini response text."""
-    text = data['candidates'][0]['content']['parts'][0]['text']
-    text = text.strip()
-    if text.startswith('```'):
-        text = text.split('\n', 1)[1] if '\n' in text else text[3:]
-    if text.endswith('```'):
-        text = text[:-3]
-    text = text.strip()
-    if text.startswith('json'):
-        text = text[4:].strip()
-    return json.loads(text)
+def _gemini_text(data):
+    """Extract the answer text from a Gemini response."""
+    return data['candidates'][0]['content']['parts'][0]['text'].strip()
+
 
+def _json_request(prompt_parts, kind):
+    """Gemini payload asking for JSON that matches the schema for `kind`."""
+    return {
+        'contents': [{'parts': prompt_parts}],
+        'generationConfig': {
+            'responseMimeType': 'application/json',
+            'responseSchema': ai_schemas.gemini_schema(kind),
+        },
+    }
 
-def estimate_nutrition(food_name, description=''):
+
+def _parse_answer(kind, data):
+    """Parse a Gemini response into the schema for `kind` (raises ai_schemas.SchemaError)."""
+    return ai_schemas.parse(kind, _gemini_text(data))
+
+
+async def aestimate_nutrition(food_name, description=''):
     """
     Call Gemini API to estimate nutrition for a food item.
     Returns dict with keys: calories, protein, carbs, fat.
@@ -97,21 +150,16 @@ def estimate_nutrition(food_name, description=''):
     prompt = nutrition_prompt(food_desc)
 
     try:
-        data = _gemini_request({'contents': [{'parts': [{'text': prompt}]}]}, timeout=15)
-        result = _parse_gemini_json(data)
-        return {
-            'calories': float(result.get('calories', 0)),
-            'protein': float(result.get('protein', 0)),
-            'carbs': float(result.get('carbs', 0)),
-            'fat': float(result.get('fat', 0)),
-            'basis': result.get('basis', ''),
-        }
+        return await _gemini_request(
+            _json_request([{'text': prompt}], ai_schemas.NUTRITION), timeout=15,
+            parse=partial(_parse_answer, ai_schemas.NUTRITION),
+        )
     except Exception as e:
         logger.error(f"Gemini API error for '{food_desc}': {e}")
         return {'calories': None, 'protein': None, 'carbs': None, 'fat': None, 'basis': ''}
 
 
-def estimate_nutrition_from_image(image_bytes, mime_type):
+async def aestimate_nutrition_from_image(image_bytes, mime_type):
     """
     Call Gemini API to estimate nutrition from a food photo.
     Returns dict with keys: food_name, calories, protein, carbs, fat, basis.
@@ -125,30 +173,19 @@ def estimate_nutrition_from_image(image_bytes, mime_type):
     prompt = image_nutrition_prompt()
 
     try:
-        payload = {
-            'contents': [{
-                'parts': [
-                    {'inline_data': {'mime_type': mime_type, 'data': image_b64}},
-                    {'text': prompt},
-                ]
-            }]
-        }
-        data = _gemini_request(payload, timeout=30)
-        result = _parse_gemini_json(data)
-        return {
-            'food_name': result.get('food_name'),
-            'calories': float(result.get('calories', 0)),
-            'protein': float(result.get('protein', 0)),
-            'carbs': float(result.get('carbs', 0)),
-            'fat': float(result.get('fat', 0)),
-            'basis': result.get('basis', ''),
-        }
+        payload = _json_request([
+            {'inline_data': {'mime_type': mime_type, 'data': image_b64}},
+            {'text': prompt},
+        ], ai_schemas.PHOTO)
+        return await _gemini_request(
+            payload, timeout=30, task='image', parse=partial(_parse_answer, ai_schemas.PHOTO),
+        )
     except Exception as e:
         logger.error(f"Gemini API image error: {e}")
         return {'food_name': None, 'calories': None, 'protein': None, 'carbs': None, 'fat': None, 'basis': ''}
 
 
-def parse_and_estimate_foods(text):
+async def aparse_and_estimate_foods(text):
     """
     Parse free-form text describing one or more foods and estimate nutrition for each.
     Returns a list of dicts, each with keys: name, calories, protein, carbs, fat, basis.
@@ -161,28 +198,39 @@ def parse_and_estimate_foods(text):
     prompt = parse_foods_prompt(text)
 
     try:
-        data = _gemini_request({'contents': [{'parts': [{'text': prompt}]}]}, timeout=15)
-        result = _parse_gemini_json(data)
-        if isinstance(result, dict):
-            result = [result]
-        foods = []
-        for item in result:
-            foods.append({
-                'name': item.get('name', ''),
-                'description': item.get('description', ''),
-                'calories': float(item.get('calories', 0)),
-                'protein': float(item.get('protein', 0)),
-                'carbs': float(item.get('carbs', 0)),
-                'fat': float(item.get('fat', 0)),
-                'basis': item.get('basis', ''),
-            })
-        return foods if foods else None
+        return await _gemini_request(
+            _json_request([{'text': prompt}], ai_schemas.FOODS), timeout=15,
+            parse=partial(_parse_answer, ai_schemas.FOODS),
+        )
     except Exception as e:
         logger.error(f"Gemini API error for parse_and_estimate_foods: {e}")
         return None
 
 
-def modify_food_estimation(original_food, modification):
+async def aparse_and_estimate_foods_batch(texts):
+    """
+    Parse several meal descriptions in one request (used by ai_batcher).
+    Returns a list aligned with texts — each meal's food list, or None for a meal
+    the answer left out. Returns None on failure.
+    """
+    if not GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY not set, cannot parse foods")
+        return None
+
+    prompt = parse_foods_batch_prompt(texts)
+
+    try:
+        answer = await _gemini_request(
+            _json_request([{'text': prompt}], ai_schemas.FOODS_BATCH), timeout=30, task='batch',
+            parse=partial(_parse_answer, ai_schemas.FOODS_BATCH),
+        )
+    except Exception as e:
+        logger.error(f"Gemini API error for parse_and_estimate_foods_batch ({len(texts)} meals): {e}")
+        return None
+    return ai_schemas.unpack_batch(answer, len(texts))
+
+
+async def amodify_food_estimation(original_food, modification):
     """
     Re-estimate nutrition for an existing food entry based on user's modification.
     original_food: dict with keys name, description, calories, protein, carbs, fat, basis
@@ -205,30 +253,18 @@ def modify_food_estimation(original_food, modification):
     prompt = modify_food_prompt(original_desc, original_nutrition, original_food.get('basis', ''), modification)
 
     try:
-        data = _gemini_request({'contents': [{'parts': [{'text': prompt}]}]}, timeout=15)
-        result = _parse_gemini_json(data)
-        return {
-            'name': result.get('name', original_food['name']),
-            'description': result.get('description', ''),
-            'calories': float(result.get('calories', 0)),
-            'protein': float(result.get('protein', 0)),
-            'carbs': float(result.get('carbs', 0)),
-            'fat': float(result.get('fat', 0)),
-            'basis': result.get('basis', ''),
-        }
+        result = await _gemini_request(
+            _json_request([{'text': prompt}], ai_schemas.MODIFY), timeout=15,
+            parse=partial(_parse_answer, ai_schemas.MODIFY),
+        )
+        return {**result, 'name': result['name'] or original_food['name']}
     except Exception as e:
         logger.error(f"Gemini API error for modify_food_estimation: {e}")
         return None
 
 
-def generate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
-    """
-    Ask Gemini for dietary advice based on today's food log.
-    Returns advice string, or None on failure.
-    """
-    if not GEMINI_API_KEY:
-        return None
-
+def _advice_prompt(foods, tdee, user_prompt, goal):
+    """Build the diet-advice prompt from today's food log."""
     food_summary = []
     total_cal = 0
     for f in foods:
@@ -253,11 +289,113 @@ def generate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
     else:
         question = "Give brief dietary advice based on today's intake and the user's goal. What's missing? What should I eat next? Keep it concise (under 200 characters)."
 
-    prompt = diet_advice_prompt(food_list, total_cal, tdee_info, question)
+    return diet_advice_prompt(food_list, total_cal, tdee_info, question)
+
+
+async def agenerate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    """
+    Ask Gemini for dietary advice based on today's food log.
+    Returns advice string, or None on failure.
+    """
+    if not GEMINI_API_KEY:
+        return None
+
+    prompt = _advice_prompt(foods, tdee, user_prompt, goal)
 
     try:
-        data = _gemini_request({'contents': [{'parts': [{'text': prompt}]}]}, timeout=15)
-        return data['candidates'][0]['content']['parts'][0]['text'].strip()
+        return await _gemini_request(
+            {'contents': [{'parts': [{'text': prompt}]}]}, timeout=15, task='advice', parse=_gemini_text,
+        )
     except Exception as e:
         logger.error(f"Gemini diet advice error: {e}")
         return None
+
+
+
+def _stream_chunk_text(chunk):
+    """Text carried by one streamed Gemini chunk ('' for e.g. the final usage chunk)."""
+    candidates = chunk.get('candidates') or [{}]
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts)
+
+
+async def astream_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    """
+    Stream Gemini dietary advice as text chunks (streamGenerateContent over SSE).
+    Models are tried best-ranked first until one starts answering; an error
+    after text has been yielded is raised, since the caller already has a partial answer.
+    """
+    if not GEMINI_API_KEY:
+        return
+
+    payload = {'contents': [{'parts': [{'text': _advice_prompt(foods, tdee, user_prompt, goal)}]}]}
+    session = await ai_http.session()
+    last_error = None
+    for model in model_scoreboard.rank('gemini', 'advice_stream', GEMINI_MODELS):
+        if not await circuit_breaker.aallow('gemini', model):
+            logger.info(f"Gemini model {model} circuit open, skipping")
+            continue
+        url = f'{GEMINI_BASE_URL}/{model}:streamGenerateContent'
+        started = time.monotonic()
+        emitted = False
+        try:
+            async with session.post(
+                url,
+                params={'alt': 'sse', 'key': GEMINI_API_KEY},
+                json=payload,
+                timeout=ai_http.stream_timeout(15),
+            ) as response:
+                if response.status in _RETRYABLE_STATUS_CODES:
+                    logger.warning(f"Gemini model {model} returned {response.status}, trying next model")
+                    await circuit_breaker.arecord_failure('gemini', model, response.status, response.headers.get('Retry-After'))
+                    model_scoreboard.record('gemini', 'advice_stream', model, ok=False)
+                    last_error = _status_error(response, model)
+                    continue
+                response.raise_for_status()
+                await circuit_breaker.arecord_success('gemini', model)
+                async for data in ai_http.sse_data(response):
+                    text = _stream_chunk_text(json.loads(data))
+                    if not text:
+                        continue
+                    if not emitted:
+                        # Scored on time to first token, which is what streaming is for
+                        model_scoreboard.record(
+                            'gemini', 'advice_stream', model, ok=True, latency=time.monotonic() - started,
+                        )
+                        emitted = True
+                    yield text
+            if emitted:
+                return
+            model_scoreboard.record('gemini', 'advice_stream', model, ok=True, latency=time.monotonic() - started, parsed=False)
+            last_error = ValueError(f"Empty stream from model {model}")
+        except asyncio.TimeoutError as e:
+            if emitted:
+                raise
+            logger.warning(f"Gemini model {model} stream timed out, trying next model")
+            await circuit_breaker.arecord_failure('gemini', model)
+            model_scoreboard.record('gemini', 'advice_stream', model, ok=False)
+            last_error = e
+        except aiohttp.ClientResponseError:
+            raise
+        except aiohttp.ClientConnectionError as e:
+            if emitted:
+                raise
+            logger.warning(f"Gemini model {model} unreachable: {e}, trying next model")
+            await circuit_breaker.arecord_failure('gemini', model)
+            model_scoreboard.record('gemini', 'advice_stream', model, ok=False)
+            last_error = e
+        except Exception as e:
+            if emitted:
+                raise
+            logger.warning(f"Gemini model {model} stream failed: {e}, trying next model")
+            last_error = e
+    if last_error is None:
+        raise circuit_breaker.CircuitOpenError("All Gemini models are circuit-open")
+    raise last_error
+
+estimate_nutrition = ai_http.sync(aestimate_nutrition)
+estimate_nutrition_from_image = ai_http.sync(aestimate_nutrition_from_image)
+parse_and_estimate_foods = ai_http.sync(aparse_and_estimate_foods)
+parse_and_estimate_foods_batch = ai_http.sync(aparse_and_estimate_foods_batch)
+modify_food_estimation = ai_http.sync(amodify_food_estimation)
+generate_diet_advice = ai_http.sync(agenerate_diet_advice)
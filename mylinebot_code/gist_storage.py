@@ -5,6 +5,8 @@ Workaround for Render's ephemeral filesystem wiping SQLite DB.
 import json
 import logging
 import os
+import threading
+import time
 from datetime import date
 
 import requests
@@ -17,8 +19,171 @@ GIST_FILENAME = 'yoyo_articles.json'
 GIST_USERS_FILENAME = 'yoyo_authorized_users.json'
 GIST_TARGETS_FILENAME = 'yoyo_push_targets.json'
 GIST_DIETARY_FILENAME = 'yoyo_dietary_logs.json'
+GIST_ROLLUPS_FILENAME = 'yoyo_dietary_rollups.json'
 GIST_PROFILES_FILENAME = 'yoyo_user_profiles.json'
 
+# ── GitHub rate-limit accounting ──────────────────────────────────────────────
+# Every GitHub response carries X-RateLimit-* quota headers. We record them so
+# writes can be paced as the quota runs low and deferred (left in the backup
+# journal for a later pass) once only the reserve is left.
+
+# Writes are deferred when remaining quota drops to this many calls
+RATE_LIMIT_RESERVE = int(os.environ.get('GIST_RATE_LIMIT_RESERVE', '20'))
+# Writes start being spaced out when remaining quota drops below this
+RATE_LIMIT_SLOWDOWN = int(os.environ.get('GIST_RATE_LIMIT_SLOWDOWN', '200'))
+
+_MAX_RETRIES = 3
+_MAX_BACKOFF = 30  # seconds; anything longer is deferred instead of slept
+_RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_rate_lock = threading.Lock()
+_rate_limit = {
+    'limit': None,
+    'remaining': None,
+    'reset_at': None,
+    'deferred_writes': 0,
+    'retries': 0,
+    'last_write_at': 0.0,
+}
+
+
+class GistRateLimited(Exception):
+    """Raised instead of calling GitHub when a write must wait for the quota to reset."""
+
+
+def _record_rate_limit(response):
+    """Remember GitHub's quota headers from a response."""
+    headers = response.headers
+    with _rate_lock:
+        for header, key in (
+            ('X-RateLimit-Limit', 'limit'),
+            ('X-RateLimit-Remaining', 'remaining'),
+            ('X-RateLimit-Reset', 'reset_at'),
+        ):
+            if header in headers:
+                try:
+                    _rate_limit[key] = int(headers[header])
+                except ValueError:
+                    pass
+
+
+def _write_delay():
+    """
+    Seconds to wait before the next write so the remaining quota lasts until reset.
+    Raises GistRateLimited if the quota is at the reserve or the wait is too long.
+    """
+    with _rate_lock:
+        remaining = _rate_limit['remaining']
+        reset_at = _rate_limit['reset_at']
+        now = time.time()
+        if remaining is None or reset_at is None or reset_at <= now:
+            return 0
+
+        if remaining <= RATE_LIMIT_RESERVE:
+            _rate_limit['deferred_writes'] += 1
+            raise GistRateLimited(f"GitHub quota at {remaining}, deferring write until reset in {reset_at - now:.0f}s")
+
+        if remaining > RATE_LIMIT_SLOWDOWN:
+            return 0
+
+        spacing = (reset_at - now) / (remaining - RATE_LIMIT_RESERVE)
+        delay = max(0.0, _rate_limit['last_write_at'] + spacing - now)
+        if delay > _MAX_BACKOFF:
+            _rate_limit['deferred_writes'] += 1
+            raise GistRateLimited(f"GitHub quota at {remaining}, next write slot in {delay:.0f}s, deferring")
+        return delay
+
+
+def _backoff_seconds(response, attempt):
+    """
+    How long to wait before retrying `response`, or None if it isn't retryable.
+    Honours Retry-After and X-RateLimit-Reset, else exponential backoff.
+    """
+    status = response.status_code
+    headers = response.headers
+    rate_limited = status == 429 or (status == 403 and (
+        headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in headers
+    ))
+    if not rate_limited and status not in _RETRYABLE_STATUS_CODES:
+        return None
+
+    if 'Retry-After' in headers:
+        try:
+            return float(headers['Retry-After'])
+        except ValueError:
+            pass
+    if headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in headers:
+        try:
+            return max(0.0, int(headers['X-RateLimit-Reset']) - time.time())
+        except ValueError:
+            pass
+    return float(2 ** attempt)
+
+
+def _github_request(method, url, **kwargs):
+    """
+    Call the GitHub REST API with auth headers, recording rate-limit headers,
+    pacing writes as the quota runs low, and retrying 429/403-rate-limit/5xx
+    and network errors with backoff. Returns the final response.
+    """
+    is_write = method != 'GET'
+    if is_write:
+        delay = _write_delay()
+        if delay:
+            logger.info(f"GitHub quota running low, delaying write {delay:.1f}s")
+            time.sleep(delay)
+
+    headers = {
+        'Authorization': f'token {GITHUB_TOKEN}',
+        'Accept': 'application/vnd.github.v3+json',
+    }
+
+    for attempt in range(_MAX_RETRIES + 1):
+        try:
+            response = requests.request(method, url, headers=headers, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == _MAX_RETRIES:
+                raise
+            wait = float(2 ** attempt)
+            logger.warning(f"GitHub API {method} failed ({e}), retrying in {wait:.0f}s")
+            with _rate_lock:
+                _rate_limit['retries'] += 1
+            time.sleep(wait)
+            continue
+
+        _record_rate_limit(response)
+        if is_write:
+            with _rate_lock:
+                _rate_limit['last_write_at'] = time.time()
+
+        wait = _backoff_seconds(response, attempt)
+        if wait is None or attempt == _MAX_RETRIES:
+            return response
+
+        if wait > _MAX_BACKOFF:
+            if is_write:
+                with _rate_lock:
+                    _rate_limit['deferred_writes'] += 1
+            logger.warning(f"GitHub API returned {response.status_code}, retry would wait {wait:.0f}s, giving up for now")
+            return response
+
+        logger.warning(f"GitHub API returned {response.status_code}, retrying in {wait:.0f}s")
+        with _rate_lock:
+            _rate_limit['retries'] += 1
+        time.sleep(wait)
+
+    return response
+
+
+def rate_limit_stats():
+    """Return the last seen GitHub quota plus retry/deferral counters, for monitoring."""
+    with _rate_lock:
+        stats = dict(_rate_limit)
+    reset_at = stats.pop('reset_at')
+    stats.pop('last_write_at')
+    stats['reset_in_seconds'] = max(0, int(reset_at - time.time())) if reset_at else None
+    return stats
+
 
 def save_articles_to_gist():
     """Save all articles from DB to GitHub Gist."""
@@ -37,12 +202,9 @@ def save_articles_to_gist():
     content = json.dumps(articles, ensure_ascii=False, indent=2)
 
     try:
-        response = requests.patch(
+        response = _github_request(
+            'PATCH',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             json={
                 'files': {
                     GIST_FILENAME: {'content': content}
@@ -74,12 +236,9 @@ def load_articles_from_gist():
         return False
 
     try:
-        response = requests.get(
+        response = _github_request(
+            'GET',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             timeout=30
         )
         response.raise_for_status()
@@ -126,12 +285,9 @@ def save_users_to_gist():
     content = json.dumps(users, ensure_ascii=False, indent=2)
 
     try:
-        response = requests.patch(
+        response = _github_request(
+            'PATCH',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             json={
                 'files': {
                     GIST_USERS_FILENAME: {'content': content}
@@ -162,12 +318,9 @@ def load_users_from_gist():
         return False
 
     try:
-        response = requests.get(
+        response = _github_request(
+            'GET',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             timeout=30
         )
         response.raise_for_status()
@@ -208,12 +361,9 @@ def save_targets_to_gist():
     content = json.dumps(targets, ensure_ascii=False, indent=2)
 
     try:
-        response = requests.patch(
+        response = _github_request(
+            'PATCH',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             json={
                 'files': {
                     GIST_TARGETS_FILENAME: {'content': content}
@@ -244,12 +394,9 @@ def load_targets_from_gist():
         return False
 
     try:
-        response = requests.get(
+        response = _github_request(
+            'GET',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             timeout=30
         )
         response.raise_for_status()
@@ -279,16 +426,16 @@ def load_targets_from_gist():
 
 
 def save_dietary_to_gist():
-    """Save all FoodEntry + UserTdee records from DB to Gist as JSON backup."""
+    """
+    Save all FoodEntry + UserTdee records from DB to Gist as JSON backup, with the
+    compacted daily/weekly rollups in a separate file.
+    """
     if not GITHUB_TOKEN or not GIST_ID:
         logger.warning("Gist storage not configured (missing GITHUB_GIST_TOKEN or GIST_ID)")
         return False
 
     from collections import defaultdict
     from .models import FoodEntry, UserTdee
-    from .dietary_storage import prune_old_entries
-
-    prune_old_entries()
 
     # Build the same JSON structure as the old in-memory dict:
     # { "user_id": { "tdee": 2000, "2026-03-17": { "foods": [...] } } }
@@ -314,17 +461,16 @@ def save_dietary_to_gist():
         })
 
     content = json.dumps(dict(data), ensure_ascii=False, indent=2)
+    rollups_content = json.dumps(_rollups_snapshot(), ensure_ascii=False, indent=2)
 
     try:
-        response = requests.patch(
+        response = _github_request(
+            'PATCH',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             json={
                 'files': {
-                    GIST_DIETARY_FILENAME: {'content': content}
+                    GIST_DIETARY_FILENAME: {'content': content},
+                    GIST_ROLLUPS_FILENAME: {'content': rollups_content},
                 }
             },
             timeout=30
@@ -337,6 +483,38 @@ def save_dietary_to_gist():
         return False
 
 
+def _rollups_snapshot():
+    """
+    Build { "user_id": { "daily": { "2026-03-17": {...} }, "weekly": { "2026-03-16": {...} } } }
+    from compacted DailyTotals and WeeklyRollup rows.
+    """
+    from collections import defaultdict
+    from .models import DailyTotals, WeeklyRollup
+
+    nutrients = ('calories', 'protein', 'carbs', 'fat', 'item_count', 'top_foods')
+    data = defaultdict(lambda: {'daily': {}, 'weekly': {}})
+    for row in DailyTotals.objects.filter(compacted=True).order_by('date').values('user_id', 'date', *nutrients):
+        data[row.pop('user_id')]['daily'][row.pop('date').isoformat()] = row
+    for row in WeeklyRollup.objects.order_by('week_start').values('user_id', 'week_start', 'day_count', *nutrients):
+        data[row.pop('user_id')]['weekly'][row.pop('week_start').isoformat()] = row
+    return dict(data)
+
+
+def _restore_rollups(rollups_data):
+    """Recreate compacted DailyTotals and WeeklyRollup rows from a _rollups_snapshot() dict."""
+    from .models import DailyTotals, WeeklyRollup
+
+    daily, weekly = [], []
+    for user_id, user_data in rollups_data.items():
+        for key, row in user_data.get('daily', {}).items():
+            daily.append(DailyTotals(user_id=user_id, date=date.fromisoformat(key), compacted=True, **row))
+        for key, row in user_data.get('weekly', {}).items():
+            weekly.append(WeeklyRollup(user_id=user_id, week_start=date.fromisoformat(key), **row))
+    DailyTotals.objects.bulk_create(daily)
+    WeeklyRollup.objects.bulk_create(weekly)
+    return len(daily)
+
+
 def load_dietary_from_gist():
     """Load dietary logs from Gist into DB. Only restores if DB tables are empty."""
     if not GITHUB_TOKEN or not GIST_ID:
@@ -344,28 +522,25 @@ def load_dietary_from_gist():
         return False
 
     from django.db import connection
-    from .models import FoodEntry, UserTdee
+    from .models import DailyTotals, FoodEntry, UserTdee, WeeklyRollup
 
     # Check tables exist
     tables = connection.introspection.table_names()
-    for model in (FoodEntry, UserTdee):
+    for model in (FoodEntry, UserTdee, DailyTotals, WeeklyRollup):
         table_name = model._meta.db_table
         if table_name not in tables:
             logger.warning(f"Table '{table_name}' does not exist yet, skipping dietary Gist load")
             return False
 
     # Skip if DB already has data
-    if FoodEntry.objects.exists() or UserTdee.objects.exists():
+    if FoodEntry.objects.exists() or UserTdee.objects.exists() or WeeklyRollup.objects.exists():
         logger.info("DB already has dietary data, skipping Gist load")
         return True
 
     try:
-        response = requests.get(
+        response = _github_request(
+            'GET',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             timeout=30
         )
         response.raise_for_status()
@@ -373,6 +548,8 @@ def load_dietary_from_gist():
         gist_data = response.json()
         file_content = gist_data.get('files', {}).get(GIST_DIETARY_FILENAME, {}).get('content', '{}')
         dietary_data = json.loads(file_content)
+        rollups_content = gist_data.get('files', {}).get(GIST_ROLLUPS_FILENAME, {}).get('content', '{}')
+        rollups_data = json.loads(rollups_content)
 
         loaded_foods = 0
         loaded_tdee = 0
@@ -405,7 +582,16 @@ def load_dietary_from_gist():
                     )
                     loaded_foods += 1
 
-        logger.info(f"Loaded {loaded_foods} food entries and {loaded_tdee} TDEE settings from Gist into DB")
+        # Rollups first, so the rebuild below keeps the compacted days
+        loaded_rollups = _restore_rollups(rollups_data)
+
+        from .dietary_storage import rebuild_daily_totals
+        rebuild_daily_totals()
+
+        logger.info(
+            f"Loaded {loaded_foods} food entries, {loaded_rollups} daily rollups and "
+            f"{loaded_tdee} TDEE settings from Gist into DB"
+        )
         return True
     except Exception as e:
         logger.error(f"Failed to load dietary logs from Gist: {e}")
@@ -431,12 +617,9 @@ def save_profiles_to_gist():
     content = json.dumps(profiles, ensure_ascii=False, indent=2)
 
     try:
-        response = requests.patch(
+        response = _github_request(
+            'PATCH',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             json={
                 'files': {
                     GIST_PROFILES_FILENAME: {'content': content}
@@ -467,12 +650,9 @@ def load_profiles_from_gist():
         return False
 
     try:
-        response = requests.get(
+        response = _github_request(
+            'GET',
             f'https://api.github.com/gists/{GIST_ID}',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             timeout=30
         )
         response.raise_for_status()
@@ -521,12 +701,9 @@ def create_gist():
         return None
 
     try:
-        response = requests.post(
+        response = _github_request(
+            'POST',
             'https://api.github.com/gists',
-            headers={
-                'Authorization': f'token {GITHUB_TOKEN}',
-                'Accept': 'application/vnd.github.v3+json',
-            },
             json={
                 'description': 'YoYo English Bot - Article Storage',
                 'public': False,
@@ -0,0 +1,141 @@
+"""
+Pre-upload normalisation for food photos sent to vision models.
+
+Phone photos arrive as multi-megabyte, full-resolution JPEGs, and the
+providers base64-encode them (+33%). prepare_image() fixes EXIF orientation,
+downsizes to IMAGE_MAX_EDGE, drops all metadata and re-encodes at a tuned
+quality before upload. Decoding and resizing are CPU-bound, so the work runs
+in a small process pool instead of holding the GIL on the request thread.
+
+The pool uses the 'spawn' start method: gunicorn workers run background
+threads (e.g. the backup syncer), and forking a threaded process can
+deadlock. _process() therefore must not touch Django settings or models.
+"""
+import io
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    'images': 0,
+    'bytes_in': 0,
+    'bytes_out': 0,
+    'failures': 0,
+    'total_ms': 0.0,
+}
+
+
+def _config():
+    from django.conf import settings
+
+    return {
+        'max_edge': int(getattr(settings, 'IMAGE_MAX_EDGE', 1024)),
+        'format': str(getattr(settings, 'IMAGE_FORMAT', 'JPEG')).upper(),
+        'quality': int(getattr(settings, 'IMAGE_QUALITY', 82)),
+        'workers': int(getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2)),
+        'timeout': float(getattr(settings, 'IMAGE_PIPELINE_TIMEOUT', 15)),
+    }
+
+
+def _process(image_bytes, max_edge, fmt, quality):
+    """Runs in the pool: orient, shrink, strip metadata, re-encode. Returns the new bytes."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        out = io.BytesIO()
+        # No exif/icc_profile arguments, so no metadata is carried over
+        if fmt == 'JPEG':
+            img.save(out, format='JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            img.save(out, format='WEBP', quality=quality, method=4)
+        return out.getvalue()
+
+
+def _get_pool(workers):
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def prepare_image(image_bytes, mime_type):
+    """
+    Return (bytes, mime_type) ready for upload. Falls back to the original
+    image if processing fails or wouldn't make it smaller.
+    """
+    config = _config()
+    if config['format'] not in _MIME_TYPES:
+        logger.warning(f"Unsupported IMAGE_FORMAT {config['format']!r}, uploading original")
+        return image_bytes, mime_type
+
+    started = time.monotonic()
+    try:
+        future = _get_pool(config['workers']).submit(
+            _process, image_bytes, config['max_edge'], config['format'], config['quality'],
+        )
+        processed = future.result(timeout=config['timeout'])
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, uploading original: {e}")
+        with _stats_lock:
+            _stats['failures'] += 1
+        if isinstance(e, BrokenProcessPool):
+            _reset_pool()
+        return image_bytes, mime_type
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    if len(processed) >= len(image_bytes):
+        processed, out_mime = image_bytes, mime_type
+    else:
+        out_mime = _MIME_TYPES[config['format']]
+
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['bytes_in'] += len(image_bytes)
+        _stats['bytes_out'] += len(processed)
+        _stats['total_ms'] += elapsed_ms
+    logger.info(
+        f"Preprocessed photo {len(image_bytes) // 1024} KB → {len(processed) // 1024} KB in {elapsed_ms:.0f} ms"
+    )
+    return processed, out_mime
+
+
+def stats():
+    """Return process-local preprocessing counters and the upload bytes saved."""
+    with _stats_lock:
+        s = dict(_stats)
+    saved = s['bytes_in'] - s['bytes_out']
+    return {
+        'images': s['images'],
+        'failures': s['failures'],
+        'bytes_in': s['bytes_in'],
+        'bytes_out': s['bytes_out'],
+        'bytes_saved': saved,
+        'saved_pct': round(saved / s['bytes_in'] * 100, 1) if s['bytes_in'] else None,
+        'avg_ms': round(s['total_ms'] / s['images'], 1) if s['images'] else None,
+    }
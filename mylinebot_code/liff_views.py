@@ -4,10 +4,11 @@ Serves the editor page and REST API for food entry CRUD.
 """
 import json
 import logging
+from datetime import date
 
 import requests as http_requests
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 
@@ -16,10 +17,15 @@ from .dietary_storage import (
     update_entry_by_id,
     delete_entry_by_id,
     add_entry_for_date,
+    add_entries_for_date,
 )
-from .profile_storage import get_profile, save_profile, update_profile_goal
-from .dietary_storage import set_tdee
-from .ai_api import parse_and_estimate_foods, modify_food_estimation, estimate_nutrition_from_image
+from .profile_storage import get_profile, get_goal_label, save_profile, update_profile_goal
+from .dietary_storage import set_tdee, get_today_log, get_tdee, get_cached_advice, cache_advice
+from .ai_api import (
+    parse_and_estimate_foods, modify_food_estimation, estimate_nutrition_from_image, stream_diet_advice,
+)
+from .unit_of_work import unit_of_work
+from . import food_io
 
 logger = logging.getLogger(__name__)
 
@@ -66,9 +72,10 @@ def liff_editor(request):
 # ── API views ──────────────────────────────────────────────────────────────────
 
 @csrf_exempt
+@unit_of_work()
 def api_entries(request):
     """
-    GET  → list entries for authenticated user (last 7 days)
+    GET  → list entries + per-day summaries for authenticated user (last 7 days)
     POST → add a new entry
     """
     user_id = _get_liff_user_id(request)
@@ -76,11 +83,14 @@ def api_entries(request):
         return _json_error('Unauthorized', 401)
 
     if request.method == 'GET':
-        from .dietary_storage import get_tdee, get_streak
+        from .dietary_storage import get_tdee, get_streak, get_daily_summaries
         data = get_entries_with_ids(user_id)
+        summaries = get_daily_summaries(user_id)
         tdee = get_tdee(user_id)
         streak = get_streak(user_id)
-        return JsonResponse({'status': 'ok', 'data': data, 'tdee': tdee, 'streak': streak})
+        return JsonResponse({
+            'status': 'ok', 'data': data, 'summaries': summaries, 'tdee': tdee, 'streak': streak,
+        })
 
     if request.method == 'POST':
         try:
@@ -99,6 +109,7 @@ def api_entries(request):
 
 
 @csrf_exempt
+@unit_of_work()
 def api_entry_detail(request, entry_id):
     """
     PUT    → update an entry
@@ -129,6 +140,7 @@ def api_entry_detail(request, entry_id):
 
 
 @csrf_exempt
+@unit_of_work()
 def api_ai_add(request):
     """
     POST → parse food description with AI, estimate nutrition, save entries.
@@ -157,15 +169,13 @@ def api_ai_add(request):
     if not foods:
         return _json_error('AI 無法辨識食物，請再試一次', 422)
 
-    saved = []
-    for food in foods:
-        entry = add_entry_for_date(user_id, date_str, food)
-        saved.append(entry)
+    saved = add_entries_for_date(user_id, date_str, foods)
 
     return JsonResponse({'status': 'ok', 'entries': saved}, status=201)
 
 
 @csrf_exempt
+@unit_of_work()
 def api_ai_modify(request, entry_id):
     """POST → AI re-estimate an entry based on modification text."""
     if request.method != 'POST':
@@ -209,6 +219,7 @@ def api_ai_modify(request, entry_id):
 
 
 @csrf_exempt
+@unit_of_work()
 def api_image_add(request):
     """POST → estimate nutrition from uploaded food photo, save entry."""
     if request.method != 'POST':
@@ -230,7 +241,7 @@ def api_image_add(request):
         image_bytes = image_file.read()
         mime_type = image_file.content_type or 'image/jpeg'
 
-        result = estimate_nutrition_from_image(image_bytes, mime_type)
+        result = estimate_nutrition_from_image(image_bytes, mime_type, user_id=user_id)
         if not result.get('food_name'):
             return _json_error('AI 無法辨識食物，請再試一次', 422)
 
@@ -251,6 +262,149 @@ def api_image_add(request):
         return _json_error('圖片處理失敗，請再試一次', 500)
 
 
+# ── Streaming advice ──────────────────────────────────────────────────────────
+
+def _sse(data, event=None):
+    """Format one server-sent event."""
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def _advice_events(user_id, foods, tdee, prompt, goal):
+    """Yield SSE frames: one per advice chunk, then "done" with the full text (cached for the LINE report)."""
+    # Sent straight away so the browser sees the first byte before the model answers
+    yield ': advice\n\n'
+    parts = []
+    try:
+        for chunk in stream_diet_advice(foods, tdee, prompt, goal):
+            parts.append(chunk)
+            yield _sse({'delta': chunk})
+    except Exception as e:
+        logger.error(f"Advice stream error for {user_id}: {e}")
+        yield _sse({'message': 'AI 建議產生失敗，請再試一次'}, event='error')
+        return
+
+    advice = ''.join(parts).strip()
+    if not advice:
+        yield _sse({'message': 'AI 建議產生失敗，請再試一次'}, event='error')
+        return
+    cache_advice(user_id, advice, tdee, prompt, goal)
+    yield _sse({'text': advice, 'cached': False}, event='done')
+
+
+@csrf_exempt
+def api_advice_stream(request):
+    """
+    POST → stream AI advice on today's log as server-sent events.
+    Body (optional): {"prompt": "晚餐吃什麼好？"}
+    Events: data {"delta"} per text chunk, then event "done" {"text", "cached"},
+    or event "error" {"message"}. Advice cached for an unchanged log is sent at once.
+    An open stream occupies a worker thread, so gunicorn must run gthread workers
+    (see Procfile / render.yaml); a sync worker would block webhooks meanwhile.
+    """
+    if request.method != 'POST':
+        return _json_error('Method not allowed', 405)
+
+    user_id = _get_liff_user_id(request)
+    if not user_id:
+        return _json_error('Unauthorized', 401)
+
+    try:
+        body = json.loads(request.body or b'{}')
+    except (json.JSONDecodeError, ValueError):
+        return _json_error('Invalid JSON')
+    prompt = str(body.get('prompt', '')).strip()[:500]
+
+    foods = get_today_log(user_id)
+    if not foods:
+        return _json_error('今天還沒有飲食紀錄', 422)
+    tdee = get_tdee(user_id)
+    goal = get_goal_label(user_id)
+
+    cached = get_cached_advice(user_id, tdee, prompt, goal)
+    if cached is not None:
+        events = iter([_sse({'text': cached, 'cached': True}, event='done')])
+    else:
+        events = _advice_events(user_id, foods, tdee, prompt, goal)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop proxies from buffering the stream
+    return response
+
+
+# ── Bulk export / import ──────────────────────────────────────────────────────
+
+def _io_format(request, filename=''):
+    """Pick csv/ndjson from ?format=, then the file name, then the content type."""
+    fmt = request.GET.get('format', '').lower()
+    if fmt:
+        return fmt
+    if filename.lower().endswith(('.ndjson', '.jsonl')) or 'ndjson' in request.content_type:
+        return 'ndjson'
+    return 'csv'
+
+
+@csrf_exempt
+def api_export(request):
+    """
+    GET → stream the user's food log as a CSV or NDJSON download.
+    Query: ?format=csv|ndjson&start=2026-01-01&end=2026-03-31 (all optional)
+    """
+    if request.method != 'GET':
+        return _json_error('Method not allowed', 405)
+
+    user_id = _get_liff_user_id(request)
+    if not user_id:
+        return _json_error('Unauthorized', 401)
+
+    fmt = _io_format(request)
+    if fmt not in food_io.FORMATS:
+        return _json_error(f'Unsupported format "{fmt}"')
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+    except ValueError:
+        return _json_error('Dates must be YYYY-MM-DD')
+
+    response = StreamingHttpResponse(
+        food_io.iter_export(user_id, fmt, start, end),
+        content_type=food_io.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="food_log.{fmt}"'
+    return response
+
+
+@csrf_exempt
+@unit_of_work()
+def api_import(request):
+    """
+    POST → bulk import food entries from CSV or NDJSON.
+    Send the file as multipart field "file", or as the raw request body.
+    CSV needs a header row with at least date and name (export column names).
+    """
+    if request.method != 'POST':
+        return _json_error('Method not allowed', 405)
+
+    user_id = _get_liff_user_id(request)
+    if not user_id:
+        return _json_error('Unauthorized', 401)
+
+    upload = request.FILES.get('file') if request.content_type == 'multipart/form-data' else None
+    fmt = _io_format(request, upload.name if upload else '')
+    if fmt not in food_io.FORMATS:
+        return _json_error(f'Unsupported format "{fmt}"')
+
+    try:
+        # Multipart uploads are already spooled to disk by Django; raw bodies are spooled here
+        stream = upload or food_io.spool_upload(request)
+        result = food_io.import_entries(user_id, stream, fmt)
+    except food_io.ImportFormatError as e:
+        return _json_error(str(e))
+
+    return JsonResponse({'status': 'ok', **result})
+
+
 # ── Profile views ─────────────────────────────────────────────────────────────
 
 def liff_profile(request):
@@ -261,6 +415,7 @@ def liff_profile(request):
 
 
 @csrf_exempt
+@unit_of_work()
 def api_profile(request):
     """
     GET  → return profile data for authenticated user
@@ -330,6 +485,7 @@ ACTIVITY_MULTIPLIERS = {
 
 
 @csrf_exempt
+@unit_of_work()
 def api_goal(request):
     """
     POST → save activity_level + goal, compute and set TDEE target.
@@ -0,0 +1,16 @@
+"""
+Management command to compile the bundled nutrition CSV into the food_db index.
+The index is also built on first lookup; running this at deploy time keeps that
+work off the first request.
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Build the memory-mapped index of the offline nutrition database'
+
+    def handle(self, *args, **options):
+        from mylinebot_code.food_db import DATA_PATH, INDEX_PATH, build_index
+
+        count = build_index(DATA_PATH, INDEX_PATH)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} foods into {INDEX_PATH}'))
@@ -0,0 +1,66 @@
+"""
+Management command to assert the hot FoodEntry queries use an index.
+Runs EXPLAIN QUERY PLAN on each query dietary_storage/views issue on the
+request path and fails if SQLite would scan a table or sort in a temp B-tree.
+"""
+import re
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Plan lines that mean a full table/index scan or an unindexed sort
+_BAD_PLAN = re.compile(r'\bSCAN\b|TEMP B-TREE')
+
+
+def _hot_queries():
+    """(label, queryset) pairs mirroring the queries in dietary_storage and views."""
+    from django.db.models import Count, Sum
+    from mylinebot_code.models import DailyTotals, FoodEntry
+
+    user_id = 'U-query-plan-check'
+    today = date.today()
+    week_ago = today - timedelta(days=7)
+    today_log = FoodEntry.objects.filter(user_id=user_id, date=today).order_by('added_at')
+
+    return [
+        ('get_today_log', today_log),
+        ('_today_ids_at', today_log.values_list('id', flat=True)),
+        ('get_food_entry_by_index', today_log[2:3]),
+        ('get_entries_with_ids', FoodEntry.objects.filter(
+            user_id=user_id, date__gte=week_ago,
+        ).order_by('-date', 'added_at')),
+        ('get_daily_summaries', FoodEntry.objects.filter(
+            user_id=user_id, date__gte=week_ago, date__lte=today,
+        ).values('date').annotate(calories=Sum('calories'), item_count=Count('id')).order_by('-date')),
+        ('get_all_users_today', FoodEntry.objects.filter(date=today).order_by('added_at')),
+        ('dietary_reminder_cron', FoodEntry.objects.filter(user_id=user_id).order_by('-added_at')[:1]),
+        ('compact_old_entries', FoodEntry.objects.filter(date__lt=week_ago).values_list('id', flat=True)),
+        ('get_daily_summaries:rollups', DailyTotals.objects.filter(
+            user_id=user_id, compacted=True, date__gte=week_ago, date__lte=today,
+        )),
+        ('get_daily_totals', DailyTotals.objects.filter(user_id=user_id, date=today)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Verify hot FoodEntry queries use indexes (SQLite EXPLAIN QUERY PLAN)'
+
+    def handle(self, *args, **options):
+        from django.db import connection
+
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'check_query_plans only understands SQLite plans (got {connection.vendor})')
+
+        failures = []
+        for label, queryset in _hot_queries():
+            plan = queryset.explain()
+            if _BAD_PLAN.search(plan):
+                failures.append(label)
+                self.stderr.write(self.style.ERROR(f'{label}: {plan}'))
+            else:
+                self.stdout.write(f'{label}: {plan}')
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot quer{"y" if len(failures) == 1 else "ies"} not using an index: {", ".join(failures)}')
+
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index'))
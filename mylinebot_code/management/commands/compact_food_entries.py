@@ -0,0 +1,24 @@
+"""
+Management command to run food-log retention by hand.
+Rolls entries older than the retention window up into daily/weekly rollups, then deletes them.
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Roll old food entries up into DailyTotals/WeeklyRollup rows and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            help='Days of raw entries to keep (default: FOOD_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        from mylinebot_code.backup_journal import flush
+        from mylinebot_code.dietary_storage import compact_old_entries
+
+        deleted = compact_old_entries(keep_days=options['keep_days'])
+        flush()
+        self.stdout.write(self.style.SUCCESS(f'Compacted {deleted} food entries'))
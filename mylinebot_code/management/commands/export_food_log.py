@@ -0,0 +1,35 @@
+"""
+Management command to export a user's food log as CSV or NDJSON.
+Streams rows from the DB, so it is safe for arbitrarily long logs.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Export a user's food log as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='LINE user ID to export')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--start', type=date.fromisoformat, help='First date (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last date (YYYY-MM-DD)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        from mylinebot_code.food_io import iter_export
+
+        chunks = iter_export(options['user'], options['format'], options['start'], options['end'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except OSError as e:
+            raise CommandError(f"Can't write {options['output']}: {e}")
+        self.stderr.write(self.style.SUCCESS(f"Exported food log to {options['output']}"))
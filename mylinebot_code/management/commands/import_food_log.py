@@ -0,0 +1,48 @@
+"""
+Management command to bulk import food entries for a user from CSV or NDJSON.
+Reads the file incrementally and inserts in batches inside one transaction.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Bulk import food entries from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file (same columns as export_food_log)')
+        parser.add_argument('--user', required=True, help='LINE user ID to import into')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson'],
+            help='Input format (default: from the file extension)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        from mylinebot_code.backup_journal import flush
+        from mylinebot_code.food_io import ImportFormatError, import_entries
+        from mylinebot_code.unit_of_work import unit_of_work
+
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.lower().endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        def progress(imported, skipped):
+            self.stdout.write(f'  {imported} imported, {skipped} skipped...')
+
+        try:
+            with open(path, 'rb') as f, unit_of_work():
+                result = import_entries(
+                    options['user'], f, fmt, batch_size=options['batch_size'], progress=progress,
+                )
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {e}")
+        except ImportFormatError as e:
+            raise CommandError(f'Nothing imported: {e}')
+
+        flush()
+
+        for err in result['errors']:
+            self.stderr.write(self.style.WARNING(f"  line {err['line']}: {err['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} entries ({result['skipped']} skipped)"
+        ))
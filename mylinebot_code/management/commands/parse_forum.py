@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from mylinebot_code.backup_journal import flush
 from mylinebot_code.scraper import parse_forum
 
 
@@ -19,3 +20,6 @@ class Command(BaseCommand):
                 self.stdout.write(f'    {article.url}')
         else:
             self.stdout.write(self.style.WARNING('No new articles found today.'))
+
+        # The background syncer dies with this process; upload the articles now
+        flush()
@@ -0,0 +1,22 @@
+"""
+Management command to recompute DailyTotals from FoodEntry rows.
+Use it to repair totals after manual DB edits or a partial restore.
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-user daily nutrition totals from food entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Only rebuild totals for this LINE user ID',
+        )
+
+    def handle(self, *args, **options):
+        from mylinebot_code.dietary_storage import rebuild_daily_totals
+
+        count = rebuild_daily_totals(user_id=options['user'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily totals rows'))
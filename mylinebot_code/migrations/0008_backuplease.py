@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mylinebot_code', '0007_userprofile_streak_count_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackupLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('holder', models.CharField(max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:30
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_totals(apps, schema_editor):
+    """Seed DailyTotals from the FoodEntry rows that already exist."""
+    FoodEntry = apps.get_model('mylinebot_code', 'FoodEntry')
+    DailyTotals = apps.get_model('mylinebot_code', 'DailyTotals')
+
+    rows = FoodEntry.objects.values('user_id', 'date').annotate(
+        calories=Sum('calories'), protein=Sum('protein'), carbs=Sum('carbs'), fat=Sum('fat'),
+        item_count=Count('id'),
+    ).order_by()
+    DailyTotals.objects.bulk_create([
+        DailyTotals(
+            user_id=r['user_id'], date=r['date'],
+            calories=r['calories'] or 0, protein=r['protein'] or 0,
+            carbs=r['carbs'] or 0, fat=r['fat'] or 0,
+            item_count=r['item_count'],
+        )
+        for r in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mylinebot_code', '0008_backuplease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('calories', models.FloatField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'date'), name='dailytotals_user_date')],
+            },
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mylinebot_code', '0009_dailytotals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='foodentry',
+            name='user_id',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='foodentry',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='foodentry',
+            index=models.Index(fields=['user_id', '-date', 'added_at'], name='foodentry_user_date_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='foodentry',
+            index=models.Index(fields=['user_id', 'added_at'], name='foodentry_user_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='foodentry',
+            index=models.Index(fields=['date', 'added_at'], name='foodentry_date_added_idx'),
+        ),
+    ]
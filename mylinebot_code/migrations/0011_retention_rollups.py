@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mylinebot_code', '0010_foodentry_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailytotals',
+            name='top_foods',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='dailytotals',
+            name='compacted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='WeeklyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('week_start', models.DateField()),
+                ('calories', models.FloatField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+                ('day_count', models.IntegerField(default=0)),
+                ('top_foods', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'week_start'), name='weeklyrollup_user_week')],
+            },
+        ),
+    ]
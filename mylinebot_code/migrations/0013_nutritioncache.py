@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mylinebot_code', '0012_processedwebhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NutritionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('estimate', 'Estimate'), ('parse', 'Parse')], max_length=20)),
+                ('key', models.CharField(max_length=500)),
+                ('result', models.JSONField()),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='nutritioncache_kind_key')],
+            },
+        ),
+    ]
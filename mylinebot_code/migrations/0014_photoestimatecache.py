@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mylinebot_code', '0013_nutritioncache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoEstimateCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('dhash', models.BigIntegerField()),
+                ('result', models.JSONField()),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user_id', '-created_at'], name='photocache_user_created_idx'),
+                    models.Index(fields=['-created_at'], name='photocache_created_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+"""
+Latency-aware ordering of the AI provider model lists.
+
+For every (provider, task, model) the scoreboard keeps exponentially weighted
+moving averages of latency, success rate (HTTP-level) and parse-failure rate
+(a 200 whose body isn't usable). rank() orders a model list by the expected
+seconds per usable answer, latency / (success × (1 − parse failures)), so the
+fastest healthy model is tried first. A small EXPLORE_RATE share of calls puts
+a random other model first, so a recovered or newly fast model gets re-scored.
+
+Models without samples keep their configured order, behind scored ones.
+Scores are per process: each gunicorn worker learns from its own calls.
+"""
+import logging
+import random
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = float(getattr(settings, 'AI_ROUTING_EWMA_ALPHA', 0.2))
+EXPLORE_RATE = float(getattr(settings, 'AI_ROUTING_EXPLORE_RATE', 0.05))
+# Floor for the usable-answer rate, so a dead model scores high but finite
+_MIN_USABLE = 0.05
+
+_lock = threading.Lock()
+_scores = {}  # (provider, task, model) -> {'latency', 'success', 'parse_fail', 'samples'}
+
+
+def _ewma(old, value):
+    return value if old is None else old + EWMA_ALPHA * (value - old)
+
+
+def _entry(provider, task, model):
+    return _scores.setdefault(
+        (provider, task, model),
+        {'latency': None, 'success': None, 'parse_fail': None, 'samples': 0},
+    )
+
+
+def _cost(entry):
+    """Expected seconds per usable answer, or None without a successful sample."""
+    if entry is None or entry['latency'] is None:
+        return None
+    usable = entry['success'] * (1 - (entry['parse_fail'] or 0.0))
+    return entry['latency'] / max(usable, _MIN_USABLE)
+
+
+def record(provider, task, model, ok, latency=None, parsed=True):
+    """
+    Record one call. ok=False for 429/5xx/timeouts/connection errors; when ok,
+    latency is the request time in seconds and parsed says whether the body was usable.
+    """
+    with _lock:
+        entry = _entry(provider, task, model)
+        entry['samples'] += 1
+        entry['success'] = _ewma(entry['success'], 1.0 if ok else 0.0)
+        if ok:
+            entry['latency'] = _ewma(entry['latency'], latency)
+            entry['parse_fail'] = _ewma(entry['parse_fail'], 0.0 if parsed else 1.0)
+
+
+def rank(provider, task, models):
+    """Return `models` ordered best first (configured order for unscored models)."""
+    with _lock:
+        costs = {m: _cost(_scores.get((provider, task, m))) for m in models}
+
+    position = {m: i for i, m in enumerate(models)}
+    ordered = sorted(models, key=lambda m: (costs[m] is None, costs[m] or 0.0, position[m]))
+
+    if len(ordered) > 1 and random.random() < EXPLORE_RATE:
+        explore = random.choice(ordered[1:])
+        ordered.remove(explore)
+        ordered.insert(0, explore)
+        logger.debug(f"Exploring {provider}/{explore} for {task}")
+    return ordered
+
+
+def ranking():
+    """Return {'provider/task': [{'model', 'cost_s', 'latency_s', 'success', 'parse_fail', 'samples'}]} best first."""
+    with _lock:
+        items = [(key, dict(entry)) for key, entry in _scores.items()]
+
+    groups = {}
+    for (provider, task, model), entry in items:
+        cost = _cost(entry)
+        groups.setdefault(f'{provider}/{task}', []).append({
+            'model': model,
+            'cost_s': round(cost, 3) if cost is not None else None,
+            'latency_s': round(entry['latency'], 3) if entry['latency'] is not None else None,
+            'success': round(entry['success'], 3) if entry['success'] is not None else None,
+            'parse_fail': round(entry['parse_fail'], 3) if entry['parse_fail'] is not None else None,
+            'samples': entry['samples'],
+        })
+    for rows in groups.values():
+        rows.sort(key=lambda r: (r['cost_s'] is None, r['cost_s'] or 0.0))
+    return groups
@@ -39,8 +39,8 @@ class PushTarget(models.Model):
 
 class FoodEntry(models.Model):
     """One row per food item logged by a user."""
-    user_id = models.CharField(max_length=100, db_index=True)
-    date = models.DateField(db_index=True)
+    user_id = models.CharField(max_length=100)
+    date = models.DateField()
     name = models.CharField(max_length=200)
     description = models.CharField(max_length=500, blank=True, default='')
     calories = models.FloatField(null=True)
@@ -52,11 +52,63 @@ class FoodEntry(models.Model):
 
     class Meta:
         ordering = ['-date', '-added_at']
+        # Composite indexes matching the hot access paths (see check_query_plans):
+        # per-user day log / date ranges, per-user latest entry, and per-date scans.
+        indexes = [
+            models.Index(fields=['user_id', '-date', 'added_at'], name='foodentry_user_date_added_idx'),
+            models.Index(fields=['user_id', 'added_at'], name='foodentry_user_added_idx'),
+            models.Index(fields=['date', 'added_at'], name='foodentry_date_added_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user_id} - {self.date} - {self.name}"
 
 
+class DailyTotals(models.Model):
+    """
+    Running nutrition totals per user per day, kept in step with FoodEntry writes.
+    Once retention deletes a day's raw entries, this row is its daily rollup.
+    """
+    user_id = models.CharField(max_length=100)
+    date = models.DateField()
+    calories = models.FloatField(default=0)
+    protein = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    item_count = models.IntegerField(default=0)
+    top_foods = models.JSONField(default=list, blank=True)  # [{"name", "count", "calories"}]
+    compacted = models.BooleanField(default=False)  # raw FoodEntry rows already rolled up
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'date'], name='dailytotals_user_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.date}: {self.calories:.0f} kcal ({self.item_count} items)"
+
+
+class WeeklyRollup(models.Model):
+    """Per-user weekly nutrition totals for days whose raw entries were compacted."""
+    user_id = models.CharField(max_length=100)
+    week_start = models.DateField()  # Monday
+    calories = models.FloatField(default=0)
+    protein = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    fat = models.FloatField(default=0)
+    item_count = models.IntegerField(default=0)
+    day_count = models.IntegerField(default=0)
+    top_foods = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'week_start'], name='weeklyrollup_user_week'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - week of {self.week_start}: {self.calories:.0f} kcal"
+
+
 class UserTdee(models.Model):
     """One row per user's TDEE setting."""
     user_id = models.CharField(max_length=100, unique=True)
@@ -94,3 +146,59 @@ class UserProfile(models.Model):
 
     def __str__(self):
         return f"{self.user_id}: {self.gender} {self.height}cm {self.weight}kg"
+
+
+class BackupLease(models.Model):
+    """Expiring lock row — the holder is the only worker allowed to write backups."""
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.holder} until {self.expires_at}"
+
+
+class ProcessedWebhookEvent(models.Model):
+    """Ledger of LINE webhook events already handled, so redeliveries are skipped."""
+    event_id = models.CharField(max_length=100, unique=True)  # LINE webhookEventId
+    received_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.event_id} at {self.received_at}"
+
+
+class NutritionCache(models.Model):
+    """AI nutrition result cached per normalised food description (see nutrition_cache.py)."""
+    # 'estimate': estimate_nutrition → one result dict; 'parse': parse_and_estimate_foods → list
+    kind = models.CharField(max_length=20, choices=[('estimate', 'Estimate'), ('parse', 'Parse')])
+    key = models.CharField(max_length=500)
+    result = models.JSONField()
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='nutritioncache_kind_key'),
+        ]
+
+    def __str__(self):
+        return f"[{self.kind}] {self.key} ({self.hit_count} hits)"
+
+
+class PhotoEstimateCache(models.Model):
+    """AI nutrition result for a food photo, keyed by its 64-bit dHash (see photo_cache.py)."""
+    user_id = models.CharField(max_length=100)
+    dhash = models.BigIntegerField()  # signed 64-bit perceptual hash
+    result = models.JSONField()
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', '-created_at'], name='photocache_user_created_idx'),
+            models.Index(fields=['-created_at'], name='photocache_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.dhash & 0xFFFFFFFFFFFFFFFF:016x}: {self.result.get('food_name')}"
@@ -0,0 +1,146 @@
+"""
+Vectorized nutrition analytics for dietary reports.
+
+compute_user_metrics() loads the last 30 days of DailyTotals (one query that
+covers both raw and compacted days) plus TDEE settings into NumPy arrays, then
+computes rolling averages, macro ratio trends, adherence scores and
+week-over-week deltas for every requested user in a single pass.
+
+Arrays are indexed [user, day, ...] where day 0 is today and day 29 is 29 days ago.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 30
+WEEK = 7
+
+# A logged day counts as on target when calories are within this fraction of TDEE
+ADHERENCE_TOLERANCE = 0.10
+
+MACROS = ('protein', 'carbs', 'fat')
+_KCAL_PER_GRAM = np.array([4.0, 4.0, 9.0])
+
+
+def _load(user_ids, today):
+    """
+    Return (users, totals[U, D, 4], logged[U, D], tdee[U]).
+    totals holds calories, protein, carbs, fat; tdee is NaN where unset.
+    """
+    from .models import DailyTotals, UserTdee
+
+    since = today - timedelta(days=WINDOW_DAYS - 1)
+    rows = DailyTotals.objects.filter(date__gte=since, date__lte=today, item_count__gt=0)
+    tdees = UserTdee.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+        tdees = tdees.filter(user_id__in=user_ids)
+
+    rows = list(rows.values_list('user_id', 'date', 'calories', 'protein', 'carbs', 'fat'))
+    tdee_map = dict(tdees.values_list('user_id', 'tdee'))
+
+    users = sorted(set(user_ids) if user_ids is not None else {r[0] for r in rows})
+    index = {u: i for i, u in enumerate(users)}
+
+    totals = np.zeros((len(users), WINDOW_DAYS, 4))
+    logged = np.zeros((len(users), WINDOW_DAYS), dtype=bool)
+    if rows:
+        user_idx = np.fromiter((index[r[0]] for r in rows), dtype=np.intp, count=len(rows))
+        day_idx = np.fromiter(((today - r[1]).days for r in rows), dtype=np.intp, count=len(rows))
+        totals[user_idx, day_idx] = np.array([r[2:] for r in rows], dtype=float)
+        logged[user_idx, day_idx] = True
+
+    tdee = np.array([tdee_map.get(u, np.nan) for u in users], dtype=float)
+    return users, totals, logged, tdee
+
+
+def _mean_logged(values, logged):
+    """Per-user mean of values[U, D] over logged days only (NaN if none)."""
+    days = logged.sum(axis=1)
+    total = np.where(logged, values, 0.0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / days
+
+
+def _macro_pct(totals, logged):
+    """Per-user share of macro calories from protein/carbs/fat, in percent [U, 3]."""
+    grams = np.where(logged[..., None], totals[..., 1:], 0.0).sum(axis=1)
+    kcal = grams * _KCAL_PER_GRAM
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return kcal / kcal.sum(axis=1, keepdims=True) * 100
+
+
+def _adherence(calories, logged, tdee, days):
+    """Percent of the last `days` days logged within ADHERENCE_TOLERANCE of TDEE (NaN without TDEE)."""
+    target = tdee[:, None]
+    on_target = logged[:, :days] & (np.abs(calories[:, :days] - target) <= ADHERENCE_TOLERANCE * target)
+    return np.where(np.isnan(tdee), np.nan, on_target.sum(axis=1) / days * 100)
+
+
+def _num(value, digits=1):
+    """NumPy scalar → rounded float, or None for NaN."""
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def compute_user_metrics(user_ids=None, today=None):
+    """
+    Return {user_id: metrics} for the given users (everyone with recent totals if None).
+
+    metrics keys:
+        tdee, calories_today,
+        avg_calories_7d, avg_calories_30d, logged_days_7d, logged_days_30d,
+        calories_wow_delta   — 7-day avg minus the previous 7-day avg (kcal),
+        macro_pct_7d         — {'protein', 'carbs', 'fat'} share of macro kcal,
+        macro_pct_wow_delta  — change in those shares vs the previous week (points),
+        adherence_7d, adherence_30d — percent of days on target (None without TDEE).
+    """
+    from .dietary_storage import TW_TZ
+
+    today = today or datetime.now(TW_TZ).date()
+    user_ids = list(user_ids) if user_ids is not None else None
+    users, totals, logged, tdee = _load(user_ids, today)
+    if not users:
+        return {}
+
+    calories = totals[..., 0]
+    this_week, last_week = slice(0, WEEK), slice(WEEK, 2 * WEEK)
+
+    avg_7 = _mean_logged(calories[:, this_week], logged[:, this_week])
+    avg_prev_7 = _mean_logged(calories[:, last_week], logged[:, last_week])
+    avg_30 = _mean_logged(calories, logged)
+    macro_7 = _macro_pct(totals[:, this_week], logged[:, this_week])
+    macro_prev_7 = _macro_pct(totals[:, last_week], logged[:, last_week])
+    adherence_7 = _adherence(calories, logged, tdee, WEEK)
+    adherence_30 = _adherence(calories, logged, tdee, WINDOW_DAYS)
+    logged_7 = logged[:, this_week].sum(axis=1)
+    logged_30 = logged.sum(axis=1)
+
+    wow = avg_7 - avg_prev_7
+    macro_wow = macro_7 - macro_prev_7
+
+    metrics = {}
+    for i, user_id in enumerate(users):
+        macro_pct = None
+        if not np.isnan(macro_7[i]).any():
+            macro_pct = {m: _num(macro_7[i, j], 0) for j, m in enumerate(MACROS)}
+        macro_delta = None
+        if not np.isnan(macro_wow[i]).any():
+            macro_delta = {m: _num(macro_wow[i, j], 0) for j, m in enumerate(MACROS)}
+
+        metrics[user_id] = {
+            'tdee': None if np.isnan(tdee[i]) else int(tdee[i]),
+            'calories_today': round(float(calories[i, 0]), 1),
+            'avg_calories_7d': _num(avg_7[i]),
+            'avg_calories_30d': _num(avg_30[i]),
+            'logged_days_7d': int(logged_7[i]),
+            'logged_days_30d': int(logged_30[i]),
+            'calories_wow_delta': _num(wow[i]),
+            'macro_pct_7d': macro_pct,
+            'macro_pct_wow_delta': macro_delta,
+            'adherence_7d': _num(adherence_7[i], 0),
+            'adherence_30d': _num(adherence_30[i], 0),
+        }
+    return metrics
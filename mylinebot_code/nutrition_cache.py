@@ -0,0 +1,158 @@
+"""
+Persistent cache of AI nutrition results, keyed by normalised food description.
+
+People log the same foods over and over, so ai_api looks the description up
+here before calling any provider. Keys are normalised (full/half-width, case,
+whitespace, Chinese numerals and a leading "one serving" quantifier) so that
+"一碗 滷肉飯", "1碗滷肉飯" and "滷肉飯" share an entry. Entries expire after
+NUTRITION_CACHE_TTL_DAYS; past NUTRITION_CACHE_MAX_ENTRIES the least recently
+used ones are evicted. Entries can be invalidated from the Django admin.
+"""
+import logging
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+KIND_ESTIMATE = 'estimate'
+KIND_PARSE = 'parse'
+
+CACHE_TTL = timedelta(days=float(getattr(settings, 'NUTRITION_CACHE_TTL_DAYS', 30)))
+MAX_ENTRIES = int(getattr(settings, 'NUTRITION_CACHE_MAX_ENTRIES', 5000))
+_KEY_MAX_LENGTH = 500
+
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evicted': 0,
+}
+
+# ── Normalisation ─────────────────────────────────────────────────────────────
+
+_CLASSIFIERS = (
+    '個|个|碗|杯|份|盤|盘|顆|颗|片|條|条|根|塊|块|包|瓶|罐|碟|串|支|隻|只|匙|粒|張|张|盒|客|球|盅|鍋|锅'
+)
+_CN_DIGITS = {'零': 0, '一': 1, '二': 2, '兩': 2, '两': 2, '三': 3, '四': 4,
+              '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_CN_NUMBER = re.compile(
+    r'(半|[一二兩两三四五六七八九]?十[一二三四五六七八九]?|[零一二兩两三四五六七八九])'
+    rf'(?=\s*(?:{_CLASSIFIERS}))'
+)
+# "1碗" / "1 bowl of" / "a cup of" at the start of a food → same as no quantity
+_ONE_SERVING = re.compile(
+    rf'(^|[,+&/])\s*(?:1\s*(?:{_CLASSIFIERS})'
+    r'|(?:1|a|an|one)\s+(?:(?:bowl|cup|plate|piece|serving|slice|glass)s?\s+of\s+)?)'
+)
+_SEPARATORS = re.compile(r'\s*[,、;]\s*')
+_TRAILING = re.compile(r'[\s.。!！~～]+$')
+_CJK_GAP = re.compile(r'(?<=[㐀-鿿])\s+(?=[㐀-鿿])')
+
+
+def _cn_number(match):
+    text = match.group(1)
+    if text == '半':
+        return '0.5'
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return str(_CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0))
+    return str(_CN_DIGITS[text])
+
+
+def normalize(text):
+    """Canonical cache key for a food description ('' if nothing is left)."""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    text = _SEPARATORS.sub(',', text)
+    text = _CN_NUMBER.sub(_cn_number, text)
+    text = _ONE_SERVING.sub(r'\1', text)
+    text = _CJK_GAP.sub('', text)
+    text = ' '.join(text.split())
+    text = _TRAILING.sub('', text)
+    return text.strip(' ,')
+
+
+# ── Cache operations ──────────────────────────────────────────────────────────
+
+def lookup(kind, text):
+    """Return the cached result for (kind, text), or None on a miss or an expired entry."""
+    from django.db.models import F
+    from django.utils import timezone
+    from .models import NutritionCache
+
+    key = normalize(text)
+    if not key or len(key) > _KEY_MAX_LENGTH:
+        return None
+
+    try:
+        now = timezone.now()
+        row = NutritionCache.objects.filter(kind=kind, key=key).values_list('id', 'result', 'created_at').first()
+        if row is not None and row[2] < now - CACHE_TTL:
+            NutritionCache.objects.filter(pk=row[0]).delete()
+            row = None
+        if row is None:
+            _stats['misses'] += 1
+            return None
+
+        NutritionCache.objects.filter(pk=row[0]).update(hit_count=F('hit_count') + 1, last_used_at=now)
+        _stats['hits'] += 1
+        logger.info(f"Nutrition cache hit [{kind}] '{key}'")
+        return row[1]
+    except Exception as e:
+        logger.warning(f"Nutrition cache lookup failed for '{key}': {e}")
+        return None
+
+
+def store(kind, text, result):
+    """Cache a successful AI result for (kind, text), evicting LRU entries past MAX_ENTRIES."""
+    from django.utils import timezone
+    from .models import NutritionCache
+
+    key = normalize(text)
+    if not key or len(key) > _KEY_MAX_LENGTH:
+        return
+
+    try:
+        NutritionCache.objects.update_or_create(
+            kind=kind, key=key,
+            defaults={'result': result, 'last_used_at': timezone.now()},
+        )
+        _stats['stores'] += 1
+        _evict()
+    except Exception as e:
+        logger.warning(f"Nutrition cache store failed for '{key}': {e}")
+
+
+def _evict():
+    """Drop expired entries, then the least recently used ones beyond MAX_ENTRIES."""
+    from django.utils import timezone
+    from .models import NutritionCache
+
+    expired, _ = NutritionCache.objects.filter(created_at__lt=timezone.now() - CACHE_TTL).delete()
+    excess = NutritionCache.objects.count() - MAX_ENTRIES
+    lru = 0
+    if excess > 0:
+        ids = list(NutritionCache.objects.order_by('last_used_at').values_list('id', flat=True)[:excess])
+        lru, _ = NutritionCache.objects.filter(id__in=ids).delete()
+    _stats['evicted'] += expired + lru
+
+
+def invalidate(text=None, kind=None):
+    """Delete cached results for one description (any kind unless given), or everything. Returns count."""
+    from .models import NutritionCache
+
+    entries = NutritionCache.objects.all()
+    if kind:
+        entries = entries.filter(kind=kind)
+    if text is not None:
+        entries = entries.filter(key=normalize(text))
+    deleted, _ = entries.delete()
+    return deleted
+
+
+def stats():
+    """Return process-local hit/miss counters and the hit rate."""
+    lookups = _stats['hits'] + _stats['misses']
+    return {**_stats, 'hit_rate': round(_stats['hits'] / lookups, 3) if lookups else None}
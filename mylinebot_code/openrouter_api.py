@@ -2,17 +2,24 @@
 OpenRouter API client for nutrition estimation.
 Fallback provider when Gemini is unavailable.
 Uses OpenAI-compatible chat completions format with free-tier models.
+
+The a*() functions are coroutines on the shared ai_http session; the plain
+names are blocking wrappers for sync callers.
 """
+import asyncio
 import base64
 import json
 import logging
 import os
+import time
+from functools import partial
 
-import requests
+import aiohttp
 
+from . import ai_http, ai_schemas, circuit_breaker, model_scoreboard
 from .ai_prompts import (
     nutrition_prompt, image_nutrition_prompt, parse_foods_prompt,
-    modify_food_prompt, diet_advice_prompt,
+    parse_foods_batch_prompt, modify_food_prompt, diet_advice_prompt,
 )
 
 logger = logging.getLogger(__name__)
@@ -30,13 +37,23 @@ TEXT_MODELS = VISION_MODELS + [
     'nvidia/nemotron-3-super-120b-a12b:free',
 ]
 
-_RETRYABLE_STATUS_CODES = {429, 500, 503}
+_RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
 
+def _status_error(response, model):
+    return aiohttp.ClientResponseError(
+        response.request_info, response.history,
+        status=response.status, message=f"{response.status} for model {model}", headers=response.headers,
+    )
 
-def _openrouter_request(messages, model_list=None, timeout=30):
+
+async def _openrouter_request(messages, model_list=None, timeout=30, task='text', parse=None, json_mode=False):
     """
-    Send a chat completion request to OpenRouter, trying each model in order.
-    Returns the response text content, or raises the last exception on total failure.
+    Send a chat completion request to OpenRouter, trying models best-ranked first.
+    If parse is given it is applied to the response text, and a model whose answer
+    can't be parsed counts as failed and the next model is tried. json_mode asks
+    for a JSON object response (ignored by models that don't support it).
+    Returns the parsed result (or text content), or raises the last exception on total failure.
     """
     if model_list is None:
         model_list = TEXT_MODELS
@@ -49,55 +66,73 @@ def _openrouter_request(messages, model_list=None, timeout=30):
         'Content-Type': 'application/json',
     }
 
+    session = await ai_http.session()
     last_error = None
-    for model in model_list:
+    for model in model_scoreboard.rank('openrouter', task, model_list):
+        if not await circuit_breaker.aallow('openrouter', model):
+            logger.info(f"OpenRouter model {model} circuit open, skipping")
+            continue
+        started = time.monotonic()
         try:
             payload = {
                 'model': model,
                 'messages': messages,
             }
-            response = requests.post(
+            if json_mode:
+                payload['response_format'] = {'type': 'json_object'}
+            async with session.post(
                 OPENROUTER_URL,
                 headers=headers,
                 json=payload,
-                timeout=timeout,
-            )
-            if response.status_code in _RETRYABLE_STATUS_CODES:
-                logger.warning(f"OpenRouter model {model} returned {response.status_code}, trying next model")
-                last_error = requests.exceptions.HTTPError(
-                    f"{response.status_code} for model {model}", response=response
-                )
-                continue
-            response.raise_for_status()
-            data = response.json()
-            return data['choices'][0]['message']['content']
-        except requests.exceptions.Timeout as e:
+                timeout=ai_http.timeout(timeout),
+            ) as response:
+                if response.status in _RETRYABLE_STATUS_CODES:
+                    logger.warning(f"OpenRouter model {model} returned {response.status}, trying next model")
+                    await circuit_breaker.arecord_failure(
+                        'openrouter', model, response.status, response.headers.get('Retry-After'),
+                    )
+                    model_scoreboard.record('openrouter', task, model, ok=False)
+                    last_error = _status_error(response, model)
+                    continue
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            await circuit_breaker.arecord_success('openrouter', model)
+            latency = time.monotonic() - started
+        except asyncio.TimeoutError as e:
             logger.warning(f"OpenRouter model {model} timed out, trying next model")
+            await circuit_breaker.arecord_failure('openrouter', model)
+            model_scoreboard.record('openrouter', task, model, ok=False)
             last_error = e
             continue
-        except requests.exceptions.HTTPError:
+        except aiohttp.ClientResponseError:
             raise
+        except aiohttp.ClientConnectionError as e:
+            logger.warning(f"OpenRouter model {model} unreachable: {e}, trying next model")
+            await circuit_breaker.arecord_failure('openrouter', model)
+            model_scoreboard.record('openrouter', task, model, ok=False)
+            last_error = e
+            continue
         except Exception as e:
             logger.warning(f"OpenRouter model {model} failed: {e}, trying next model")
             last_error = e
             continue
-    raise last_error
-
 
-def _parse_response_json(text):
-    """Extract and parse JSON from response text (handles markdown fences)."""
-    text = text.strip()
-    if text.startswith('```'):
-        text = text.split('\n', 1)[1] if '\n' in text else text[3:]
-    if text.endswith('```'):
-        text = text[:-3]
-    text = text.strip()
-    if text.startswith('json'):
-        text = text[4:].strip()
-    return json.loads(text)
+        try:
+            text = data['choices'][0]['message']['content']
+            result = parse(text) if parse is not None else text
+        except Exception as e:
+            logger.warning(f"OpenRouter model {model} returned an unusable answer: {e}, trying next model")
+            model_scoreboard.record('openrouter', task, model, ok=True, latency=latency, parsed=False)
+            last_error = e
+            continue
+        model_scoreboard.record('openrouter', task, model, ok=True, latency=latency)
+        return result
+    if last_error is None:
+        raise circuit_breaker.CircuitOpenError("All OpenRouter models are circuit-open")
+    raise last_error
 
 
-def estimate_nutrition(food_name, description=''):
+async def aestimate_nutrition(food_name, description=''):
     """
     Call OpenRouter API to estimate nutrition for a food item.
     Returns dict with keys: calories, protein, carbs, fat, basis.
@@ -114,21 +149,15 @@ def estimate_nutrition(food_name, description=''):
 
     try:
         messages = [{'role': 'user', 'content': prompt}]
-        text = _openrouter_request(messages, TEXT_MODELS)
-        result = _parse_response_json(text)
-        return {
-            'calories': float(result.get('calories', 0)),
-            'protein': float(result.get('protein', 0)),
-            'carbs': float(result.get('carbs', 0)),
-            'fat': float(result.get('fat', 0)),
-            'basis': result.get('basis', ''),
-        }
+        return await _openrouter_request(
+            messages, TEXT_MODELS, parse=partial(ai_schemas.parse, ai_schemas.NUTRITION), json_mode=True,
+        )
     except Exception as e:
         logger.error(f"OpenRouter API error for '{food_desc}': {e}")
         return {'calories': None, 'protein': None, 'carbs': None, 'fat': None, 'basis': ''}
 
 
-def estimate_nutrition_from_image(image_bytes, mime_type):
+async def aestimate_nutrition_from_image(image_bytes, mime_type):
     """
     Call OpenRouter API to estimate nutrition from a food photo.
     Returns dict with keys: food_name, calories, protein, carbs, fat, basis.
@@ -151,22 +180,16 @@ def estimate_nutrition_from_image(image_bytes, mime_type):
                 {'type': 'text', 'text': prompt},
             ],
         }]
-        text = _openrouter_request(messages, VISION_MODELS, timeout=45)
-        result = _parse_response_json(text)
-        return {
-            'food_name': result.get('food_name'),
-            'calories': float(result.get('calories', 0)),
-            'protein': float(result.get('protein', 0)),
-            'carbs': float(result.get('carbs', 0)),
-            'fat': float(result.get('fat', 0)),
-            'basis': result.get('basis', ''),
-        }
+        return await _openrouter_request(
+            messages, VISION_MODELS, timeout=45, task='image',
+            parse=partial(ai_schemas.parse, ai_schemas.PHOTO), json_mode=True,
+        )
     except Exception as e:
         logger.error(f"OpenRouter API image error: {e}")
         return {'food_name': None, 'calories': None, 'protein': None, 'carbs': None, 'fat': None, 'basis': ''}
 
 
-def parse_and_estimate_foods(text):
+async def aparse_and_estimate_foods(text):
     """
     Parse free-form text describing foods and estimate nutrition for each.
     Returns a list of dicts, or None on failure.
@@ -179,28 +202,39 @@ def parse_and_estimate_foods(text):
 
     try:
         messages = [{'role': 'user', 'content': prompt}]
-        response_text = _openrouter_request(messages, TEXT_MODELS)
-        result = _parse_response_json(response_text)
-        if isinstance(result, dict):
-            result = [result]
-        foods = []
-        for item in result:
-            foods.append({
-                'name': item.get('name', ''),
-                'description': item.get('description', ''),
-                'calories': float(item.get('calories', 0)),
-                'protein': float(item.get('protein', 0)),
-                'carbs': float(item.get('carbs', 0)),
-                'fat': float(item.get('fat', 0)),
-                'basis': item.get('basis', ''),
-            })
-        return foods if foods else None
+        return await _openrouter_request(
+            messages, TEXT_MODELS, parse=partial(ai_schemas.parse, ai_schemas.FOODS), json_mode=True,
+        )
     except Exception as e:
         logger.error(f"OpenRouter API error for parse_and_estimate_foods: {e}")
         return None
 
 
-def modify_food_estimation(original_food, modification):
+async def aparse_and_estimate_foods_batch(texts):
+    """
+    Parse several meal descriptions in one request (used by ai_batcher).
+    Returns a list aligned with texts — each meal's food list, or None for a meal
+    the answer left out. Returns None on failure.
+    """
+    if not OPENROUTER_API_KEY:
+        logger.warning("OPEN_ROUTER_ID not set, cannot parse foods")
+        return None
+
+    prompt = parse_foods_batch_prompt(texts)
+
+    try:
+        messages = [{'role': 'user', 'content': prompt}]
+        answer = await _openrouter_request(
+            messages, TEXT_MODELS, timeout=45, task='batch',
+            parse=partial(ai_schemas.parse, ai_schemas.FOODS_BATCH), json_mode=True,
+        )
+    except Exception as e:
+        logger.error(f"OpenRouter API error for parse_and_estimate_foods_batch ({len(texts)} meals): {e}")
+        return None
+    return ai_schemas.unpack_batch(answer, len(texts))
+
+
+async def amodify_food_estimation(original_food, modification):
     """
     Re-estimate nutrition for an existing food entry based on user's modification.
     Returns dict with keys: name, description, calories, protein, carbs, fat, basis.
@@ -222,30 +256,17 @@ def modify_food_estimation(original_food, modification):
 
     try:
         messages = [{'role': 'user', 'content': prompt}]
-        text = _openrouter_request(messages, TEXT_MODELS)
-        result = _parse_response_json(text)
-        return {
-            'name': result.get('name', original_food['name']),
-            'description': result.get('description', ''),
-            'calories': float(result.get('calories', 0)),
-            'protein': float(result.get('protein', 0)),
-            'carbs': float(result.get('carbs', 0)),
-            'fat': float(result.get('fat', 0)),
-            'basis': result.get('basis', ''),
-        }
+        result = await _openrouter_request(
+            messages, TEXT_MODELS, parse=partial(ai_schemas.parse, ai_schemas.MODIFY), json_mode=True,
+        )
+        return {**result, 'name': result['name'] or original_food['name']}
     except Exception as e:
         logger.error(f"OpenRouter API error for modify_food_estimation: {e}")
         return None
 
 
-def generate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
-    """
-    Ask OpenRouter for dietary advice based on today's food log.
-    Returns advice string, or None on failure.
-    """
-    if not OPENROUTER_API_KEY:
-        return None
-
+def _advice_prompt(foods, tdee, user_prompt, goal):
+    """Build the diet-advice prompt from today's food log."""
     food_summary = []
     total_cal = 0
     for f in foods:
@@ -270,11 +291,122 @@ def generate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
     else:
         question = "Give brief dietary advice based on today's intake and the user's goal. What's missing? What should I eat next? Keep it concise (under 200 characters)."
 
-    prompt = diet_advice_prompt(food_list, total_cal, tdee_info, question)
+    return diet_advice_prompt(food_list, total_cal, tdee_info, question)
+
+
+async def agenerate_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    """
+    Ask OpenRouter for dietary advice based on today's food log.
+    Returns advice string, or None on failure.
+    """
+    if not OPENROUTER_API_KEY:
+        return None
+
+    prompt = _advice_prompt(foods, tdee, user_prompt, goal)
 
     try:
         messages = [{'role': 'user', 'content': prompt}]
-        return _openrouter_request(messages, TEXT_MODELS)
+        return await _openrouter_request(messages, TEXT_MODELS, task='advice')
     except Exception as e:
         logger.error(f"OpenRouter diet advice error: {e}")
         return None
+
+
+
+async def astream_diet_advice(foods, tdee=None, user_prompt='', goal=''):
+    """
+    Stream OpenRouter dietary advice as text chunks (OpenAI-style stream=true SSE).
+    Models are tried best-ranked first until one starts answering; an error
+    after text has been yielded is raised, since the caller already has a partial answer.
+    """
+    if not OPENROUTER_API_KEY:
+        return
+
+    headers = {
+        'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+        'Content-Type': 'application/json',
+    }
+    messages = [{'role': 'user', 'content': _advice_prompt(foods, tdee, user_prompt, goal)}]
+    session = await ai_http.session()
+    last_error = None
+    for model in model_scoreboard.rank('openrouter', 'advice_stream', TEXT_MODELS):
+        if not await circuit_breaker.aallow('openrouter', model):
+            logger.info(f"OpenRouter model {model} circuit open, skipping")
+            continue
+        started = time.monotonic()
+        emitted = False
+        try:
+            payload = {
+                'model': model,
+                'messages': messages,
+                'stream': True,
+            }
+            async with session.post(
+                OPENROUTER_URL,
+                headers=headers,
+                json=payload,
+                timeout=ai_http.stream_timeout(30),
+            ) as response:
+                if response.status in _RETRYABLE_STATUS_CODES:
+                    logger.warning(f"OpenRouter model {model} returned {response.status}, trying next model")
+                    await circuit_breaker.arecord_failure(
+                        'openrouter', model, response.status, response.headers.get('Retry-After'),
+                    )
+                    model_scoreboard.record('openrouter', 'advice_stream', model, ok=False)
+                    last_error = _status_error(response, model)
+                    continue
+                response.raise_for_status()
+                await circuit_breaker.arecord_success('openrouter', model)
+                async for data in ai_http.sse_data(response):
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get('error'):
+                        raise ValueError(f"Stream error from model {model}: {chunk['error']}")
+                    text = ((chunk.get('choices') or [{}])[0].get('delta') or {}).get('content') or ''
+                    if not text:
+                        continue
+                    if not emitted:
+                        # Scored on time to first token, which is what streaming is for
+                        model_scoreboard.record(
+                            'openrouter', 'advice_stream', model, ok=True, latency=time.monotonic() - started,
+                        )
+                        emitted = True
+                    yield text
+            if emitted:
+                return
+            model_scoreboard.record(
+                'openrouter', 'advice_stream', model, ok=True, latency=time.monotonic() - started, parsed=False,
+            )
+            last_error = ValueError(f"Empty stream from model {model}")
+        except asyncio.TimeoutError as e:
+            if emitted:
+                raise
+            logger.warning(f"OpenRouter model {model} stream timed out, trying next model")
+            await circuit_breaker.arecord_failure('openrouter', model)
+            model_scoreboard.record('openrouter', 'advice_stream', model, ok=False)
+            last_error = e
+        except aiohttp.ClientResponseError:
+            raise
+        except aiohttp.ClientConnectionError as e:
+            if emitted:
+                raise
+            logger.warning(f"OpenRouter model {model} unreachable: {e}, trying next model")
+            await circuit_breaker.arecord_failure('openrouter', model)
+            model_scoreboard.record('openrouter', 'advice_stream', model, ok=False)
+            last_error = e
+        except Exception as e:
+            if emitted:
+                raise
+            logger.warning(f"OpenRouter model {model} stream failed: {e}, trying next model")
+            last_error = e
+    if last_error is None:
+        raise circuit_breaker.CircuitOpenError("All OpenRouter models are circuit-open")
+    raise last_error
+
+estimate_nutrition = ai_http.sync(aestimate_nutrition)
+estimate_nutrition_from_image = ai_http.sync(aestimate_nutrition_from_image)
+parse_and_estimate_foods = ai_http.sync(aparse_and_estimate_foods)
+parse_and_estimate_foods_batch = ai_http.sync(aparse_and_estimate_foods_batch)
+modify_food_estimation = ai_http.sync(amodify_food_estimation)
+generate_diet_advice = ai_http.sync(agenerate_diet_advice)
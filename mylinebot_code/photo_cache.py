@@ -0,0 +1,162 @@
+"""
+Perceptual-hash cache for food photo estimates.
+
+Re-sent or near-identical photos of the same meal shouldn't cost another
+vision-model call. Each photo gets a 64-bit difference hash (dHash) via
+Pillow; ai_api compares it against the hashes of recent cached photos —
+the user's own first, then everyone's — and reuses the closest result when
+the Hamming distance is within the scope's threshold.
+
+Across users only an identical hash is reused by default
+(PHOTO_HASH_GLOBAL_THRESHOLD=0, -1 turns the global scope off): two different
+bento boxes on the same tray can be a few bits apart, and another user's
+estimate for a different meal is worse than a vision call. The looser
+threshold applies to the user's own photos, where a near match is almost
+always a re-sent or re-taken shot of the same meal.
+
+The nearest-neighbour index is the most recent PHOTO_CACHE_INDEX_SIZE
+hashes per scope, read from the DB (so every worker sees the same cache)
+and scanned with popcount, which takes microseconds at this size.
+"""
+import io
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Max differing bits (of 64) for a photo to count as the same meal (-1: scope off)
+USER_THRESHOLD = int(getattr(settings, 'PHOTO_HASH_USER_THRESHOLD', 6))
+GLOBAL_THRESHOLD = int(getattr(settings, 'PHOTO_HASH_GLOBAL_THRESHOLD', 0))
+INDEX_SIZE = int(getattr(settings, 'PHOTO_CACHE_INDEX_SIZE', 500))
+CACHE_TTL = timedelta(days=float(getattr(settings, 'PHOTO_CACHE_TTL_DAYS', 30)))
+MAX_ENTRIES = int(getattr(settings, 'PHOTO_CACHE_MAX_ENTRIES', 5000))
+
+_HASH_SIZE = 8
+_MASK = (1 << 64) - 1
+
+_stats = {
+    'hits_user': 0,
+    'hits_global': 0,
+    'misses': 0,
+    'stores': 0,
+    'hash_failures': 0,
+    'hit_distance_total': 0,
+}
+
+
+def dhash(image_bytes):
+    """
+    64-bit difference hash: grayscale, shrink to 9x8, one bit per
+    left/right brightness comparison. Returned as a signed int for BigIntegerField.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        small = img.convert('L').resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.LANCZOS)
+        pixels = list(small.getdata())
+
+    value = 0
+    for row in range(_HASH_SIZE):
+        offset = row * (_HASH_SIZE + 1)
+        for col in range(_HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a, b):
+    """Number of differing bits between two 64-bit hashes."""
+    return ((a ^ b) & _MASK).bit_count()
+
+
+def _nearest(candidates, photo_hash, threshold):
+    """Return (id, distance) of the closest (id, hash) within threshold, or None."""
+    best = None
+    for pk, candidate in candidates:
+        distance = hamming(photo_hash, candidate)
+        if distance <= threshold and (best is None or distance < best[1]):
+            best = (pk, distance)
+            if distance == 0:
+                break
+    return best
+
+
+def lookup(image_bytes, user_id=None):
+    """
+    Return (photo_hash, cached_result). cached_result is None on a miss;
+    photo_hash is None if the image couldn't be hashed (then don't store).
+    """
+    from django.db.models import F
+    from django.utils import timezone
+    from .models import PhotoEstimateCache
+
+    try:
+        photo_hash = dhash(image_bytes)
+    except Exception as e:
+        _stats['hash_failures'] += 1
+        logger.warning(f"Could not hash food photo: {e}")
+        return None, None
+
+    try:
+        recent = PhotoEstimateCache.objects.filter(created_at__gte=timezone.now() - CACHE_TTL)
+        scopes = [('global', recent, GLOBAL_THRESHOLD)]
+        if user_id:
+            scopes.insert(0, ('user', recent.filter(user_id=user_id), USER_THRESHOLD))
+
+        for scope, entries, threshold in scopes:
+            if threshold < 0:
+                continue
+            if threshold == 0:
+                entries = entries.filter(dhash=photo_hash)
+            index = entries.order_by('-created_at').values_list('id', 'dhash')[:INDEX_SIZE]
+            match = _nearest(index, photo_hash, threshold)
+            if match is None:
+                continue
+            pk, distance = match
+            row = PhotoEstimateCache.objects.filter(pk=pk).values_list('result', flat=True).first()
+            if row is None:
+                continue
+            PhotoEstimateCache.objects.filter(pk=pk).update(hit_count=F('hit_count') + 1)
+            _stats[f'hits_{scope}'] += 1
+            _stats['hit_distance_total'] += distance
+            logger.info(f"Photo cache hit ({scope}, distance {distance}): {row.get('food_name')}")
+            return photo_hash, row
+    except Exception as e:
+        logger.warning(f"Photo cache lookup failed: {e}")
+
+    _stats['misses'] += 1
+    return photo_hash, None
+
+
+def store(photo_hash, result, user_id=None):
+    """Cache a successful photo estimate and trim expired / excess entries."""
+    from django.utils import timezone
+    from .models import PhotoEstimateCache
+
+    if photo_hash is None:
+        return
+    try:
+        PhotoEstimateCache.objects.create(user_id=user_id or '', dhash=photo_hash, result=result)
+        _stats['stores'] += 1
+
+        PhotoEstimateCache.objects.filter(created_at__lt=timezone.now() - CACHE_TTL).delete()
+        excess = PhotoEstimateCache.objects.count() - MAX_ENTRIES
+        if excess > 0:
+            ids = list(PhotoEstimateCache.objects.order_by('created_at').values_list('id', flat=True)[:excess])
+            PhotoEstimateCache.objects.filter(id__in=ids).delete()
+    except Exception as e:
+        logger.warning(f"Photo cache store failed: {e}")
+
+
+def stats():
+    """Return process-local hit/miss counters, hit rate and mean hit distance, plus thresholds."""
+    hits = _stats['hits_user'] + _stats['hits_global']
+    lookups = hits + _stats['misses']
+    return {
+        **{k: v for k, v in _stats.items() if k != 'hit_distance_total'},
+        'hit_rate': round(hits / lookups, 3) if lookups else None,
+        'mean_hit_distance': round(_stats['hit_distance_total'] / hits, 2) if hits else None,
+        'user_threshold': USER_THRESHOLD,
+        'global_threshold': GLOBAL_THRESHOLD,
+    }
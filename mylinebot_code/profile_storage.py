@@ -1,11 +1,13 @@
 """
-CRUD for UserProfile, with Gist write-through backup.
+CRUD for UserProfile, with journaled Gist backup.
 Follows the same lazy-import pattern as dietary_storage.py.
 """
 import logging
 
 logger = logging.getLogger(__name__)
 
+GOAL_DISPLAY = {'bulk': '增肌', 'maintain': '維持', 'cut': '減脂'}
+
 
 def get_profile(user_id):
     """Return UserProfile instance or None."""
@@ -14,37 +16,46 @@ def get_profile(user_id):
     return UserProfile.objects.filter(user_id=user_id).first()
 
 
+def get_goal_label(user_id):
+    """Return Chinese goal label for a user, or empty string if not set."""
+    profile = get_profile(user_id)
+    if profile and profile.goal:
+        return GOAL_DISPLAY.get(profile.goal, '')
+    return ''
+
+
 def save_profile(user_id, data):
     """
     Create or update a user profile from a dict with keys:
     gender, height, weight, age.
-    Syncs to Gist after save.
+    Schedules a Gist backup after save.
     """
     from .models import UserProfile
-    from .gist_storage import save_profiles_to_gist
-
-    UserProfile.objects.update_or_create(
-        user_id=user_id,
-        defaults={
-            'gender': data['gender'],
-            'height': data['height'],
-            'weight': data['weight'],
-            'age': data['age'],
-        },
-    )
-
-    save_profiles_to_gist()
+    from .unit_of_work import atomic, defer_backup
+
+    with atomic():
+        UserProfile.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'gender': data['gender'],
+                'height': data['height'],
+                'weight': data['weight'],
+                'age': data['age'],
+            },
+        )
+
+    defer_backup('profiles')
     return True
 
 
 def update_profile_goal(user_id, activity_level, goal):
     """
     Update activity_level and goal on an existing profile.
-    Syncs to Gist after save.
+    Schedules a Gist backup after save.
     Returns True on success, False if profile not found.
     """
     from .models import UserProfile
-    from .gist_storage import save_profiles_to_gist
+    from .unit_of_work import atomic, defer_backup
 
     profile = UserProfile.objects.filter(user_id=user_id).first()
     if not profile:
@@ -52,7 +63,8 @@ def update_profile_goal(user_id, activity_level, goal):
 
     profile.activity_level = activity_level
     profile.goal = goal
-    profile.save()
+    with atomic():
+        profile.save()
 
-    save_profiles_to_gist()
+    defer_backup('profiles')
     return True
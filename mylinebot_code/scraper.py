@@ -99,9 +99,10 @@ def parse_forum():
     # Keep only the 20 newest articles
     cleanup_old_articles(keep=20)
 
-    # Save to Gist for persistence across Render restarts
-    from .gist_storage import save_articles_to_gist
-    save_articles_to_gist()
+    # Save to Gist for persistence across Render restarts: the web worker's syncer
+    # uploads it, and the parse_forum command flushes the journal before exiting
+    from .backup_journal import record_mutation
+    record_mutation('articles')
 
     return new_articles
 
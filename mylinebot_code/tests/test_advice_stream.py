@@ -0,0 +1,116 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from mylinebot_code import ai_api
+from mylinebot_code.dietary_storage import add_food_entry, get_cached_advice
+
+
+def _events(response):
+    """Parse an SSE body into [(event, data)], skipping comments."""
+    body = b''.join(response.streaming_content).decode('utf-8')
+    events = []
+    for frame in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in frame.splitlines() if not line.startswith(':'))
+        if fields:
+            events.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return events
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('mylinebot_code.liff_views._get_liff_user_id', return_value='U1')
+class AdviceStreamApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        add_food_entry('U1', {'name': 'rice', 'calories': 300})
+
+    def _post(self, body=None):
+        return self.client.post(
+            reverse('liff_api_advice_stream'), data=json.dumps(body or {}), content_type='application/json',
+        )
+
+    def test_streams_deltas_then_done_and_caches(self, _user):
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice', return_value=iter(['多吃', '蔬菜'])) as stream:
+            response = self._post({'prompt': '晚餐？'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            self.assertEqual(_events(response), [
+                ('message', {'delta': '多吃'}),
+                ('message', {'delta': '蔬菜'}),
+                ('done', {'text': '多吃蔬菜', 'cached': False}),
+            ])
+        self.assertEqual(stream.call_args.args[2], '晚餐？')
+        self.assertEqual(get_cached_advice('U1', None, '晚餐？', stream.call_args.args[3]), '多吃蔬菜')
+
+    def test_cached_advice_is_sent_at_once(self, _user):
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice', return_value=iter(['ok'])):
+            b''.join(self._post().streaming_content)
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice') as stream:
+            self.assertEqual(_events(self._post()), [('done', {'text': 'ok', 'cached': True})])
+        stream.assert_not_called()
+
+    def test_new_entry_invalidates_cached_advice(self, _user):
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice', return_value=iter(['ok'])):
+            b''.join(self._post().streaming_content)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_food_entry('U1', {'name': 'cake', 'calories': 400})
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice', return_value=iter(['less cake'])):
+            self.assertEqual(_events(self._post())[-1], ('done', {'text': 'less cake', 'cached': False}))
+
+    def test_provider_failure_sends_an_error_event(self, _user):
+        def broken(*args):
+            yield '一半'
+            raise RuntimeError('stream reset')
+
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice', side_effect=broken):
+            events = _events(self._post())
+        self.assertEqual(events[0], ('message', {'delta': '一半'}))
+        self.assertEqual(events[-1][0], 'error')
+
+    def test_empty_advice_is_an_error(self, _user):
+        with mock.patch('mylinebot_code.liff_views.stream_diet_advice', return_value=iter(['  '])):
+            self.assertEqual(_events(self._post())[-1][0], 'error')
+
+    def test_request_errors(self, user):
+        self.assertEqual(self.client.get(reverse('liff_api_advice_stream')).status_code, 405)
+        response = self.client.post(reverse('liff_api_advice_stream'), data='{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        user.return_value = 'U2'
+        self.assertEqual(self._post().status_code, 422)
+        user.return_value = None
+        self.assertEqual(self._post().status_code, 401)
+
+
+def _streamer(*chunks, error=None):
+    async def astream_diet_advice(foods, tdee, user_prompt, goal):
+        for chunk in chunks:
+            yield chunk
+        if error is not None:
+            raise error
+
+    return SimpleNamespace(__name__='provider', astream_diet_advice=astream_diet_advice)
+
+
+class AdviceProviderStreamTests(SimpleTestCase):
+    def _collect(self, primary, fallback):
+        async def collect():
+            return [chunk async for chunk in ai_api.astream_diet_advice([], None)]
+
+        with mock.patch.object(ai_api, '_primary', primary), mock.patch.object(ai_api, '_fallback', fallback):
+            return asyncio.run(collect())
+
+    def test_primary_chunks_are_passed_through(self):
+        self.assertEqual(self._collect(_streamer('a', 'b'), _streamer('x')), ['a', 'b'])
+
+    def test_falls_back_if_primary_fails_before_any_text(self):
+        self.assertEqual(self._collect(_streamer(error=RuntimeError('no key')), _streamer('x')), ['x'])
+        self.assertEqual(self._collect(_streamer(), _streamer('x')), ['x'])
+
+    def test_failure_mid_stream_is_raised(self):
+        with self.assertRaises(RuntimeError):
+            self._collect(_streamer('a', error=RuntimeError('reset')), _streamer('x'))
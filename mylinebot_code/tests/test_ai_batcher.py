@@ -0,0 +1,123 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from mylinebot_code import ai_batcher, gemini_api
+from mylinebot_code.ai_batcher import MicroBatcher
+
+
+class _Provider:
+    """Records batch/solo calls; answers each item with its upper-case text."""
+
+    def __init__(self, batch_answer=None, batch_error=None, solo_error=None):
+        self.batches, self.solos = [], []
+        self.batch_answer = batch_answer
+        self.batch_error = batch_error
+        self.solo_error = solo_error
+
+    async def batch(self, items):
+        self.batches.append(items)
+        if self.batch_error:
+            raise self.batch_error
+        if self.batch_answer is not None:
+            return self.batch_answer(items)
+        return [item.upper() for item in items]
+
+    async def solo(self, item):
+        self.solos.append(item)
+        if self.solo_error:
+            raise self.solo_error
+        return f'solo {item}'
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(ai_batcher._stats, {k: 0 for k in ai_batcher._stats})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _submit(self, provider, *items, window=0.02, max_items=8):
+        batcher = MicroBatcher(provider.batch, provider.solo, window=window, max_items=max_items)
+
+        async def run():
+            return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+
+        return asyncio.run(run())
+
+    def test_concurrent_items_share_one_batch(self):
+        provider = _Provider()
+        self.assertEqual(self._submit(provider, 'rice', 'egg', 'tea'), ['RICE', 'EGG', 'TEA'])
+        self.assertEqual((provider.batches, provider.solos), ([['rice', 'egg', 'tea']], []))
+        stats = ai_batcher.stats()
+        self.assertEqual((stats['batches'], stats['batched_requests'], stats['avg_batch_size']), (1, 3, 3))
+
+    def test_identical_items_are_asked_once(self):
+        provider = _Provider()
+        self.assertEqual(self._submit(provider, 'rice', 'egg', 'rice'), ['RICE', 'EGG', 'RICE'])
+        self.assertEqual(provider.batches, [['rice', 'egg']])
+
+    def test_lone_item_goes_solo(self):
+        provider = _Provider()
+        self.assertEqual(self._submit(provider, 'rice', 'rice'), ['solo rice', 'solo rice'])
+        self.assertEqual((provider.batches, provider.solos), ([], ['rice']))
+        self.assertEqual(ai_batcher.stats()['solo'], 1)
+
+    def test_window_zero_is_unbatched(self):
+        provider = _Provider()
+        self.assertEqual(self._submit(provider, 'rice', 'egg', window=0), ['solo rice', 'solo egg'])
+        self.assertEqual(provider.batches, [])
+        self.assertEqual(ai_batcher.stats()['requests'], 0)
+
+    def test_full_queue_flushes_before_the_window(self):
+        provider = _Provider()
+        self._submit(provider, 'a', 'b', 'c', 'd', 'e', window=0.05, max_items=2)
+        self.assertEqual(provider.batches, [['a', 'b'], ['c', 'd']])
+        self.assertEqual(provider.solos, ['e'])
+
+    def test_unanswered_items_are_retried_solo(self):
+        provider = _Provider(batch_answer=lambda items: [items[0].upper(), None, items[2].upper()])
+        self.assertEqual(self._submit(provider, 'rice', 'egg', 'tea'), ['RICE', 'solo egg', 'TEA'])
+        self.assertEqual(provider.solos, ['egg'])
+        self.assertEqual(ai_batcher.stats()['solo_retries'], 1)
+
+    def test_failed_batch_is_retried_solo(self):
+        for provider in (_Provider(batch_error=RuntimeError('503')), _Provider(batch_answer=lambda items: None)):
+            self.assertEqual(self._submit(provider, 'rice', 'egg'), ['solo rice', 'solo egg'])
+
+    def test_solo_errors_reach_every_caller_of_the_item(self):
+        provider = _Provider(batch_answer=lambda items: [None, 'EGG'], solo_error=RuntimeError('down'))
+        results = self._submit(provider, 'rice', 'egg', 'rice')
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertIs(results[0], results[2])
+        self.assertEqual(results[1], 'EGG')
+
+    def test_cancelled_caller_is_dropped_from_the_batch(self):
+        provider = _Provider()
+        batcher = MicroBatcher(provider.batch, provider.solo, window=0.02)
+
+        async def run():
+            first = asyncio.ensure_future(batcher.submit('rice'))
+            others = [asyncio.ensure_future(batcher.submit(item)) for item in ('egg', 'tea')]
+            await asyncio.sleep(0)
+            first.cancel()
+            return await asyncio.gather(*others)
+
+        self.assertEqual(asyncio.run(run()), ['EGG', 'TEA'])
+        self.assertEqual(provider.batches, [['egg', 'tea']])
+
+
+class ProviderBatchTests(SimpleTestCase):
+    def test_gemini_batch_answer_is_aligned_with_the_meals(self):
+        rice = [{'name': 'rice', 'description': '', 'calories': 300.0, 'protein': 5.0,
+                 'carbs': 60.0, 'fat': 1.0, 'basis': ''}]
+        answer = {'meals': [{'id': 2, 'foods': rice}]}
+        with mock.patch.object(gemini_api, 'GEMINI_API_KEY', 'key'), \
+                mock.patch.object(gemini_api, '_gemini_request', mock.AsyncMock(return_value=answer)):
+            result = asyncio.run(gemini_api.aparse_and_estimate_foods_batch(['egg', 'rice']))
+        self.assertEqual(result, [None, rice])
+
+    def test_gemini_batch_failure_returns_none(self):
+        with mock.patch.object(gemini_api, 'GEMINI_API_KEY', 'key'), \
+                mock.patch.object(gemini_api, '_gemini_request', mock.AsyncMock(side_effect=RuntimeError('503'))):
+            self.assertIsNone(asyncio.run(gemini_api.aparse_and_estimate_foods_batch(['egg', 'rice'])))
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from mylinebot_code import ai_api, ai_http
+
+
+async def _lines(*lines):
+    for line in lines:
+        yield line
+
+
+class AiHttpTests(SimpleTestCase):
+    def test_sync_wrapper_runs_on_the_shared_loop(self):
+        async def aestimate(x):
+            await asyncio.sleep(0)
+            return x * 2, threading.current_thread().name
+
+        estimate = ai_http.sync(aestimate)
+        self.assertEqual(estimate.__name__, 'estimate')
+        self.assertEqual(estimate(21), (42, 'ai-http'))
+
+    def test_errors_propagate_to_the_caller(self):
+        async def fail():
+            raise ValueError('bad answer')
+
+        with self.assertRaises(ValueError):
+            ai_http.run(fail())
+
+    def test_run_refuses_to_block_its_own_loop(self):
+        async def nested():
+            ai_http.run(asyncio.sleep(0))
+
+        with self.assertRaises(RuntimeError):
+            ai_http.run(nested())
+
+    def test_iterate_drives_an_async_generator(self):
+        closed = []
+
+        async def agen():
+            try:
+                for i in range(3):
+                    yield i
+            finally:
+                closed.append(True)
+
+        self.assertEqual(list(ai_http.iterate(agen())), [0, 1, 2])
+        items = ai_http.iterate(agen())
+        next(items)
+        items.close()
+        self.assertEqual(closed, [True, True])
+
+    def test_session_is_shared(self):
+        async def twice():
+            return await ai_http.session() is await ai_http.session()
+
+        self.assertTrue(ai_http.run(twice()))
+
+    def test_sse_data_joins_multiline_events(self):
+        response = SimpleNamespace(content=_lines(
+            b'data: {"a": 1}\r\n', b'\r\n',
+            b': keep-alive\n', b'\n',
+            b'data: line one\n', b'data:line two\n', b'\n',
+            b'data: [DONE]\n',
+        ))
+
+        async def collect():
+            return [event async for event in ai_http.sse_data(response)]
+
+        self.assertEqual(asyncio.run(collect()), ['{"a": 1}', 'line one\nline two', '[DONE]'])
+
+
+class UnhedgedCallTests(SimpleTestCase):
+    def _call(self, primary):
+        async def fallback(text):
+            return {'calories': 1.0}
+
+        with mock.patch.dict(ai_api._HEDGE_DELAYS, {'text': 0}), \
+                mock.patch.object(ai_api, '_primary', SimpleNamespace(aestimate_nutrition=primary)), \
+                mock.patch.object(ai_api, '_fallback', SimpleNamespace(aestimate_nutrition=fallback)):
+            return asyncio.run(ai_api._acall('text', 'estimate_nutrition', ai_api._has_calories, 'rice'))
+
+    def test_primary_answer_is_used(self):
+        async def primary(text):
+            return {'calories': 300.0}
+
+        self.assertEqual(self._call(primary), {'calories': 300.0})
+
+    def test_primary_error_falls_back(self):
+        async def primary(text):
+            raise ConnectionError('reset')
+
+        self.assertEqual(self._call(primary), {'calories': 1.0})
+
+    def test_invalid_primary_answer_falls_back(self):
+        async def primary(text):
+            return {'calories': None}
+
+        self.assertEqual(self._call(primary), {'calories': 1.0})
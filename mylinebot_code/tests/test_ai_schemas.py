@@ -0,0 +1,91 @@
+import copy
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from mylinebot_code import ai_schemas
+from mylinebot_code.ai_schemas import FOODS, FOODS_BATCH, MODIFY, NUTRITION, PHOTO, SchemaError, parse
+
+
+class ParseTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ai_schemas, '_stats', copy.deepcopy(ai_schemas._stats))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_plain_and_fenced_json(self):
+        expected = {'calories': 350.0, 'protein': 12.0, 'carbs': 50.0, 'fat': 11.0, 'basis': '1 bowl'}
+        plain = '{"calories": 350, "protein": 12, "carbs": 50, "fat": 11, "basis": "1 bowl"}'
+        self.assertEqual(parse(NUTRITION, plain), expected)
+        self.assertEqual(parse(NUTRITION, f'```json\n{plain}\n```'), expected)
+        self.assertEqual(parse(NUTRITION, f'json {plain}'), expected)
+        self.assertEqual(ai_schemas.stats()['schemas'][NUTRITION]['ok'], 3)
+
+    def test_chatty_truncated_and_trailing_comma_answers_are_repaired(self):
+        self.assertEqual(parse(NUTRITION, 'Sure! Here you go: {"calories": 200,} Enjoy.')['calories'], 200)
+        self.assertEqual(parse(NUTRITION, '{"calories": 200, "basis": "a {brace}"')['basis'], 'a {brace}')
+        foods = parse(FOODS, '[{"name": "rice", "calories": 300}, {"name": "egg", "calories": 80},')
+        self.assertEqual([f['name'] for f in foods], ['rice', 'egg'])
+        self.assertEqual(ai_schemas.stats()['schemas'][NUTRITION]['repaired'], 2)
+
+    def test_unrepairable_answers_fail(self):
+        for text in ('no idea', '{"calories": 200, "basis": "cut off', '', None):
+            with self.assertRaises(SchemaError):
+                parse(NUTRITION, text)
+
+    def test_calorie_strings_are_coerced(self):
+        answer = parse(NUTRITION, '{"calories": "約1,200 kcal", "protein": "12g", "carbs": -5, "fat": 3}')
+        self.assertEqual((answer['calories'], answer['protein'], answer['carbs']), (1200, 12, 0))
+
+    def test_missing_or_null_calories_are_rejected(self):
+        for text in ('{"protein": 10}', '{"calories": null}', '{"calories": ""}', '{"calories": true}'):
+            with self.assertRaises(SchemaError):
+                parse(NUTRITION, text)
+        self.assertEqual(parse(NUTRITION, '{"calories": 90}')['fat'], 0)
+
+    def test_photo_food_name_may_be_null(self):
+        self.assertIsNone(parse(PHOTO, '{"food_name": "  ", "calories": 0}')['food_name'])
+        self.assertEqual(parse(PHOTO, '{"food_name": "便當", "calories": 700}')['food_name'], '便當')
+
+    def test_foods_wrappers(self):
+        self.assertEqual(parse(FOODS, '{"foods": [{"name": "rice", "calories": 300}]}')[0]['name'], 'rice')
+        self.assertEqual(parse(FOODS, '{"name": "rice", "calories": 300}')[0]['calories'], 300)
+        for text in ('[]', '[{"name": "", "calories": 1}]'):
+            with self.assertRaises(SchemaError):
+                parse(FOODS, text)
+
+    def test_modify_keeps_an_empty_name(self):
+        self.assertEqual(parse(MODIFY, '{"calories": 500}')['name'], '')
+
+    def test_batch_answers(self):
+        answer = parse(FOODS_BATCH, '[{"id": 2, "foods": [{"name": "egg", "calories": 80}]}, {"id": 1}]')
+        self.assertEqual(ai_schemas.unpack_batch(answer, 3), [None, answer['meals'][0]['foods'], None])
+        answer = parse(FOODS_BATCH, '{"meals": [{"id": 9, "foods": [{"name": "x", "calories": 1}]}]}')
+        self.assertEqual(ai_schemas.unpack_batch(answer, 2), [None, None])
+
+    def test_failures_are_reported_to_the_calling_provider(self):
+        failures = []
+        token = ai_schemas.parse_failures.set(failures)
+        try:
+            with self.assertRaises(SchemaError):
+                parse(PHOTO, 'not json')
+        finally:
+            ai_schemas.parse_failures.reset(token)
+        self.assertEqual(failures, [PHOTO])
+        self.assertEqual(ai_schemas.stats()['schemas'][PHOTO]['failure_rate'], 1.0)
+
+
+class GeminiSchemaTests(SimpleTestCase):
+    def test_every_field_is_required(self):
+        schema = ai_schemas.gemini_schema(NUTRITION)
+        self.assertEqual(schema['type'], 'OBJECT')
+        self.assertEqual(set(schema['required']), {'calories', 'protein', 'carbs', 'fat', 'basis'})
+        self.assertEqual(schema['properties']['calories']['type'], 'NUMBER')
+
+    def test_nested_and_nullable_fields(self):
+        self.assertTrue(ai_schemas.gemini_schema(PHOTO)['properties']['food_name']['nullable'])
+        foods = ai_schemas.gemini_schema(FOODS)
+        self.assertEqual((foods['type'], foods['minItems']), ('ARRAY', 1))
+        self.assertIn('name', foods['items']['required'])
+        meals = ai_schemas.gemini_schema(FOODS_BATCH)['properties']['meals']['items']
+        self.assertEqual(meals['properties']['foods']['items']['type'], 'OBJECT')
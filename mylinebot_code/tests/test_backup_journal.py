@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+from mylinebot_code import backup_journal
+
+
+class BackupJournalTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'journal.log')
+        for target, value in [
+            ('mylinebot_code.backup_journal.JOURNAL_PATH', self.path),
+            ('mylinebot_code.backup_journal._gist_configured', mock.Mock(return_value=True)),
+            ('mylinebot_code.backup_journal.start_syncer', mock.Mock()),
+            ('mylinebot_code.backup_lease.acquire_lease', mock.Mock(return_value=True)),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.saved = []
+        self.savers = {
+            name: mock.Mock(side_effect=lambda name=name: self.saved.append(name) or True)
+            for name in ('articles', 'users', 'targets', 'dietary', 'profiles')
+        }
+        patcher = mock.patch('mylinebot_code.backup_journal._savers', return_value=self.savers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _lines(self):
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_record_mutation_appends_a_mark_without_uploading(self):
+        self.assertTrue(backup_journal.record_mutation('dietary'))
+        self.assertEqual([r['op'] for r in self._lines()], ['mark'])
+        self.assertEqual(list(backup_journal.pending_datasets()), ['dietary'])
+        self.assertEqual(self.saved, [])
+
+    def test_marks_left_by_a_crashed_process_are_replayed(self):
+        backup_journal.record_mutation('dietary')
+        backup_journal.record_mutation('profiles')
+        # The process dies mid-write: a torn last line is all that's left of a third mark
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"op": "mark", "data')
+
+        self.assertEqual(sorted(backup_journal.pending_datasets()), ['dietary', 'profiles'])
+        self.assertEqual(backup_journal.drain(), 2)
+        self.assertEqual(sorted(self.saved), ['dietary', 'profiles'])
+        self.assertEqual(backup_journal.pending_datasets(), {})
+
+    def test_drain_uploads_each_dataset_once_and_compacts(self):
+        for _ in range(3):
+            backup_journal.record_mutation('dietary')
+        self.assertEqual(backup_journal.drain(), 1)
+        self.assertEqual(self.saved, ['dietary'])
+        self.assertEqual(self._lines(), [])
+
+    def test_failed_upload_stays_pending_for_the_next_pass(self):
+        self.savers['dietary'].side_effect = None
+        self.savers['dietary'].return_value = False
+        backup_journal.record_mutation('dietary')
+
+        self.assertEqual(backup_journal.drain(), 0)
+        self.assertEqual(list(backup_journal.pending_datasets()), ['dietary'])
+
+        self.savers['dietary'].return_value = True
+        self.assertEqual(backup_journal.drain(), 1)
+        self.assertEqual(backup_journal.pending_datasets(), {})
+
+    def test_mark_after_an_upload_started_stays_pending(self):
+        backup_journal.record_mutation('dietary')
+        # A write lands while the upload is in flight: its mark is newer than the ack
+        self.savers['dietary'].side_effect = lambda: backup_journal.record_mutation('dietary') or True
+
+        backup_journal.drain()
+        self.assertEqual(list(backup_journal.pending_datasets()), ['dietary'])
+
+    def test_nothing_is_journaled_without_gist(self):
+        backup_journal._gist_configured.return_value = False
+        self.assertFalse(backup_journal.record_mutation('dietary'))
+        self.assertFalse(os.path.exists(self.path))
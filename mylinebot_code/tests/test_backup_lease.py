@@ -0,0 +1,74 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from mylinebot_code import backup_journal
+from mylinebot_code.backup_lease import acquire_lease, current_holder, release_lease
+from mylinebot_code.models import BackupLease
+
+
+class BackupLeaseTests(TestCase):
+    def test_first_caller_takes_the_lease(self):
+        self.assertTrue(acquire_lease('sync', holder='a'))
+        self.assertEqual(current_holder('sync'), 'a')
+
+    def test_live_lease_is_not_stolen(self):
+        acquire_lease('sync', holder='a')
+        self.assertFalse(acquire_lease('sync', holder='b'))
+        self.assertEqual(current_holder('sync'), 'a')
+
+    def test_holder_renews_its_lease(self):
+        acquire_lease('sync', holder='a', ttl=1)
+        before = BackupLease.objects.get(name='sync').expires_at
+        self.assertTrue(acquire_lease('sync', holder='a', ttl=60))
+        self.assertGreater(BackupLease.objects.get(name='sync').expires_at, before)
+
+    def test_expired_lease_passes_to_the_next_caller(self):
+        BackupLease.objects.create(name='sync', holder='dead', expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(current_holder('sync'))
+        self.assertTrue(acquire_lease('sync', holder='b'))
+        self.assertEqual(current_holder('sync'), 'b')
+
+    def test_release_lets_another_worker_take_over(self):
+        acquire_lease('sync', holder='a')
+        release_lease('sync', holder='b')  # not ours: no effect
+        self.assertEqual(current_holder('sync'), 'a')
+        release_lease('sync', holder='a')
+        self.assertTrue(acquire_lease('sync', holder='b'))
+
+    def test_leases_are_independent_by_name(self):
+        acquire_lease('sync', holder='a')
+        self.assertTrue(acquire_lease('retention', holder='b'))
+
+
+@mock.patch('mylinebot_code.backup_journal.start_syncer')
+@mock.patch('mylinebot_code.backup_journal._gist_configured', return_value=True)
+class SyncerLeaseTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(backup_journal, 'JOURNAL_PATH', os.path.join(tmp.name, 'journal.log'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.saver = mock.Mock(return_value=True)
+        patcher = mock.patch.object(backup_journal, '_savers', return_value={'dietary': self.saver})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_the_lease_holder_drains(self, *_):
+        acquire_lease(backup_journal.LEASE_NAME, holder='other-worker')
+        backup_journal.record_mutation('dietary')
+
+        self.assertEqual(backup_journal.drain(), 0)
+        self.saver.assert_not_called()
+        self.assertEqual(list(backup_journal.pending_datasets()), ['dietary'])
+
+    def test_drain_takes_a_free_lease(self, *_):
+        backup_journal.record_mutation('dietary')
+
+        self.assertEqual(backup_journal.drain(), 1)
+        self.assertTrue(backup_journal.stats()['is_leader'])
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from email.utils import formatdate
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from mylinebot_code import ai_http, circuit_breaker, gemini_api, openrouter_api
+from mylinebot_code.circuit_breaker import allow, record_failure, record_success
+
+MODEL = 'gemini-2.5-flash-lite'
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _reopens_in(self):
+        return circuit_breaker.stats()[f'gemini/{MODEL}']['reopens_in']
+
+    def test_trips_after_consecutive_failures(self):
+        record_failure('gemini', MODEL, 503)
+        self.assertTrue(allow('gemini', MODEL))
+        record_failure('gemini', MODEL)
+        self.assertFalse(allow('gemini', MODEL))
+        self.assertAlmostEqual(self._reopens_in(), circuit_breaker.DEFAULT_COOLDOWN, delta=1)
+
+    def test_success_resets_the_failure_count(self):
+        record_failure('gemini', MODEL, 500)
+        record_success('gemini', MODEL)
+        record_failure('gemini', MODEL, 500)
+        self.assertTrue(allow('gemini', MODEL))
+
+    def test_rate_limit_trips_at_once_honouring_retry_after(self):
+        record_failure('gemini', MODEL, 429, '120')
+        self.assertFalse(allow('gemini', MODEL))
+        self.assertAlmostEqual(self._reopens_in(), 120, delta=1)
+
+        record_failure('gemini', 'other', 429, formatdate(time.time() + 300, usegmt=True))
+        state = cache.get(circuit_breaker._key('gemini', 'other'))
+        self.assertAlmostEqual(state['open_until'] - time.time(), 300, delta=2)
+
+    def test_retry_after_parsing(self):
+        self.assertEqual(circuit_breaker._retry_after('7'), 7)
+        self.assertEqual(circuit_breaker._retry_after('-3'), 0)
+        self.assertIsNone(circuit_breaker._retry_after('soon'))
+        self.assertIsNone(circuit_breaker._retry_after(None))
+
+    def test_half_open_allows_a_single_probe(self):
+        record_failure('gemini', MODEL, 429, '0')
+        self.assertEqual([allow('gemini', MODEL) for _ in range(3)], [True, False, False])
+        self.assertEqual(circuit_breaker.stats()[f'gemini/{MODEL}']['state'], 'half-open')
+
+        record_success('gemini', MODEL)
+        self.assertEqual(circuit_breaker.stats()[f'gemini/{MODEL}']['state'], 'closed')
+        self.assertTrue(allow('gemini', MODEL))
+
+    def test_failed_probe_reopens_with_a_longer_cooldown(self):
+        record_failure('gemini', MODEL, 429)
+        state = cache.get(circuit_breaker._key('gemini', MODEL))
+        state['open_until'] = time.time() - 1
+        cache.set(circuit_breaker._key('gemini', MODEL), state)
+
+        self.assertTrue(allow('gemini', MODEL))
+        record_failure('gemini', MODEL)
+        self.assertFalse(allow('gemini', MODEL))
+        self.assertAlmostEqual(self._reopens_in(), circuit_breaker.DEFAULT_COOLDOWN * 2, delta=1)
+
+    def test_cooldown_is_capped(self):
+        record_failure('gemini', MODEL, 429, str(circuit_breaker.MAX_COOLDOWN * 10))
+        self.assertAlmostEqual(self._reopens_in(), circuit_breaker.MAX_COOLDOWN, delta=1)
+
+    def test_models_have_separate_breakers(self):
+        record_failure('gemini', MODEL, 429)
+        self.assertTrue(allow('gemini', 'gemini-2.5-flash'))
+        self.assertTrue(allow('openrouter', MODEL))
+
+    def test_async_wrappers(self):
+        async def scenario():
+            await circuit_breaker.arecord_failure('gemini', MODEL, 429)
+            blocked = await circuit_breaker.aallow('gemini', MODEL)
+            await circuit_breaker.arecord_success('gemini', MODEL)
+            return blocked, await circuit_breaker.aallow('gemini', MODEL)
+
+        self.assertEqual(asyncio.run(scenario()), (False, True))
+
+    def test_all_models_open_fails_without_a_request(self):
+        for model in gemini_api.GEMINI_MODELS:
+            record_failure('gemini', model, 429)
+        with mock.patch.object(ai_http, 'session', mock.AsyncMock()) as session:
+            with self.assertRaises(circuit_breaker.CircuitOpenError):
+                asyncio.run(gemini_api._gemini_request({}))
+        session.return_value.post.assert_not_called()
+
+    def test_stats_lists_vision_models(self):
+        with mock.patch.object(openrouter_api, 'VISION_MODELS', ['vision-only']):
+            record_failure('openrouter', 'vision-only', 429)
+            listed = circuit_breaker.stats()
+        self.assertEqual(listed['openrouter/vision-only']['state'], 'open')
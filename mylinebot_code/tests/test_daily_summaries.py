@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mylinebot_code.dietary_storage import _today_date, get_daily_summaries
+from mylinebot_code.models import DailyTotals, FoodEntry
+
+TODAY = date(2026, 3, 10)
+
+
+def _entry(day, calories, user_id='U1', **nutrients):
+    return FoodEntry.objects.create(user_id=user_id, date=day, name='food', calories=calories, **nutrients)
+
+
+@mock.patch('mylinebot_code.dietary_storage._today_date', return_value=TODAY)
+class DailySummaryTests(TestCase):
+    def test_sums_each_day_newest_first(self, _today):
+        _entry(TODAY, 300, protein=10)
+        _entry(TODAY, 200, protein=5)
+        _entry(TODAY - timedelta(days=2), 600)
+
+        summaries = get_daily_summaries('U1')
+        self.assertEqual(list(summaries), ['2026-03-10', '2026-03-08'])
+        self.assertEqual(
+            summaries['2026-03-10'], {'calories': 500, 'protein': 15, 'carbs': 0, 'fat': 0, 'item_count': 2},
+        )
+
+    def test_defaults_to_the_last_seven_days(self, _today):
+        _entry(TODAY - timedelta(days=7), 100)
+        _entry(TODAY - timedelta(days=8), 100)
+        self.assertEqual(list(get_daily_summaries('U1')), ['2026-03-03'])
+
+    def test_explicit_range_and_other_users(self, _today):
+        _entry(date(2026, 1, 5), 100)
+        _entry(date(2026, 1, 5), 900, user_id='U2')
+        _entry(date(2026, 2, 1), 100)
+        summaries = get_daily_summaries('U1', start=date(2026, 1, 1), end=date(2026, 1, 31))
+        self.assertEqual(list(summaries), ['2026-01-05'])
+        self.assertEqual((summaries['2026-01-05']['calories'], summaries['2026-01-05']['item_count']), (100, 1))
+
+    def test_null_nutrients_sum_to_zero(self, _today):
+        _entry(TODAY, None)
+        self.assertEqual(get_daily_summaries('U1')['2026-03-10']['calories'], 0)
+
+    def test_compacted_days_come_from_their_rollup(self, _today):
+        rolled = TODAY - timedelta(days=5)
+        DailyTotals.objects.create(user_id='U1', date=rolled, calories=1800, item_count=6, compacted=True)
+        _entry(TODAY - timedelta(days=4), 400)
+
+        summaries = get_daily_summaries('U1')
+        self.assertEqual(list(summaries), ['2026-03-06', '2026-03-05'])
+        self.assertEqual((summaries['2026-03-05']['calories'], summaries['2026-03-05']['item_count']), (1800, 6))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('mylinebot_code.liff_views._get_liff_user_id', return_value='U1')
+class EntriesApiSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_entries_api_returns_summaries(self, _user):
+        _entry(_today_date(), 250)
+        data = self.client.get(reverse('liff_api_entries')).json()
+        self.assertEqual(data['summaries'][_today_date().isoformat()]['calories'], 250)
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from mylinebot_code.dietary_storage import (
+    _today_date, add_entry_for_date, add_food_entries, delete_entry_by_id, get_daily_totals,
+    rebuild_daily_totals, remove_food_entries, update_entry_by_id, update_food_entry,
+)
+from mylinebot_code.models import DailyTotals, FoodEntry
+
+
+def _food(name, calories, protein=10, carbs=20, fat=5):
+    return {'name': name, 'calories': calories, 'protein': protein, 'carbs': carbs, 'fat': fat, 'basis': ''}
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DailyTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def assertTotals(self, calories, item_count, day=None):
+        totals = get_daily_totals('U1', day)
+        self.assertEqual((totals['calories'], totals['item_count']), (calories, item_count))
+
+    def test_zero_when_nothing_logged(self):
+        self.assertEqual(
+            get_daily_totals('U1'), {'calories': 0.0, 'protein': 0.0, 'carbs': 0.0, 'fat': 0.0, 'item_count': 0},
+        )
+
+    def test_add_accumulates(self):
+        add_food_entries('U1', [_food('rice', 300), _food('egg', 80, protein=6)])
+        add_food_entries('U1', [_food('tea', 120)])
+        self.assertTotals(500, 3)
+        self.assertEqual(get_daily_totals('U1')['protein'], 26)
+
+    def test_remove_subtracts(self):
+        add_food_entries('U1', [_food('rice', 300)])
+        add_food_entries('U1', [_food('egg', 80)])
+        remove_food_entries('U1', [1])
+        self.assertTotals(80, 1)
+
+    def test_update_applies_the_nutrient_change(self):
+        add_food_entries('U1', [_food('rice', 300)])
+        update_food_entry('U1', 1, {'calories': 450, 'name': 'big rice'})
+        self.assertTotals(450, 1)
+
+    def test_update_and_delete_by_id(self):
+        add_food_entries('U1', [_food('rice', 300)])
+        add_food_entries('U1', [_food('egg', 80)])
+        rice, egg = FoodEntry.objects.order_by('added_at')
+        update_entry_by_id(rice.id, 'U1', {'calories': 200})
+        delete_entry_by_id(egg.id, 'U1')
+        self.assertTotals(200, 1)
+
+    def test_other_users_entry_is_not_touched(self):
+        add_food_entries('U2', [_food('rice', 300)])
+        entry = FoodEntry.objects.get()
+        self.assertIsNone(delete_entry_by_id(entry.id, 'U1'))
+        self.assertEqual(get_daily_totals('U2')['calories'], 300)
+
+    def test_entries_for_another_date_go_to_that_day(self):
+        day = _today_date() - timedelta(days=2)
+        add_entry_for_date('U1', day.isoformat(), _food('dinner', 700))
+        self.assertTotals(700, 1, day)
+        self.assertTotals(0.0, 0)
+
+    def test_missing_nutrients_count_as_zero(self):
+        add_food_entries('U1', [{'name': 'unknown', 'calories': None}])
+        self.assertTotals(0, 1)
+
+    def test_rebuild_matches_incremental_totals(self):
+        add_food_entries('U1', [_food('rice', 300), _food('egg', 80)])
+        add_food_entries('U2', [_food('tea', 120)])
+        fields = ('user_id', 'date', 'calories', 'protein', 'carbs', 'fat', 'item_count')
+        expected = list(DailyTotals.objects.order_by('user_id').values_list(*fields))
+
+        DailyTotals.objects.update(calories=0, item_count=99)
+        self.assertEqual(rebuild_daily_totals(), 2)
+        self.assertEqual(list(DailyTotals.objects.order_by('user_id').values_list(*fields)), expected)
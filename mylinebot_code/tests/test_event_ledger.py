@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from mylinebot_code import event_ledger
+from mylinebot_code.dietary_storage import add_food_entry
+from mylinebot_code.event_ledger import claim_event, once_per_event, purge_expired
+from mylinebot_code.models import FoodEntry, ProcessedWebhookEvent
+from mylinebot_code.unit_of_work import unit_of_work
+
+
+def _event(event_id, redelivery=False):
+    return SimpleNamespace(webhook_event_id=event_id, delivery_context=SimpleNamespace(is_redelivery=redelivery))
+
+
+class _HandlerMixin:
+    def setUp(self):
+        cache.clear()
+        self.handled = []
+
+        @once_per_event
+        @unit_of_work()
+        def handle(event, fail=False, fail_early=False):
+            self.handled.append(event.webhook_event_id)
+            if fail_early:
+                raise RuntimeError('AI call failed')
+            add_food_entry('U1', {'name': 'rice', 'calories': 300})
+            if fail:
+                raise RuntimeError('reply failed')
+            return 'done'
+
+        self.handle = handle
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EventLedgerTests(_HandlerMixin, TestCase):
+    def test_redelivery_is_skipped(self):
+        self.assertEqual(self.handle(_event('E1')), 'done')
+        self.assertIsNone(self.handle(_event('E1', redelivery=True)))
+        self.assertEqual(self.handled, ['E1'])
+        self.assertEqual(FoodEntry.objects.count(), 1)
+
+    def test_distinct_events_are_all_handled(self):
+        self.handle(_event('E1'))
+        self.handle(_event('E2'))
+        self.assertEqual(self.handled, ['E1', 'E2'])
+
+    def test_events_without_an_id_always_run(self):
+        self.handle(SimpleNamespace(webhook_event_id=None))
+        self.handle(SimpleNamespace(webhook_event_id=None))
+        self.assertEqual(len(self.handled), 2)
+
+    def test_claim_is_atomic_per_event_id(self):
+        self.assertTrue(claim_event('E9'))
+        self.assertFalse(claim_event('E9'))
+
+    def test_purge_drops_only_expired_claims(self):
+        claim_event('old')
+        claim_event('new')
+        ProcessedWebhookEvent.objects.filter(event_id='old').update(
+            received_at=timezone.now() - timedelta(seconds=event_ledger.EVENT_TTL + 60),
+        )
+        self.assertEqual(purge_expired(), 1)
+        self.assertEqual(list(ProcessedWebhookEvent.objects.values_list('event_id', flat=True)), ['new'])
+
+    def test_claims_purge_at_most_once_per_interval(self):
+        with mock.patch.object(event_ledger, '_last_purge', time.monotonic() - event_ledger.PURGE_INTERVAL - 1), \
+                mock.patch.object(event_ledger, 'purge_expired') as purge:
+            claim_event('E1')
+            claim_event('E2')
+        purge.assert_called_once()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EventLedgerFailureTests(_HandlerMixin, TransactionTestCase):
+    def test_failure_before_any_write_releases_the_claim(self):
+        with self.assertRaises(RuntimeError):
+            self.handle(_event('E1'), fail_early=True)
+        self.assertFalse(ProcessedWebhookEvent.objects.exists())
+
+        self.assertEqual(self.handle(_event('E1', redelivery=True)), 'done')
+        self.assertEqual(FoodEntry.objects.count(), 1)
+
+    def test_failure_after_a_committed_write_keeps_the_claim(self):
+        with self.assertRaises(RuntimeError):
+            self.handle(_event('E1'), fail=True)
+        self.assertEqual(FoodEntry.objects.count(), 1)
+
+        self.assertIsNone(self.handle(_event('E1', redelivery=True)))
+        self.assertEqual(FoodEntry.objects.count(), 1)
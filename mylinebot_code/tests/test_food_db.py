@@ -0,0 +1,125 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from mylinebot_code import ai_api, food_db
+from mylinebot_code.food_db import build_index, lookup, split_items
+from mylinebot_code.models import NutritionCache
+
+CSV = (
+    'name,aliases,serving,calories,protein,carbs,fat\n'
+    '滷肉飯,魯肉飯|肉燥飯,1碗 ~200g,430,12,58,16\n'
+    '水餃,餃子,10顆 ~250g,500,20,55,22\n'
+    '珍珠奶茶,珍奶,1杯 ~700ml,650,4,110,20\n'
+    '茶葉蛋,,1顆,75,7,1,5\n'
+    '雞腿便當,,1個 ~700g,880,40,105,30\n'
+    '肉包,,1顆 ~100g,280,10,35,11\n'
+    '漢堡,,1個,450,20,40,22\n'
+)
+
+
+class _IndexMixin:
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        data_path = os.path.join(tmp.name, 'foods.csv')
+        with open(data_path, 'w', encoding='utf-8') as f:
+            f.write(CSV)
+        index_path = os.path.join(tmp.name, 'foods.idx')
+        self.assertEqual(build_index(data_path, index_path), 7)
+
+        patcher = mock.patch.object(food_db, '_index', food_db._Index(index_path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class FoodDbTests(_IndexMixin, SimpleTestCase):
+    def test_exact_name_and_alias(self):
+        found = lookup('滷肉飯')
+        self.assertEqual((found['name'], found['calories'], found['protein']), ('滷肉飯', 430, 12))
+        self.assertEqual(found['basis'], '滷肉飯 1碗 ~200g（本地營養資料庫）')
+        self.assertEqual(lookup('一碗 魯肉飯。')['calories'], 430)
+
+    def test_users_wording_is_kept(self):
+        found = lookup('珍奶')
+        self.assertEqual((found['name'], found['description'], found['calories']), ('珍奶', '', 650))
+        self.assertTrue(found['basis'].startswith('珍珠奶茶 '))
+        self.assertEqual(lookup('2 碗魯肉飯')['description'], '2碗')
+
+    def test_near_names_are_left_to_the_llm(self):
+        for text in ('雞排便當', '鮮肉湯包', '珍珠奶', '珍珠奶茶去冰', '和牛漢堡', '牛肉麵', ''):
+            self.assertIsNone(lookup(text), text)
+
+    def test_quantity_in_the_serving_unit_scales(self):
+        self.assertEqual(lookup('2碗滷肉飯')['calories'], 860)
+        self.assertEqual(lookup('半碗滷肉飯')['calories'], 215)
+        found = lookup('15顆水餃')
+        self.assertEqual((found['calories'], found['basis']), (750, '水餃 10顆 ~250g ×1.5（本地營養資料庫）'))
+        self.assertEqual(lookup('350ml 珍奶')['calories'], 325)
+
+    def test_quantity_in_another_unit_is_left_to_the_llm(self):
+        self.assertIsNone(lookup('2盤水餃'))
+
+    def test_split_items(self):
+        self.assertEqual(split_items('滷肉飯、一杯珍奶; 茶葉蛋 + 水餃'), ['滷肉飯', '珍奶', '茶葉蛋', '水餃'])
+
+    def test_conjunctions_inside_names_are_not_split(self):
+        self.assertEqual(split_items('和牛漢堡和薯條'), ['和牛漢堡和薯條'])
+        self.assertEqual(split_items('fish and chips'), ['fish and chips'])
+
+    def test_stats(self):
+        with mock.patch.dict(food_db._stats, {'hits': 0, 'misses': 0, 'total_us': 0.0}):
+            lookup('水餃')
+            lookup('牛肉麵')
+            s = food_db.stats()
+        self.assertEqual((s['hits'], s['misses'], s['hit_rate']), (1, 1, 0.5))
+
+
+class BundledDataTests(SimpleTestCase):
+    def test_bundled_csv_compiles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = os.path.join(tmp, 'foods.idx')
+            count = build_index(index_path=index_path)
+            index = food_db._Index(index_path)
+            self.assertEqual(index.n_foods, count)
+            self.assertEqual(index.food(index.match('滷肉飯'))[0], '滷肉飯')
+            index.buf.close()
+
+    def test_corrupt_index_is_refused(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'\0' * 64)
+            f.flush()
+            with self.assertRaises(ValueError):
+                food_db._Index(f.name)
+
+
+class LocalAnswerTests(_IndexMixin, TestCase):
+    def test_known_foods_skip_the_providers(self):
+        with mock.patch.object(ai_api, '_acall', mock.AsyncMock()) as call, \
+                mock.patch.object(ai_api._foods_batcher, 'submit', mock.AsyncMock()) as submit:
+            self.assertEqual(ai_api.estimate_nutrition('水餃')['calories'], 500)
+            foods = ai_api.parse_and_estimate_foods('滷肉飯、珍奶')
+        self.assertEqual([f['name'] for f in foods], ['滷肉飯', '珍奶'])
+        call.assert_not_awaited()
+        submit.assert_not_awaited()
+        self.assertFalse(NutritionCache.objects.exists())
+
+    def test_description_goes_to_the_llm(self):
+        answer = {'calories': 600.0, 'protein': 15.0, 'carbs': 70.0, 'fat': 25.0, 'basis': 'large'}
+        with mock.patch.object(ai_api, '_acall', mock.AsyncMock(return_value=answer)):
+            self.assertEqual(ai_api.estimate_nutrition('滷肉飯', '大碗加蛋'), answer)
+
+    def test_only_unmatched_items_are_estimated(self):
+        beef = {'name': '牛肉麵', 'description': '', 'calories': 700.0, 'protein': 30.0,
+                'carbs': 80.0, 'fat': 25.0, 'basis': '1碗'}
+        with mock.patch.object(ai_api._foods_batcher, 'submit', mock.AsyncMock(return_value=[beef])) as submit:
+            foods = ai_api.parse_and_estimate_foods('茶葉蛋、牛肉麵、珍奶')
+        submit.assert_awaited_once_with('牛肉麵')
+        self.assertEqual([f['name'] for f in foods], ['茶葉蛋', '牛肉麵', '珍奶'])
+
+    def test_unsplit_meal_goes_to_the_llm_whole(self):
+        with mock.patch.object(ai_api._foods_batcher, 'submit', mock.AsyncMock(return_value=None)) as submit:
+            ai_api.parse_and_estimate_foods('和牛漢堡和薯條')
+        submit.assert_awaited_once_with('和牛漢堡和薯條')
@@ -0,0 +1,117 @@
+import io
+import json
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mylinebot_code import food_io
+from mylinebot_code.dietary_storage import _today_date, add_entries_for_date, get_daily_totals
+from mylinebot_code.models import FoodEntry
+
+
+def _export(user_id, fmt, **kwargs):
+    return ''.join(food_io.iter_export(user_id, fmt, **kwargs))
+
+
+def _import(text, fmt, user_id='U2', **kwargs):
+    return food_io.import_entries(user_id, io.BytesIO(text.encode('utf-8')), fmt, **kwargs)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FoodImportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        add_entries_for_date('U1', '2026-01-05', [
+            {'name': '滷肉飯', 'description': '小碗', 'calories': 350, 'protein': 12, 'carbs': 50, 'fat': 11},
+            {'name': 'tea, "sweet"', 'calories': None},
+        ])
+        add_entries_for_date('U1', '2026-02-01', [{'name': 'egg', 'calories': 80}])
+
+    def _fields(self, user_id):
+        return list(
+            FoodEntry.objects.filter(user_id=user_id).order_by('date', 'added_at')
+            .values_list('date', 'name', 'description', 'calories', 'protein')
+        )
+
+    def test_csv_round_trip(self):
+        result = _import(_export('U1', 'csv'), 'csv')
+        self.assertEqual(result, {'imported': 3, 'skipped': 0, 'errors': []})
+        self.assertEqual(self._fields('U2'), self._fields('U1'))
+
+    def test_ndjson_round_trip(self):
+        text = _export('U1', 'ndjson')
+        self.assertEqual(json.loads(text.splitlines()[0])['name'], '滷肉飯')
+        _import(text, 'ndjson')
+        self.assertEqual(self._fields('U2'), self._fields('U1'))
+
+    def test_export_date_range(self):
+        lines = _export('U1', 'csv', start=date(2026, 1, 10), end=date(2026, 3, 1)).splitlines()
+        self.assertEqual(lines[0], ','.join(food_io.EXPORT_FIELDS))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('2026-02-01,egg,'))
+
+    def test_invalid_rows_are_skipped_and_reported(self):
+        future = (_today_date() + timedelta(days=2)).isoformat()
+        text = (
+            'date,name,calories\n'
+            '2026-01-01,rice,300\n'
+            'yesterday,egg,80\n'
+            f'{future},cake,400\n'
+            '2026-01-01,,100\n'
+            '2026-01-01,tea,-5\n'
+        )
+        result = _import(text, 'csv')
+        self.assertEqual((result['imported'], result['skipped']), (1, 4))
+        self.assertEqual([e['line'] for e in result['errors']], [3, 4, 5, 6])
+        self.assertIn('future', result['errors'][1]['error'])
+
+    def test_import_updates_daily_totals_in_batches(self):
+        rows = [json.dumps({'date': '2026-01-01', 'name': f'item {i}', 'calories': 10}) for i in range(7)]
+        progress = mock.Mock()
+        result = _import('\n'.join(rows + ['not json']), 'ndjson', batch_size=3, progress=progress)
+
+        self.assertEqual(result['imported'], 7)
+        self.assertEqual(progress.call_count, 3)
+        totals = get_daily_totals('U2', date(2026, 1, 1))
+        self.assertEqual((totals['calories'], totals['item_count']), (70, 7))
+
+    def test_unreadable_input_imports_nothing(self):
+        with self.assertRaises(food_io.ImportFormatError):
+            _import('when,what\n2026-01-01,rice\n', 'csv')
+        with self.assertRaises(food_io.ImportFormatError):
+            food_io.import_entries('U2', io.BytesIO(b'date,name\n2026-01-01,\xff\xfe\n'), 'csv')
+        self.assertFalse(FoodEntry.objects.filter(user_id='U2').exists())
+
+    def test_spool_rejects_oversized_uploads(self):
+        with self.assertRaises(food_io.ImportFormatError):
+            food_io.spool_upload(io.BytesIO(b'x' * 100), max_bytes=10)
+        self.assertEqual(food_io.spool_upload(io.BytesIO(b'abc')).read(), b'abc')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('mylinebot_code.liff_views._get_liff_user_id', return_value='U1')
+class FoodImportExportApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_export_streams_a_download(self, _user):
+        add_entries_for_date('U1', '2026-01-05', [{'name': 'rice', 'calories': 300}])
+        response = self.client.get(reverse('liff_api_export'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertIn('food_log.ndjson', response['Content-Disposition'])
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(json.loads(body)['name'], 'rice')
+
+    def test_import_raw_body(self, _user):
+        response = self.client.post(
+            reverse('liff_api_import') + '?format=csv',
+            data='date,name,calories\n2026-01-05,rice,300\n', content_type='text/csv',
+        )
+        self.assertEqual(response.json()['imported'], 1)
+
+    def test_bad_format_and_dates(self, _user):
+        self.assertEqual(self.client.get(reverse('liff_api_export'), {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('liff_api_export'), {'start': 'soon'}).status_code, 400)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from mylinebot_code import dietary_storage
+from mylinebot_code.dietary_storage import (
+    add_food_entry, cache_advice, cache_stats, get_cached_advice, get_entries_with_ids, get_today_log,
+    remove_food_entry,
+)
+from mylinebot_code.unit_of_work import unit_of_work
+
+
+def _food(name):
+    return {'name': name, 'calories': 100, 'protein': 1, 'carbs': 2, 'fat': 3, 'basis': ''}
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FoodLogCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict(dietary_storage._cache_stats, {'hits': 0, 'misses': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_read_is_served_without_queries(self):
+        add_food_entry('U1', _food('rice'))
+        get_today_log('U1')
+        with CaptureQueriesContext(connection) as queries:
+            foods = get_today_log('U1')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([f['name'] for f in foods], ['rice'])
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_writes_invalidate_every_cached_view(self):
+        add_food_entry('U1', _food('rice'))
+        self.assertEqual(len(get_today_log('U1')), 1)
+        self.assertEqual(len(get_entries_with_ids('U1')), 1)
+
+        add_food_entry('U1', _food('egg'))
+        self.assertEqual([f['name'] for f in get_today_log('U1')], ['rice', 'egg'])
+        remove_food_entry('U1', 1)
+        self.assertEqual([f['name'] for f in get_today_log('U1')], ['egg'])
+        self.assertEqual(len(next(iter(get_entries_with_ids('U1').values()))), 1)
+
+    def test_other_users_stay_cached(self):
+        add_food_entry('U2', _food('tea'))
+        get_today_log('U2')
+        add_food_entry('U1', _food('rice'))
+        with CaptureQueriesContext(connection) as queries:
+            get_today_log('U2')
+        self.assertEqual(len(queries), 0)
+
+    def test_invalidation_waits_for_the_unit_to_commit(self):
+        add_food_entry('U1', _food('rice'))
+        get_today_log('U1')
+        with unit_of_work():
+            add_food_entry('U1', _food('egg'))
+            add_food_entry('U1', _food('tea'))
+        self.assertEqual(len(get_today_log('U1')), 3)
+
+    def test_advice_is_reused_until_the_log_changes(self):
+        add_food_entry('U1', _food('rice'))
+        cache_advice('U1', 'eat greens', tdee=2000, user_prompt='dinner?')
+        self.assertEqual(get_cached_advice('U1', tdee=2000, user_prompt='dinner?'), 'eat greens')
+        self.assertIsNone(get_cached_advice('U1', tdee=2000, user_prompt='lunch?'))
+
+        add_food_entry('U1', _food('egg'))
+        self.assertIsNone(get_cached_advice('U1', tdee=2000, user_prompt='dinner?'))
+
+    def test_unavailable_cache_falls_back_to_the_db(self):
+        add_food_entry('U1', _food('rice'))
+        with mock.patch.object(dietary_storage.cache, 'get', side_effect=OSError('disk full')):
+            self.assertEqual(len(get_today_log('U1')), 1)
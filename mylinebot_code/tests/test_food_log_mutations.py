@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from mylinebot_code.dietary_storage import (
+    add_food_entry, get_food_entry_by_index, get_today_log, remove_food_entries, remove_food_entry,
+    update_food_entry,
+)
+from mylinebot_code.models import FoodEntry
+
+
+def _food(name, calories=100):
+    return {'name': name, 'description': '', 'calories': calories, 'protein': 1, 'carbs': 2, 'fat': 3, 'basis': ''}
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TodayLogMutationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ('rice', 'egg', 'tea', 'soup'):
+            add_food_entry('U1', _food(name))
+        add_food_entry('U2', _food('other user'))
+
+    def _names(self, user_id='U1'):
+        return list(FoodEntry.objects.filter(user_id=user_id).order_by('added_at').values_list('name', flat=True))
+
+    def test_remove_by_position(self):
+        self.assertEqual(remove_food_entry('U1', 2)['name'], 'egg')
+        self.assertEqual(self._names(), ['rice', 'tea', 'soup'])
+
+    def test_remove_several_returns_them_in_index_order_and_skips_invalid(self):
+        removed = remove_food_entries('U1', [4, 1, 9, 0])
+        self.assertEqual([f['name'] for f in removed], ['rice', 'soup'])
+        self.assertEqual(self._names(), ['egg', 'tea'])
+        self.assertEqual(self._names('U2'), ['other user'])
+
+    def test_remove_with_only_invalid_indices_changes_nothing(self):
+        self.assertEqual(remove_food_entries('U1', [5, -1]), [])
+        self.assertIsNone(remove_food_entry('U2', 2))
+        self.assertEqual(len(self._names()), 4)
+
+    def test_remove_issues_a_single_delete(self):
+        with CaptureQueriesContext(connection) as queries:
+            remove_food_entries('U1', [1, 2, 3])
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+
+    def test_update_changes_only_given_fields(self):
+        self.assertTrue(update_food_entry('U1', 3, {'name': 'milk tea', 'calories': 250}))
+        entry = get_food_entry_by_index('U1', 3)
+        self.assertEqual((entry['name'], entry['calories'], entry['protein']), ('milk tea', 250, 1))
+
+    def test_update_out_of_range_returns_false(self):
+        self.assertFalse(update_food_entry('U1', 5, {'name': 'x'}))
+        self.assertFalse(update_food_entry('U1', 0, {'name': 'x'}))
+
+    def test_get_by_index(self):
+        self.assertEqual(get_food_entry_by_index('U1', 4)['name'], 'soup')
+        self.assertIsNone(get_food_entry_by_index('U1', 5))
+        self.assertIsNone(get_food_entry_by_index('U1', 0))
+
+    def test_today_log_keeps_insertion_order(self):
+        self.assertEqual([f['name'] for f in get_today_log('U1')], ['rice', 'egg', 'tea', 'soup'])
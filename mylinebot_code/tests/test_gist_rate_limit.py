@@ -0,0 +1,102 @@
+import time
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from mylinebot_code import backup_journal, gist_storage
+from mylinebot_code.backup_lease import acquire_lease, current_holder
+
+
+def _response(status=200, **headers):
+    return mock.Mock(status_code=status, headers=headers)
+
+
+@mock.patch('mylinebot_code.gist_storage.time.sleep')
+@mock.patch('mylinebot_code.gist_storage.requests.request')
+class GithubRequestTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(gist_storage._rate_limit, {
+            'limit': None, 'remaining': None, 'reset_at': None,
+            'deferred_writes': 0, 'retries': 0, 'last_write_at': 0.0,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_records_quota_headers(self, request, sleep):
+        reset = int(time.time()) + 600
+        request.return_value = _response(**{
+            'X-RateLimit-Limit': '5000', 'X-RateLimit-Remaining': '4321', 'X-RateLimit-Reset': str(reset),
+        })
+        gist_storage._github_request('GET', 'https://api.github.com/gists/x')
+
+        stats = gist_storage.rate_limit_stats()
+        self.assertEqual((stats['limit'], stats['remaining']), (5000, 4321))
+        self.assertGreater(stats['reset_in_seconds'], 590)
+
+    def test_retries_server_errors_with_backoff(self, request, sleep):
+        request.side_effect = [_response(502), _response(503), _response(200)]
+        response = gist_storage._github_request('PATCH', 'https://api.github.com/gists/x')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1.0, 2.0])
+        self.assertEqual(gist_storage.rate_limit_stats()['retries'], 2)
+
+    def test_honours_retry_after(self, request, sleep):
+        request.side_effect = [_response(429, **{'Retry-After': '7'}), _response(200)]
+        gist_storage._github_request('GET', 'https://api.github.com/gists/x')
+        sleep.assert_called_once_with(7.0)
+
+    def test_does_not_retry_client_errors(self, request, sleep):
+        request.return_value = _response(404)
+        self.assertEqual(gist_storage._github_request('GET', 'https://api.github.com/gists/x').status_code, 404)
+        self.assertEqual(request.call_count, 1)
+
+    def test_gives_up_when_the_reset_is_too_far_away(self, request, sleep):
+        request.return_value = _response(403, **{
+            'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 3000),
+        })
+        response = gist_storage._github_request('PATCH', 'https://api.github.com/gists/x')
+
+        self.assertEqual(response.status_code, 403)
+        sleep.assert_not_called()
+        self.assertEqual(gist_storage.rate_limit_stats()['deferred_writes'], 1)
+
+    def test_write_at_the_reserve_is_deferred_without_a_request(self, request, sleep):
+        gist_storage._rate_limit.update(remaining=gist_storage.RATE_LIMIT_RESERVE, reset_at=time.time() + 600)
+        with self.assertRaises(gist_storage.GistRateLimited):
+            gist_storage._github_request('PATCH', 'https://api.github.com/gists/x')
+        request.assert_not_called()
+
+    def test_reads_are_not_paced(self, request, sleep):
+        gist_storage._rate_limit.update(remaining=gist_storage.RATE_LIMIT_RESERVE, reset_at=time.time() + 600)
+        request.return_value = _response(200)
+        gist_storage._github_request('GET', 'https://api.github.com/gists/x')
+        request.assert_called_once()
+
+    def test_writes_are_spaced_out_when_quota_runs_low(self, request, sleep):
+        now = time.time()
+        gist_storage._rate_limit.update(
+            remaining=gist_storage.RATE_LIMIT_RESERVE + 10, reset_at=now + 100, last_write_at=now,
+        )
+        request.return_value = _response(200)
+        gist_storage._github_request('PATCH', 'https://api.github.com/gists/x')
+
+        # 100 s left for 10 writes above the reserve: about 10 s apart
+        self.assertAlmostEqual(sleep.call_args.args[0], 10, delta=0.5)
+
+
+@mock.patch('mylinebot_code.backup_journal._gist_configured', return_value=True)
+class FlushTests(TestCase):
+    def test_flush_drains_and_gives_up_the_lease(self, _configured):
+        with mock.patch.object(backup_journal, 'drain', return_value=2) as drain:
+            acquire_lease(backup_journal.LEASE_NAME)
+            self.assertEqual(backup_journal.flush(), 2)
+        drain.assert_called_once()
+        self.assertIsNone(current_holder(backup_journal.LEASE_NAME))
+
+    def test_parse_forum_uploads_before_exiting(self, _configured):
+        with mock.patch('mylinebot_code.management.commands.parse_forum.parse_forum', return_value=[]), \
+                mock.patch('mylinebot_code.management.commands.parse_forum.flush') as flush:
+            call_command('parse_forum', stdout=mock.Mock())
+        flush.assert_called_once()
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from mylinebot_code import ai_api, ai_schemas
+
+GOOD = {'calories': 300.0}
+BAD = {'calories': None}
+
+
+def _provider(result=None, delay=0.0, error=None, calls=None, name=''):
+    async def aestimate_nutrition(text):
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return SimpleNamespace(aestimate_nutrition=aestimate_nutrition)
+
+
+class HedgedCallTests(SimpleTestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch.dict(ai_api._HEDGE_DELAYS, {'text': 0.05}),
+            mock.patch.dict(ai_api._hedge_stats, {k: 0 for k in ai_api._hedge_stats}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def _call(self, primary, fallback):
+        with mock.patch.object(ai_api, '_primary', primary), mock.patch.object(ai_api, '_fallback', fallback):
+            return asyncio.run(ai_api._acall('text', 'estimate_nutrition', ai_api._has_calories, 'rice'))
+
+    def test_fast_primary_is_not_hedged(self):
+        result = self._call(
+            _provider(GOOD, calls=self.calls, name='primary'),
+            _provider({'calories': 1.0}, calls=self.calls, name='fallback'),
+        )
+        self.assertEqual(result, GOOD)
+        self.assertEqual(self.calls, ['primary'])
+        self.assertEqual(ai_api.hedge_stats()['primary_wins'], 1)
+
+    def test_slow_primary_races_the_fallback(self):
+        result = self._call(_provider(GOOD, delay=1), _provider({'calories': 1.0}))
+        self.assertEqual(result, {'calories': 1.0})
+        stats = ai_api.hedge_stats()
+        self.assertEqual((stats['hedged'], stats['fallback_wins']), (1, 1))
+
+    def test_slow_primary_can_still_win_the_race(self):
+        result = self._call(_provider(GOOD, delay=0.1), _provider({'calories': 1.0}, delay=1))
+        self.assertEqual(result, GOOD)
+        self.assertEqual(ai_api.hedge_stats()['primary_wins'], 1)
+
+    def test_invalid_race_winner_waits_for_the_other(self):
+        result = self._call(_provider(GOOD, delay=0.2), _provider(BAD))
+        self.assertEqual(result, GOOD)
+
+    def test_invalid_primary_falls_back_without_racing(self):
+        self.assertEqual(self._call(_provider(BAD), _provider({'calories': 1.0})), {'calories': 1.0})
+        self.assertEqual(ai_api.hedge_stats()['hedged'], 0)
+
+    def test_primary_error_falls_back(self):
+        self.assertEqual(self._call(_provider(error=RuntimeError('boom')), _provider(GOOD)), GOOD)
+
+    def test_both_invalid_returns_the_fallback_answer(self):
+        self.assertEqual(self._call(_provider({'calories': None, 'basis': 'p'}, delay=1), _provider(BAD)), BAD)
+        self.assertEqual(ai_api.hedge_stats()['both_failed'], 1)
+
+    def test_both_raising_reraises(self):
+        with self.assertRaises((RuntimeError, ValueError)):
+            self._call(_provider(error=RuntimeError('slow'), delay=0.1), _provider(error=ValueError('down')))
+        self.assertEqual(ai_api.hedge_stats()['both_failed'], 1)
+
+    def test_losing_call_is_cancelled(self):
+        cancelled = []
+
+        async def aestimate_nutrition(text):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        self._call(SimpleNamespace(aestimate_nutrition=aestimate_nutrition), _provider(GOOD, delay=0.1))
+        self.assertEqual(cancelled, [True])
+
+    def test_schema_failure_counts_the_fallback(self):
+        async def aestimate_nutrition(text):
+            ai_schemas.parse_failures.get().append('estimate')
+            return BAD
+
+        with mock.patch.object(ai_schemas, 'record_fallback') as record:
+            self._call(SimpleNamespace(aestimate_nutrition=aestimate_nutrition), _provider(GOOD))
+        record.assert_called_once()
@@ -0,0 +1,99 @@
+import io
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from mylinebot_code import image_pipeline
+
+
+def _photo(size=(3000, 2000), orientation=None):
+    from PIL import Image
+
+    img = Image.effect_noise(size, 60).convert('RGB')
+    out = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneCam'  # Make
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(out, format='JPEG', quality=95, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def _open(data):
+    from PIL import Image
+
+    return Image.open(io.BytesIO(data))
+
+
+class ProcessTests(SimpleTestCase):
+    def test_downsizes_and_strips_metadata(self):
+        out = image_pipeline._process(_photo(), 1024, 'JPEG', 82)
+        with _open(out) as img:
+            self.assertEqual(img.size, (1024, 683))
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(len(img.getexif()), 0)
+
+    def test_exif_orientation_is_applied(self):
+        # 6 = rotate 90° clockwise, so the landscape source comes out portrait
+        out = image_pipeline._process(_photo(orientation=6), 1024, 'JPEG', 82)
+        with _open(out) as img:
+            self.assertEqual(img.size, (683, 1024))
+
+    def test_webp_output(self):
+        out = image_pipeline._process(_photo((800, 600)), 1024, 'WEBP', 80)
+        with _open(out) as img:
+            self.assertEqual((img.format, img.size), ('WEBP', (800, 600)))
+
+
+class PrepareImageTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        image_pipeline._reset_pool()
+        super().tearDownClass()
+
+    def setUp(self):
+        patcher = mock.patch.dict(image_pipeline._stats, {k: 0 for k in image_pipeline._stats})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_large_photo_is_shrunk_in_the_pool(self):
+        original = _photo()
+        data, mime = image_pipeline.prepare_image(original, 'image/png')
+        self.assertEqual(mime, 'image/jpeg')
+        self.assertLess(len(data), len(original))
+        s = image_pipeline.stats()
+        self.assertEqual((s['images'], s['bytes_in'], s['bytes_out']), (1, len(original), len(data)))
+        self.assertGreater(s['saved_pct'], 0)
+
+    def test_original_kept_if_reencoding_is_not_smaller(self):
+        original = _photo((64, 64))
+        with mock.patch.object(image_pipeline, '_get_pool') as pool:
+            pool.return_value.submit.return_value.result.return_value = original + b'padding'
+            self.assertEqual(image_pipeline.prepare_image(original, 'image/heic'), (original, 'image/heic'))
+        self.assertEqual(image_pipeline.stats()['bytes_saved'], 0)
+
+    def test_failure_uploads_the_original(self):
+        with mock.patch.object(image_pipeline, '_get_pool') as pool:
+            pool.return_value.submit.return_value.result.side_effect = OSError('cannot identify image file')
+            self.assertEqual(image_pipeline.prepare_image(b'junk', 'image/jpeg'), (b'junk', 'image/jpeg'))
+        self.assertEqual(image_pipeline.stats()['failures'], 1)
+
+    def test_broken_pool_is_replaced(self):
+        from concurrent.futures.process import BrokenProcessPool
+
+        with mock.patch.object(image_pipeline, '_get_pool') as pool, \
+                mock.patch.object(image_pipeline, '_reset_pool') as reset:
+            pool.return_value.submit.return_value.result.side_effect = BrokenProcessPool()
+            image_pipeline.prepare_image(b'junk', 'image/jpeg')
+        reset.assert_called_once()
+
+    @override_settings(IMAGE_FORMAT='gif')
+    def test_unsupported_format_uploads_the_original(self):
+        with mock.patch.object(image_pipeline, '_get_pool') as pool:
+            self.assertEqual(image_pipeline.prepare_image(b'img', 'image/jpeg'), (b'img', 'image/jpeg'))
+        pool.assert_not_called()
+
+    def test_stats_without_images(self):
+        s = image_pipeline.stats()
+        self.assertIsNone(s['saved_pct'])
+        self.assertIsNone(s['avg_ms'])
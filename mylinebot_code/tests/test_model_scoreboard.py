@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from mylinebot_code import model_scoreboard
+from mylinebot_code.model_scoreboard import rank, ranking, record
+
+MODELS = ['a', 'b', 'c']
+
+
+class ModelScoreboardTests(SimpleTestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(model_scoreboard, '_scores', {}),
+            mock.patch.object(model_scoreboard, 'EXPLORE_RATE', 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unscored_models_keep_configured_order(self):
+        self.assertEqual(rank('gemini', 'text', MODELS), MODELS)
+
+    def test_fastest_model_goes_first(self):
+        record('gemini', 'text', 'a', ok=True, latency=3.0)
+        record('gemini', 'text', 'c', ok=True, latency=1.0)
+        self.assertEqual(rank('gemini', 'text', MODELS), ['c', 'a', 'b'])
+
+    def test_failures_and_parse_failures_raise_the_cost(self):
+        record('gemini', 'text', 'a', ok=True, latency=1.0)
+        record('gemini', 'text', 'b', ok=True, latency=1.5)
+        for _ in range(5):
+            record('gemini', 'text', 'a', ok=False)
+        self.assertEqual(rank('gemini', 'text', MODELS)[0], 'b')
+
+        record('gemini', 'text', 'c', ok=True, latency=1.0, parsed=False)
+        self.assertEqual(rank('gemini', 'text', ['b', 'c']), ['b', 'c'])
+
+    def test_model_without_a_success_sorts_with_unscored(self):
+        record('gemini', 'text', 'a', ok=False)
+        record('gemini', 'text', 'c', ok=True, latency=9.0)
+        self.assertEqual(rank('gemini', 'text', MODELS), ['c', 'a', 'b'])
+
+    def test_latency_is_smoothed(self):
+        record('gemini', 'text', 'a', ok=True, latency=1.0)
+        record('gemini', 'text', 'a', ok=True, latency=6.0)
+        row = ranking()['gemini/text'][0]
+        self.assertEqual(row['latency_s'], round(1.0 + model_scoreboard.EWMA_ALPHA * 5.0, 3))
+        self.assertEqual(row['samples'], 2)
+
+    def test_scores_are_per_provider_and_task(self):
+        record('gemini', 'image', 'c', ok=True, latency=0.5)
+        record('openrouter', 'text', 'b', ok=True, latency=0.5)
+        self.assertEqual(rank('gemini', 'text', MODELS), MODELS)
+        self.assertEqual(set(ranking()), {'gemini/image', 'openrouter/text'})
+
+    def test_exploration_promotes_another_model(self):
+        record('gemini', 'text', 'a', ok=True, latency=1.0)
+        with mock.patch.object(model_scoreboard, 'EXPLORE_RATE', 1), \
+                mock.patch.object(model_scoreboard.random, 'choice', return_value='c'):
+            self.assertEqual(rank('gemini', 'text', MODELS), ['c', 'a', 'b'])
+        self.assertEqual(rank('gemini', 'text', ['a']), ['a'])
+
+    def test_ranking_lists_best_first(self):
+        record('gemini', 'text', 'a', ok=True, latency=2.0)
+        record('gemini', 'text', 'b', ok=False)
+        record('gemini', 'text', 'c', ok=True, latency=1.0)
+        rows = ranking()['gemini/text']
+        self.assertEqual([r['model'] for r in rows], ['c', 'a', 'b'])
+        self.assertEqual((rows[0]['cost_s'], rows[2]['cost_s'], rows[2]['success']), (1.0, None, 0.0))
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+from django.test import TestCase
+
+from mylinebot_code.models import DailyTotals, UserTdee
+from mylinebot_code.nutrition_analytics import compute_user_metrics
+from mylinebot_code.views import build_trend_summary
+
+TODAY = date(2026, 3, 10)
+
+
+def _day(days_ago, calories, protein=0, carbs=0, fat=0, user_id='U1', **extra):
+    DailyTotals.objects.create(
+        user_id=user_id, date=TODAY - timedelta(days=days_ago),
+        calories=calories, protein=protein, carbs=carbs, fat=fat, item_count=1, **extra,
+    )
+
+
+class NutritionAnalyticsTests(TestCase):
+    def test_averages_count_logged_days_only(self):
+        _day(0, 2000)
+        _day(3, 1000)
+        _day(20, 3000)
+
+        m = compute_user_metrics(['U1'], today=TODAY)['U1']
+        self.assertEqual((m['calories_today'], m['avg_calories_7d'], m['avg_calories_30d']), (2000, 1500, 2000))
+        self.assertEqual((m['logged_days_7d'], m['logged_days_30d']), (2, 3))
+
+    def test_week_over_week_delta(self):
+        _day(1, 1800)
+        _day(8, 2200)
+        _day(9, 2000)
+        self.assertEqual(compute_user_metrics(['U1'], today=TODAY)['U1']['calories_wow_delta'], -300)
+
+    def test_macro_shares_of_macro_calories(self):
+        # 100 g protein = 400 kcal, 100 g carbs = 400 kcal, 22.2 g fat ≈ 200 kcal
+        _day(0, 1000, protein=100, carbs=100, fat=200 / 9)
+        _day(7, 1000, protein=50, carbs=150, fat=200 / 9)
+
+        m = compute_user_metrics(['U1'], today=TODAY)['U1']
+        self.assertEqual(m['macro_pct_7d'], {'protein': 40, 'carbs': 40, 'fat': 20})
+        self.assertEqual(m['macro_pct_wow_delta'], {'protein': 20, 'carbs': -20, 'fat': 0})
+
+    def test_adherence_needs_a_tdee(self):
+        _day(0, 2050)
+        _day(1, 2500)
+        self.assertIsNone(compute_user_metrics(['U1'], today=TODAY)['U1']['adherence_7d'])
+
+        UserTdee.objects.create(user_id='U1', tdee=2000)
+        m = compute_user_metrics(['U1'], today=TODAY)['U1']
+        self.assertEqual(m['tdee'], 2000)
+        self.assertEqual(m['adherence_7d'], round(1 / 7 * 100))
+        self.assertEqual(m['adherence_30d'], round(1 / 30 * 100))
+
+    def test_compacted_days_and_the_window_edge(self):
+        _day(29, 1200, compacted=True)
+        _day(30, 5000)
+        m = compute_user_metrics(['U1'], today=TODAY)['U1']
+        self.assertEqual((m['avg_calories_30d'], m['logged_days_30d']), (1200, 1))
+        self.assertIsNone(m['avg_calories_7d'])
+
+    def test_users_without_data(self):
+        _day(0, 1500, user_id='U2')
+        metrics = compute_user_metrics(['U1', 'U2'], today=TODAY)
+        self.assertEqual(metrics['U1']['logged_days_30d'], 0)
+        self.assertIsNone(metrics['U1']['macro_pct_7d'])
+        self.assertEqual(metrics['U2']['avg_calories_7d'], 1500)
+        self.assertEqual(compute_user_metrics(today=TODAY).keys(), {'U2'})
+        self.assertEqual(compute_user_metrics([], today=TODAY), {})
+
+    def test_trend_summary(self):
+        self.assertEqual(build_trend_summary(None), '')
+        _day(0, 2000, protein=100, carbs=200, fat=50)
+        summary = build_trend_summary(compute_user_metrics(['U1'], today=TODAY)['U1'])
+        self.assertIn('7-day avg 2000 kcal (1/7 days)', summary)
+        self.assertNotIn('On target', summary)
@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from mylinebot_code import ai_api, nutrition_cache
+from mylinebot_code.models import NutritionCache
+from mylinebot_code.nutrition_cache import KIND_ESTIMATE, KIND_PARSE, invalidate, lookup, normalize, store
+
+RESULT = {'calories': 520.0, 'protein': 18.0, 'carbs': 70.0, 'fat': 16.0, 'basis': '1 bowl'}
+
+
+class NormalizeTests(SimpleTestCase):
+    def test_one_serving_quantifiers_share_a_key(self):
+        keys = {normalize(t) for t in ('一碗 滷肉飯', '1碗滷肉飯', '滷肉飯', '  滷肉飯。')}
+        self.assertEqual(keys, {'滷肉飯'})
+
+    def test_width_case_and_spacing(self):
+        self.assertEqual(normalize('ＣＯＦＦＥＥ  Latte!'), 'coffee latte')
+        self.assertEqual(normalize('a bowl of Beef Noodles'), 'beef noodles')
+
+    def test_quantities_other_than_one_are_kept(self):
+        self.assertEqual(normalize('兩碗白飯'), '2碗白飯')
+        self.assertEqual(normalize('半碗白飯'), '0.5碗白飯')
+        self.assertEqual(normalize('十二顆水餃'), '12顆水餃')
+
+    def test_separators(self):
+        self.assertEqual(normalize('蛋餅、 一杯奶茶；豆漿'), '蛋餅,奶茶,豆漿')
+        self.assertEqual(normalize(None), '')
+
+
+class NutritionCacheTests(TestCase):
+    def test_store_then_hit_on_an_equivalent_description(self):
+        self.assertIsNone(lookup(KIND_ESTIMATE, '滷肉飯'))
+        store(KIND_ESTIMATE, '一碗滷肉飯', RESULT)
+        self.assertEqual(lookup(KIND_ESTIMATE, '1 碗 滷肉飯'), RESULT)
+        self.assertIsNone(lookup(KIND_PARSE, '滷肉飯'))
+        self.assertEqual(NutritionCache.objects.get().hit_count, 1)
+
+    def test_expired_entries_miss_and_are_dropped(self):
+        store(KIND_ESTIMATE, '滷肉飯', RESULT)
+        NutritionCache.objects.update(created_at=timezone.now() - nutrition_cache.CACHE_TTL - timedelta(hours=1))
+        self.assertIsNone(lookup(KIND_ESTIMATE, '滷肉飯'))
+        self.assertFalse(NutritionCache.objects.exists())
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with mock.patch.object(nutrition_cache, 'MAX_ENTRIES', 2):
+            store(KIND_ESTIMATE, 'rice', RESULT)
+            store(KIND_ESTIMATE, 'egg', RESULT)
+            lookup(KIND_ESTIMATE, 'rice')
+            store(KIND_ESTIMATE, 'tea', RESULT)
+        self.assertEqual(set(NutritionCache.objects.values_list('key', flat=True)), {'rice', 'tea'})
+
+    def test_invalidate(self):
+        store(KIND_ESTIMATE, 'rice', RESULT)
+        store(KIND_PARSE, 'rice', [RESULT])
+        store(KIND_ESTIMATE, 'egg', RESULT)
+        self.assertEqual(invalidate('一碗 rice', kind=KIND_PARSE), 1)
+        self.assertEqual(invalidate('rice'), 1)
+        self.assertEqual(invalidate(), 1)
+
+    def test_overlong_or_empty_descriptions_are_not_cached(self):
+        store(KIND_ESTIMATE, 'x' * 600, RESULT)
+        store(KIND_ESTIMATE, '  。', RESULT)
+        self.assertFalse(NutritionCache.objects.exists())
+
+
+class EstimateCacheIntegrationTests(TestCase):
+    def test_repeat_estimate_skips_the_providers(self):
+        with mock.patch.object(ai_api, '_acall', mock.AsyncMock(return_value=RESULT)) as call:
+            self.assertEqual(ai_api.estimate_nutrition('zzq house special'), RESULT)
+            self.assertEqual(ai_api.estimate_nutrition('ZZQ House Special!'), RESULT)
+        call.assert_awaited_once()
+
+    def test_failed_estimate_is_not_cached(self):
+        failed = {'calories': None, 'protein': None, 'carbs': None, 'fat': None, 'basis': ''}
+        with mock.patch.object(ai_api, '_acall', mock.AsyncMock(return_value=failed)):
+            ai_api.estimate_nutrition('zzq house special')
+        self.assertFalse(NutritionCache.objects.exists())
@@ -0,0 +1,123 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from mylinebot_code import ai_api, image_pipeline, photo_cache
+from mylinebot_code.models import PhotoEstimateCache
+from mylinebot_code.photo_cache import dhash, hamming, lookup, store
+
+RESULT = {'food_name': '便當', 'calories': 750.0, 'protein': 30.0, 'carbs': 90.0, 'fat': 25.0}
+
+
+def _photo(seed=0, quality=90, flip=False):
+    """A JPEG with a left-to-right gradient and a few seed-dependent blocks."""
+    from PIL import Image, ImageDraw
+
+    img = Image.new('RGB', (240, 160))
+    draw = ImageDraw.Draw(img)
+    for x in range(240):
+        shade = 255 - x if flip else x
+        draw.line([(x, 0), (x, 159)], fill=(shade, shade // 2, 255 - shade))
+    for i in range(seed):
+        draw.rectangle([20 + 50 * i, 40, 40 + 50 * i, 120], fill=(255, 255, 255))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+class HashTests(SimpleTestCase):
+    def test_recompressed_photo_hashes_close(self):
+        self.assertLessEqual(hamming(dhash(_photo(quality=95)), dhash(_photo(quality=40))), 2)
+
+    def test_different_photos_hash_far_apart(self):
+        self.assertGreater(hamming(dhash(_photo()), dhash(_photo(flip=True))), 32)
+
+    def test_hash_fits_a_signed_bigint(self):
+        value = dhash(_photo(flip=True))
+        self.assertTrue(-(1 << 63) <= value < 1 << 63)
+        self.assertEqual(hamming(value, value), 0)
+
+
+class PhotoCacheTests(TestCase):
+    def _store(self, image, user_id, result=RESULT):
+        photo_hash, cached = lookup(image, user_id)
+        self.assertIsNone(cached)
+        store(photo_hash, result, user_id)
+
+    def test_users_own_near_match_is_reused(self):
+        self._store(_photo(quality=95), 'U1')
+        _, cached = lookup(_photo(quality=40), 'U1')
+        self.assertEqual(cached, RESULT)
+        self.assertEqual(PhotoEstimateCache.objects.get().hit_count, 1)
+
+    def test_other_users_photos_need_an_identical_hash(self):
+        self._store(_photo(), 'U1')
+        near = photo_cache.dhash(_photo()) ^ 0b1
+        with mock.patch.object(photo_cache, 'dhash', return_value=near):
+            self.assertEqual(lookup(b'', 'U2'), (near, None))
+        self.assertEqual(lookup(_photo(), 'U2')[1], RESULT)
+
+    def test_looser_global_threshold_is_opt_in(self):
+        self._store(_photo(), 'U1')
+        near = photo_cache.dhash(_photo()) ^ 0b11
+        with mock.patch.object(photo_cache, 'dhash', return_value=near), \
+                mock.patch.object(photo_cache, 'GLOBAL_THRESHOLD', 4):
+            self.assertEqual(lookup(b'', 'U2')[1], RESULT)
+
+    def test_negative_threshold_turns_a_scope_off(self):
+        self._store(_photo(), 'U1')
+        with mock.patch.object(photo_cache, 'GLOBAL_THRESHOLD', -1):
+            self.assertIsNone(lookup(_photo(), 'U2')[1])
+        with mock.patch.object(photo_cache, 'USER_THRESHOLD', -1):
+            self.assertEqual(lookup(_photo(), 'U1')[1], RESULT)
+
+    def test_closest_match_wins(self):
+        base = dhash(_photo())
+        store(base ^ 0b111, {**RESULT, 'food_name': 'far'}, 'U1')
+        store(base ^ 0b1, {**RESULT, 'food_name': 'near'}, 'U1')
+        self.assertEqual(lookup(_photo(), 'U1')[1]['food_name'], 'near')
+
+    def test_expired_entries_miss_and_are_trimmed(self):
+        self._store(_photo(), 'U1')
+        PhotoEstimateCache.objects.update(created_at=timezone.now() - photo_cache.CACHE_TTL - timedelta(hours=1))
+        photo_hash, cached = lookup(_photo(), 'U1')
+        self.assertIsNone(cached)
+        store(photo_hash, RESULT, 'U1')
+        self.assertEqual(PhotoEstimateCache.objects.count(), 1)
+
+    def test_oldest_entries_are_evicted(self):
+        with mock.patch.object(photo_cache, 'MAX_ENTRIES', 2):
+            for i in range(3):
+                store(i, {**RESULT, 'food_name': str(i)}, 'U1')
+        self.assertEqual(sorted(PhotoEstimateCache.objects.values_list('dhash', flat=True)), [1, 2])
+
+    def test_unreadable_image_is_not_cached(self):
+        self.assertEqual(lookup(b'not an image', 'U1'), (None, None))
+        store(None, RESULT, 'U1')
+        self.assertFalse(PhotoEstimateCache.objects.exists())
+
+    def test_stats(self):
+        with mock.patch.dict(photo_cache._stats, {k: 0 for k in photo_cache._stats}):
+            self._store(_photo(), 'U1')
+            lookup(_photo(), 'U1')
+            s = photo_cache.stats()
+        self.assertEqual((s['hits_user'], s['misses'], s['stores'], s['hit_rate']), (1, 1, 1, 0.5))
+        self.assertEqual(s['mean_hit_distance'], 0)
+
+
+@mock.patch.object(image_pipeline, 'prepare_image', side_effect=lambda data, mime: (data, mime))
+class PhotoEstimateIntegrationTests(TestCase):
+    def test_resent_photo_skips_the_vision_call(self, _prepare):
+        with mock.patch.object(ai_api, '_acall', mock.AsyncMock(return_value=RESULT)) as call:
+            self.assertEqual(ai_api.estimate_nutrition_from_image(_photo(), 'image/jpeg', 'U1'), RESULT)
+            self.assertEqual(ai_api.estimate_nutrition_from_image(_photo(quality=50), 'image/jpeg', 'U1'), RESULT)
+        call.assert_awaited_once()
+
+    def test_unrecognised_photo_is_not_cached(self, _prepare):
+        failed = {**RESULT, 'food_name': None}
+        with mock.patch.object(ai_api, '_acall', mock.AsyncMock(return_value=failed)):
+            ai_api.estimate_nutrition_from_image(_photo(), 'image/jpeg', 'U1')
+        self.assertFalse(PhotoEstimateCache.objects.exists())
@@ -0,0 +1,19 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from mylinebot_code.management.commands.check_query_plans import _BAD_PLAN, _hot_queries
+from mylinebot_code.models import FoodEntry
+
+
+class QueryPlanTests(TestCase):
+    def test_every_hot_query_uses_an_index(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out, stderr=StringIO())
+        self.assertIn('All hot queries use an index', out.getvalue())
+        self.assertGreaterEqual(out.getvalue().count('SEARCH'), len(_hot_queries()))
+
+    def test_check_flags_an_unindexed_query(self):
+        self.assertRegex(FoodEntry.objects.filter(name='rice').explain(), _BAD_PLAN)
+        self.assertRegex(FoodEntry.objects.filter(user_id='U1').order_by('calories').explain(), _BAD_PLAN)
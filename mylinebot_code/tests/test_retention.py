@@ -0,0 +1,91 @@
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from mylinebot_code.dietary_storage import (
+    add_entries_for_date, compact_old_entries, get_daily_summaries, get_weekly_rollups,
+)
+from mylinebot_code.models import DailyTotals, FoodEntry, WeeklyRollup
+
+TODAY = date(2026, 3, 10)  # a Tuesday
+
+
+def _food(name, calories):
+    return {'name': name, 'calories': calories, 'protein': 10, 'carbs': 20, 'fat': 5, 'basis': ''}
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('mylinebot_code.dietary_storage._today_date', return_value=TODAY)
+class RetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _log(self, day, *foods, user_id='U1'):
+        add_entries_for_date(user_id, day, [_food(name, calories) for name, calories in foods])
+
+    def test_old_entries_are_rolled_up_then_deleted(self, _today):
+        self._log('2026-02-23', ('rice', 300), ('rice', 300), ('egg', 80))
+        self._log('2026-02-24', ('noodles', 500))
+        self._log('2026-03-09', ('tea', 120))
+
+        self.assertEqual(compact_old_entries(keep_days=7), 4)
+
+        self.assertEqual(list(FoodEntry.objects.values_list('name', flat=True)), ['tea'])
+        day = DailyTotals.objects.get(user_id='U1', date=date(2026, 2, 23))
+        self.assertTrue(day.compacted)
+        self.assertEqual((day.calories, day.protein, day.item_count), (680, 30, 3))
+        self.assertEqual(day.top_foods[0], {'name': 'rice', 'count': 2, 'calories': 600})
+        self.assertFalse(DailyTotals.objects.get(date=date(2026, 3, 9)).compacted)
+
+    def test_weekly_rollup_covers_the_compacted_days(self, _today):
+        self._log('2026-02-23', ('rice', 300))
+        self._log('2026-02-25', ('rice', 300), ('soup', 150))
+        self._log('2026-03-02', ('egg', 80))
+        compact_old_entries(keep_days=7)
+
+        week = WeeklyRollup.objects.get(user_id='U1', week_start=date(2026, 2, 23))
+        self.assertEqual((week.calories, week.item_count, week.day_count), (750, 3, 2))
+        self.assertEqual(week.top_foods[0]['name'], 'rice')
+        self.assertEqual(list(get_weekly_rollups('U1')), ['2026-03-02', '2026-02-23'])
+
+    def test_history_is_unchanged_by_compaction(self, _today):
+        self._log('2026-03-01', ('rice', 300), ('egg', 80))
+        self._log('2026-03-05', ('tea', 120))
+        before = get_daily_summaries('U1')
+        compact_old_entries(keep_days=7)
+        self.assertEqual(get_daily_summaries('U1'), before)
+
+    def test_second_run_is_a_no_op(self, _today):
+        self._log('2026-02-23', ('rice', 300))
+        compact_old_entries(keep_days=7)
+        self.assertEqual(compact_old_entries(keep_days=7), 0)
+        self.assertEqual(DailyTotals.objects.get(date=date(2026, 2, 23)).calories, 300)
+
+    def test_late_entry_for_a_compacted_day_is_merged(self, _today):
+        self._log('2026-02-23', ('rice', 300))
+        compact_old_entries(keep_days=7)
+        self._log('2026-02-23', ('cake', 400))
+
+        compact_old_entries(keep_days=7)
+        day = DailyTotals.objects.get(date=date(2026, 2, 23))
+        self.assertEqual((day.calories, day.item_count), (700, 2))
+        self.assertEqual({f['name'] for f in day.top_foods}, {'rice', 'cake'})
+        self.assertFalse(FoodEntry.objects.exists())
+
+    def test_users_are_rolled_up_separately(self, _today):
+        self._log('2026-02-23', ('rice', 300))
+        self._log('2026-02-23', ('steak', 900), user_id='U2')
+        compact_old_entries(keep_days=7)
+        self.assertEqual(DailyTotals.objects.get(user_id='U2').calories, 900)
+        self.assertEqual(WeeklyRollup.objects.get(user_id='U1').calories, 300)
+
+    def test_command_uses_keep_days_and_flushes_backups(self, _today):
+        self._log('2026-03-01', ('rice', 300))
+        with mock.patch('mylinebot_code.backup_journal.flush') as flush:
+            call_command('compact_food_entries', keep_days=14, stdout=StringIO())
+        self.assertTrue(FoodEntry.objects.exists())
+        flush.assert_called_once()
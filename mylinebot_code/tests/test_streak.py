@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from mylinebot_code.dietary_storage import get_streak, update_streak
+from mylinebot_code.models import UserProfile
+
+TODAY = date(2026, 3, 10)
+
+
+@mock.patch('mylinebot_code.dietary_storage._today_date', return_value=TODAY)
+class UpdateStreakTests(TestCase):
+    def _profile(self, count, last_date):
+        return UserProfile.objects.create(
+            user_id='U1', gender='male', height=175, weight=70, age=30,
+            streak_count=count, streak_last_date=last_date,
+        )
+
+    def test_creates_profile_with_streak_of_one(self, _today):
+        self.assertEqual(update_streak('U1'), 1)
+        profile = UserProfile.objects.get(user_id='U1')
+        self.assertEqual((profile.streak_count, profile.streak_last_date), (1, TODAY))
+        self.assertEqual((profile.gender, profile.height), ('', 0))
+
+    def test_increments_when_last_logged_yesterday(self, _today):
+        self._profile(4, TODAY - timedelta(days=1))
+        self.assertEqual(update_streak('U1'), 5)
+        self.assertEqual(get_streak('U1'), 5)
+
+    def test_same_day_repeat_is_a_no_op(self, _today):
+        self._profile(4, TODAY)
+        self.assertIsNone(update_streak('U1'))
+        self.assertEqual(get_streak('U1'), 4)
+
+    def test_streak_change_bumps_updated_at(self, _today):
+        stale = self._profile(4, TODAY - timedelta(days=1)).updated_at - timedelta(days=2)
+        UserProfile.objects.filter(user_id='U1').update(updated_at=stale)
+        update_streak('U1')
+        self.assertGreater(UserProfile.objects.get(user_id='U1').updated_at, stale)
+
+        UserProfile.objects.filter(user_id='U1').update(updated_at=stale)
+        update_streak('U1')
+        self.assertEqual(UserProfile.objects.get(user_id='U1').updated_at, stale)
+
+    def test_resets_after_a_gap(self, _today):
+        self._profile(9, TODAY - timedelta(days=3))
+        self.assertEqual(update_streak('U1'), 1)
+        self.assertEqual(UserProfile.objects.get(user_id='U1').streak_last_date, TODAY)
+
+    def test_starts_at_one_when_profile_has_no_streak(self, _today):
+        self._profile(0, None)
+        self.assertEqual(update_streak('U1'), 1)
+
+    def test_keeps_profile_fields(self, _today):
+        self._profile(2, TODAY - timedelta(days=1))
+        update_streak('U1')
+        profile = UserProfile.objects.get(user_id='U1')
+        self.assertEqual((profile.gender, profile.height, profile.weight, profile.age), ('male', 175, 70, 30))
+
+    def test_one_statement_in_every_case(self, _today):
+        for setup in (lambda: None, lambda: self._profile(1, TODAY - timedelta(days=1))):
+            UserProfile.objects.all().delete()
+            setup()
+            for _ in range(2):  # second call is the same-day repeat
+                with CaptureQueriesContext(connection) as queries:
+                    update_streak('U1')
+                self.assertEqual(len(queries), 1, [q['sql'] for q in queries])
+                self.assertIn('RETURNING', queries[0]['sql'])
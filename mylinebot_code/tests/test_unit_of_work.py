@@ -0,0 +1,116 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from mylinebot_code.dietary_storage import _today_date, add_food_entries, get_daily_totals
+from mylinebot_code.models import DailyTotals, FoodEntry, UserProfile
+from mylinebot_code.unit_of_work import atomic, committed_writes, defer, unit_of_work
+
+
+def _food(name, calories):
+    return {'name': name, 'calories': calories, 'protein': 1, 'carbs': 2, 'fat': 3, 'basis': ''}
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UnitOfWorkTransactionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_each_storage_call_commits_before_returning(self):
+        with unit_of_work():
+            add_food_entries('U1', [_food('rice', 300)])
+            # No transaction is held while the handler goes on to reply over the network
+            self.assertFalse(connection.in_atomic_block)
+            self.assertEqual(UserProfile.objects.get(user_id='U1').streak_count, 1)
+            add_food_entries('U1', [_food('egg', 80)])
+
+        self.assertEqual(FoodEntry.objects.filter(user_id='U1').count(), 2)
+        self.assertEqual(get_daily_totals('U1')['calories'], 380)
+        self.assertEqual(UserProfile.objects.get(user_id='U1').streak_count, 1)
+
+    def test_failed_storage_call_rolls_back_entries_totals_and_streak(self):
+        with self.assertRaises(RuntimeError), mock.patch(
+            'mylinebot_code.dietary_storage._apply_totals_delta', side_effect=RuntimeError('totals failed'),
+        ), unit_of_work():
+            add_food_entries('U1', [_food('rice', 300)])
+
+        self.assertFalse(FoodEntry.objects.exists())
+        self.assertFalse(DailyTotals.objects.exists())
+        self.assertFalse(UserProfile.objects.exists())
+
+    def test_handler_error_keeps_committed_writes_and_their_effects(self):
+        calls = []
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                add_food_entries('U1', [_food('rice', 300)])
+                defer('k', lambda: calls.append('ran'))
+                raise RuntimeError('reply failed after the write')
+
+        self.assertEqual(FoodEntry.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.get(user_id='U1').streak_count, 1)
+        self.assertEqual(calls, ['ran'])
+
+    def test_committed_writes_counts_write_blocks(self):
+        before = committed_writes()
+        with unit_of_work():
+            add_food_entries('U1', [_food('rice', 300)])
+        self.assertEqual(committed_writes(), before + 1)
+
+    def test_after_commit_effects_run_once_and_only_after_commit(self):
+        calls = []
+        with unit_of_work():
+            with atomic():
+                FoodEntry.objects.create(user_id='U1', date=_today_date(), name='rice', calories=300)
+            defer('k', lambda: calls.append(connection.in_atomic_block))
+            defer('k', lambda: calls.append('duplicate'))
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, [False])
+
+    def test_effects_of_a_rolled_back_block_are_dropped(self):
+        calls = []
+        with unit_of_work():
+            with self.assertRaises(ValueError):
+                with atomic():
+                    FoodEntry.objects.create(user_id='U1', date=_today_date(), name='rice', calories=300)
+                    defer('k', lambda: calls.append('ran'))
+                    defer('db', lambda: calls.append('db'), before_commit=True)
+                    raise ValueError
+        self.assertEqual(calls, [])
+        self.assertFalse(FoodEntry.objects.exists())
+
+    def test_before_commit_effects_run_inside_the_write_block(self):
+        seen = []
+        with unit_of_work():
+            with atomic():
+                FoodEntry.objects.create(user_id='U1', date=_today_date(), name='rice', calories=300)
+                defer('db', lambda: seen.append(connection.in_atomic_block), before_commit=True)
+                self.assertEqual(seen, [])
+            self.assertEqual(seen, [True])
+
+    def test_unit_without_writes_opens_no_transaction(self):
+        calls = []
+        with unit_of_work():
+            defer('k', lambda: calls.append('ran'))
+            self.assertFalse(connection.in_atomic_block)
+        self.assertEqual(calls, ['ran'])
+
+    def test_nested_units_run_effects_once_at_the_outer_exit(self):
+        calls = []
+        with unit_of_work():
+            with unit_of_work():
+                defer('k', lambda: calls.append('ran'))
+            self.assertEqual(calls, [])
+            defer('k', lambda: calls.append('duplicate'))
+        self.assertEqual(calls, ['ran'])
+
+
+class DeferOutsideUnitTests(TestCase):
+    def test_defer_without_unit_runs_on_commit(self):
+        calls = []
+        with self.captureOnCommitCallbacks(execute=True):
+            defer('k', lambda: calls.append('ran'))
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ['ran'])
@@ -0,0 +1,139 @@
+"""
+Request-scoped unit of work for storage writes and their side effects.
+
+Each LINE webhook event and LIFF API request runs inside unit_of_work().
+Storage functions open their write blocks with atomic() from this module, and
+each outermost block is one short transaction: an add commits its entries,
+daily totals and streak together, at the end of the storage call. Handlers
+wait seconds on AI providers and the LINE API around their writes, so the
+unit never holds a transaction (and SQLite's write lock) across that I/O; a
+handler that fails after a write keeps the writes it committed.
+
+Follow-up effects are registered with defer() and de-duplicated by key:
+- before_commit effects (DB follow-ups such as the streak update) run at the
+  end of the write block that deferred them, inside its transaction;
+- the rest (backup marks, cache invalidation) run once when the unit exits,
+  after its writes committed; those deferred by a block that rolled back are dropped.
+Outside a unit of work, atomic() is plain transaction.atomic() and deferred
+effects run once the current transaction commits, so crons and management
+commands behave as before.
+"""
+import contextlib
+import logging
+import threading
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class _Unit:
+    def __init__(self):
+        self.before_commit = {}
+        self.after_commit = {}
+        self.writing = False  # inside an outermost atomic() block
+
+
+def _run_effects(effects):
+    """Run deferred effects in order; effects may defer more, which run in the same pass."""
+    done = set()
+    while effects:
+        key = next(iter(effects))
+        fn = effects.pop(key)
+        if key in done:
+            continue
+        done.add(key)
+        try:
+            fn()
+        except Exception as e:
+            logger.error(f"Deferred effect {key} failed: {e}")
+
+
+@contextlib.contextmanager
+def unit_of_work():
+    """
+    Run each distinct deferred effect of the storage writes made inside once,
+    after they commit. Usable as a decorator: @unit_of_work().
+    """
+    from django.db import transaction
+
+    if getattr(_local, 'unit', None) is not None:
+        # Nested: join the enclosing unit of work
+        yield
+        return
+
+    unit = _local.unit = _Unit()
+    try:
+        yield
+        if unit.before_commit:
+            # Deferred outside any write block
+            with transaction.atomic():
+                _run_effects(unit.before_commit)
+    finally:
+        _local.unit = None
+        # Every effect left belongs to a committed write, even if the handler failed later
+        transaction.on_commit(partial(_run_effects, unit.after_commit))
+
+
+@contextlib.contextmanager
+def _write_block(unit):
+    from django.db import transaction
+
+    pending = set(unit.after_commit)
+    unit.writing = True
+    try:
+        with transaction.atomic():
+            yield
+            _run_effects(unit.before_commit)
+    except BaseException:
+        unit.before_commit.clear()
+        for key in set(unit.after_commit) - pending:
+            del unit.after_commit[key]
+        raise
+    finally:
+        unit.writing = False
+    _local.commits = committed_writes() + 1
+
+
+def atomic():
+    """
+    transaction.atomic() for a storage write. Inside a unit of work, the
+    outermost block also runs the before_commit effects deferred within it
+    before committing.
+    """
+    from django.db import transaction
+
+    unit = getattr(_local, 'unit', None)
+    if unit is None or unit.writing:
+        return transaction.atomic()
+    return _write_block(unit)
+
+
+def committed_writes():
+    """Number of unit-of-work write blocks this thread has committed (a counter to compare)."""
+    return getattr(_local, 'commits', 0)
+
+
+def defer(key, fn, before_commit=False):
+    """
+    Schedule fn() to run once per unit of work for a given key: when the unit
+    exits, or if before_commit at the end of the current write block, inside
+    its transaction. Without an
+    active unit of work, runs it after the current transaction commits
+    (immediately if there is none).
+    """
+    from django.db import transaction
+
+    unit = getattr(_local, 'unit', None)
+    if unit is not None:
+        (unit.before_commit if before_commit else unit.after_commit).setdefault(key, fn)
+    else:
+        transaction.on_commit(fn)
+
+
+def defer_backup(dataset):
+    """Schedule one backup journal mark for `dataset`."""
+    from .backup_journal import record_mutation
+
+    defer(('backup', dataset), partial(record_mutation, dataset))
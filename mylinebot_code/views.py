@@ -1,11 +1,12 @@
 import logging
+import time
 from datetime import date, timedelta
 from enum import Enum
 
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
@@ -28,18 +29,22 @@ from linebot.v3.messaging.api import MessagingApiBlob
 from linebot.v3.webhooks import MessageEvent, TextMessageContent, ImageMessageContent
 
 from .scraper import parse_forum, extract_topic_from_title, get_weekday_name
-from .models import ParsedArticle, AuthorizedUser, PushTarget
-from .gist_storage import save_users_to_gist, save_targets_to_gist
+from .models import ParsedArticle, AuthorizedUser, PushTarget, UserProfile
+from .backup_journal import record_mutation
+from .unit_of_work import unit_of_work
+from .event_ledger import once_per_event
 from .dietary_storage import (
     add_food_entry, add_food_entries, remove_food_entry, remove_food_entries,
-    get_food_entry_by_index, update_food_entry, get_today_log, get_history,
-    get_all_users_today, get_tdee, get_streak,
+    get_food_entry_by_index, update_food_entry, get_today_log, get_daily_summaries,
+    get_all_users_today, get_tdee, get_streak, get_daily_totals,
+    get_cached_advice, cache_advice,
 )
 from .ai_api import (
     estimate_nutrition, estimate_nutrition_from_image, parse_and_estimate_foods,
     modify_food_estimation, generate_diet_advice,
 )
-from .profile_storage import get_profile
+from .profile_storage import GOAL_DISPLAY, get_goal_label
+from .nutrition_analytics import compute_user_metrics
 
 
 # ── Command constants ──────────────────────────────────────────────────────────
@@ -198,15 +203,29 @@ def build_daily_report(foods):
     return "\n".join(lines)
 
 
-GOAL_DISPLAY = {'bulk': '增肌', 'maintain': '維持', 'cut': '減脂'}
-
-
-def _get_goal_label(user_id):
-    """Return Chinese goal label for a user, or empty string if not set."""
-    profile = get_profile(user_id)
-    if profile and profile.goal:
-        return GOAL_DISPLAY.get(profile.goal, '')
-    return ''
+def build_trend_summary(metrics):
+    """Build the trends section of a report from compute_user_metrics() output, or ''."""
+    if not metrics or metrics['avg_calories_7d'] is None:
+        return ""
+
+    lines = ["📈 Trends", "─" * 14]
+    lines.append(f"7-day avg {metrics['avg_calories_7d']:.0f} kcal ({metrics['logged_days_7d']}/7 days)")
+    if metrics['avg_calories_30d'] is not None:
+        lines.append(f"30-day avg {metrics['avg_calories_30d']:.0f} kcal ({metrics['logged_days_30d']}/30 days)")
+    if metrics['calories_wow_delta'] is not None:
+        lines.append(f"vs last week {metrics['calories_wow_delta']:+.0f} kcal/day")
+
+    macro = metrics['macro_pct_7d']
+    if macro:
+        macro_line = f"P {macro['protein']:.0f}% | C {macro['carbs']:.0f}% | F {macro['fat']:.0f}%"
+        delta = metrics['macro_pct_wow_delta']
+        if delta:
+            macro_line += f"  (P {delta['protein']:+.0f} / C {delta['carbs']:+.0f} / F {delta['fat']:+.0f})"
+        lines.append(macro_line)
+
+    if metrics['adherence_7d'] is not None:
+        lines.append(f"🎯 On target {metrics['adherence_7d']:.0f}% (7d) | {metrics['adherence_30d']:.0f}% (30d)")
+    return "\n".join(lines)
 
 
 def health(request):
@@ -230,6 +249,8 @@ def callback(request):
 
 
 @handler.add(MessageEvent, message=TextMessageContent)
+@once_per_event
+@unit_of_work()
 def handle_text_message(event):
     """Handle text messages from LINE."""
     raw_text = event.message.text.strip()
@@ -488,9 +509,9 @@ def handle_text_message(event):
 
             tdee = get_tdee(user_id)
             if tdee:
-                total_cal = sum(f.get('calories', 0) or 0 for f in foods)
+                total_cal = get_daily_totals(user_id)['calories']
                 remaining = tdee - total_cal
-                goal_label = _get_goal_label(user_id)
+                goal_label = get_goal_label(user_id)
                 goal_str = f"  ({goal_label})" if goal_label else ""
                 response += f"\n\n🎯 目標 {tdee} kcal{goal_str}  |  剩餘 {remaining:.0f} kcal"
 
@@ -503,14 +524,14 @@ def handle_text_message(event):
 
         # Command: history (no auth required)
         if text == Cmd.HISTORY:
-            history = get_history(user_id)
+            history = get_daily_summaries(user_id)
             if not history:
                 response = "No food logged in the past 7 days."
             else:
                 lines = ["Past 7 days:"]
-                for date_str, foods in history.items():
-                    total_cal = sum(f.get('calories', 0) or 0 for f in foods)
-                    count = len(foods)
+                for date_str, totals in history.items():
+                    total_cal = totals['calories']
+                    count = totals['item_count']
                     # Format date as MM/DD
                     display_date = date_str[5:].replace('-', '/')
                     lines.append(f"{display_date} — {total_cal:.0f} kcal ({count} items)")
@@ -532,18 +553,27 @@ def handle_text_message(event):
             foods = get_today_log(user_id)
             report_lines = build_daily_report(foods)
 
-            tdee = get_tdee(user_id)
-            goal_label = _get_goal_label(user_id)
+            metrics = compute_user_metrics([user_id]).get(user_id)
+            tdee = metrics['tdee']
+            goal_label = get_goal_label(user_id)
             if tdee:
-                total_cal = sum(f.get('calories', 0) or 0 for f in foods)
-                remaining = tdee - total_cal
+                remaining = tdee - metrics['calories_today']
                 goal_str = f"  ({goal_label})" if goal_label else ""
                 report_lines += f"\n\n🎯 目標 {tdee} kcal{goal_str}  |  剩餘 {remaining:.0f} kcal"
 
+            trends = build_trend_summary(metrics)
+            if trends:
+                report_lines += f"\n\n{trends}"
+
             # Get AI advice
             user_prompt = raw_text[7:].strip() if len(raw_text) > 7 else ''
             if foods:
-                advice = generate_diet_advice(foods, tdee, user_prompt, goal_label)
+                # Reuse advice just streamed to the LIFF page if the log hasn't changed since
+                advice = get_cached_advice(user_id, tdee, user_prompt, goal_label)
+                if advice is None:
+                    advice = generate_diet_advice(foods, tdee, user_prompt, goal_label)
+                    if advice:
+                        cache_advice(user_id, advice, tdee, user_prompt, goal_label)
                 if advice:
                     report_lines += f"\n\n💡 AI Advice\n{'─' * 20}\n{advice}"
 
@@ -617,7 +647,7 @@ def handle_text_message(event):
                     defaults={'label': label}
                 )
                 if created:
-                    save_users_to_gist()
+                    record_mutation('users')
                     response = f"已新增授權用戶: {label or new_id}"
                 else:
                     response = f"用戶已存在: {new_id}"
@@ -637,7 +667,7 @@ def handle_text_message(event):
                 remove_id = parts[1]
                 deleted, _ = AuthorizedUser.objects.filter(user_id=remove_id).delete()
                 if deleted:
-                    save_users_to_gist()
+                    record_mutation('users')
                     response = f"已移除授權用戶: {remove_id}"
                 else:
                     response = f"找不到用戶: {remove_id}"
@@ -681,7 +711,7 @@ def handle_text_message(event):
                     defaults={'label': label}
                 )
                 if created:
-                    save_targets_to_gist()
+                    record_mutation('targets')
                     response = f"已新增推播對象: {label or new_id}"
                 else:
                     response = f"推播對象已存在: {new_id}"
@@ -701,7 +731,7 @@ def handle_text_message(event):
                 remove_id = parts[1]
                 deleted, _ = PushTarget.objects.filter(target_id=remove_id).delete()
                 if deleted:
-                    save_targets_to_gist()
+                    record_mutation('targets')
                     response = f"已移除推播對象: {remove_id}"
                 else:
                     response = f"找不到推播對象: {remove_id}"
@@ -731,6 +761,8 @@ def handle_text_message(event):
 
 
 @handler.add(MessageEvent, message=ImageMessageContent)
+@once_per_event
+@unit_of_work()
 def handle_image_message(event):
     """Handle image messages — identify food from photo and log nutrition."""
     user_id = getattr(event.source, 'user_id', None)
@@ -747,7 +779,7 @@ def handle_image_message(event):
             mime_type = 'image/jpeg'
 
             # Estimate nutrition from image
-            result = estimate_nutrition_from_image(image_bytes, mime_type)
+            result = estimate_nutrition_from_image(image_bytes, mime_type, user_id=user_id)
 
             food_name = result.get('food_name')
             if not food_name:
@@ -881,13 +913,13 @@ def api_users(request, secret):
             _, created = AuthorizedUser.objects.get_or_create(
                 user_id=user_id, defaults={'label': label}
             )
-            save_users_to_gist()
+            record_mutation('users')
             status = 'created' if created else 'already exists'
             return HttpResponse(f'{status}: {user_id}', content_type='text/plain')
 
         if action == 'remove' and user_id:
             deleted, _ = AuthorizedUser.objects.filter(user_id=user_id).delete()
-            save_users_to_gist()
+            record_mutation('users')
             status = 'removed' if deleted else 'not found'
             return HttpResponse(f'{status}: {user_id}', content_type='text/plain')
 
@@ -917,13 +949,13 @@ def api_targets(request, secret):
             _, created = PushTarget.objects.get_or_create(
                 target_id=target_id, defaults={'label': label}
             )
-            save_targets_to_gist()
+            record_mutation('targets')
             status = 'created' if created else 'already exists'
             return HttpResponse(f'{status}: {target_id}', content_type='text/plain')
 
         if action == 'remove' and target_id:
             deleted, _ = PushTarget.objects.filter(target_id=target_id).delete()
-            save_targets_to_gist()
+            record_mutation('targets')
             status = 'removed' if deleted else 'not found'
             return HttpResponse(f'{status}: {target_id}', content_type='text/plain')
 
@@ -936,6 +968,34 @@ def api_targets(request, secret):
     return HttpResponse('\n'.join(lines), content_type='text/plain')
 
 
+def metrics(request, secret):
+    """Operational metrics (backup sync lag, GitHub quota, cache hit rate etc.) as JSON, for monitoring."""
+    from . import (
+        ai_api, ai_batcher, ai_schemas, backup_journal, circuit_breaker, dietary_storage, event_ledger,
+        food_db, gist_storage, image_pipeline, model_scoreboard, nutrition_cache, photo_cache,
+    )
+
+    expected_secret = getattr(settings, 'CRON_SECRET', '')
+    if not expected_secret or secret != expected_secret:
+        return HttpResponseForbidden('Invalid secret')
+
+    return JsonResponse({
+        'backup': backup_journal.stats(),
+        'github': gist_storage.rate_limit_stats(),
+        'food_log_cache': dietary_storage.cache_stats(),
+        'webhook_events': event_ledger.stats(),
+        'food_db': food_db.stats(),
+        'nutrition_cache': nutrition_cache.stats(),
+        'photo_cache': photo_cache.stats(),
+        'image_pipeline': image_pipeline.stats(),
+        'ai_hedging': ai_api.hedge_stats(),
+        'ai_batching': ai_batcher.stats(),
+        'ai_parsing': ai_schemas.stats(),
+        'circuit_breakers': circuit_breaker.stats(),
+        'model_ranking': model_scoreboard.ranking(),
+    })
+
+
 @csrf_exempt
 def debug_scraper(request, secret):
     """Debug endpoint to check forum scraping."""
@@ -992,18 +1052,27 @@ def dietary_report_cron(request, secret):
         logger.info("No dietary entries today, nothing to report")
         return HttpResponse('OK: No entries today')
 
+    # One vectorized pass for every user's TDEE, totals and trends, plus one goal query
+    started = time.monotonic()
+    all_metrics = compute_user_metrics(list(users_today))
+    goals = dict(UserProfile.objects.filter(user_id__in=list(users_today)).values_list('user_id', 'goal'))
+    logger.info(f"Computed report analytics for {len(all_metrics)} users in {time.monotonic() - started:.3f}s")
+
     sent_count = 0
     with ApiClient(configuration) as api_client:
         line_bot_api = MessagingApi(api_client)
         for uid, foods in users_today.items():
             report = build_daily_report(foods)
-            tdee = get_tdee(uid)
+            metrics = all_metrics.get(uid)
+            tdee = metrics and metrics['tdee']
             if tdee:
-                total_cal = sum(f.get('calories', 0) or 0 for f in foods)
-                remaining = tdee - total_cal
-                goal_label = _get_goal_label(uid)
+                remaining = tdee - metrics['calories_today']
+                goal_label = GOAL_DISPLAY.get(goals.get(uid), '')
                 goal_str = f"  ({goal_label})" if goal_label else ""
                 report += f"\n\n🎯 目標 {tdee} kcal{goal_str}  |  剩餘 {remaining:.0f} kcal"
+            trends = build_trend_summary(metrics)
+            if trends:
+                report += f"\n\n{trends}"
             try:
                 line_bot_api.push_message(
                     PushMessageRequest(
@@ -1114,3 +1183,29 @@ def dietary_reminder_cron(request, secret):
     logger.info(f"Dietary reminder cron completed: {sent_count} reminders sent")
     logger.info("=" * 50)
     return HttpResponse(f'OK: {sent_count} reminders sent')
+
+
+@csrf_exempt
+@require_POST
+def dietary_retention_cron(request, secret):
+    """
+    Cron endpoint for food-log retention: rolls entries older than
+    FOOD_RETENTION_DAYS up into daily/weekly rollups, then deletes them.
+    """
+    from .dietary_storage import compact_old_entries
+
+    logger.info("=" * 50)
+    logger.info("DIETARY RETENTION CRON STARTED")
+    logger.info("=" * 50)
+
+    expected_secret = getattr(settings, 'CRON_SECRET', '')
+    if not expected_secret or secret != expected_secret:
+        logger.warning("Dietary retention cron rejected: invalid secret")
+        return HttpResponseForbidden('Invalid secret')
+
+    with unit_of_work():
+        deleted = compact_old_entries()
+
+    logger.info(f"Dietary retention cron completed: {deleted} entries compacted")
+    logger.info("=" * 50)
+    return HttpResponse(f'OK: {deleted} entries compacted')
@@ -83,6 +83,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Needs SQLite 3.35+ (update_streak uses INSERT ... RETURNING)
+    }
+}
+
+
+# Cache
+# Must be shared by all gunicorn workers (version tokens invalidate cached food
+# logs), so the default is a file cache rather than per-process LocMemCache.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.django_cache')),
     }
 }
 
@@ -140,6 +153,60 @@ LIFF_ID = os.environ.get('LIFF_ID', '')
 # Cron secret for GitHub Actions trigger
 CRON_SECRET = os.environ.get('CRON_SECRET', '')
 
+# Seconds a handled LINE webhookEventId is remembered, to drop redeliveries
+WEBHOOK_EVENT_TTL = float(os.environ.get('WEBHOOK_EVENT_TTL', str(24 * 3600)))
+
+# Persistent cache of AI nutrition estimates for repeated food descriptions
+NUTRITION_CACHE_TTL_DAYS = float(os.environ.get('NUTRITION_CACHE_TTL_DAYS', '30'))
+NUTRITION_CACHE_MAX_ENTRIES = int(os.environ.get('NUTRITION_CACHE_MAX_ENTRIES', '5000'))
+
+# Offline nutrition DB of common foods (CSV compiled into a memory-mapped index)
+FOOD_DB_PATH = os.environ.get('FOOD_DB_PATH', str(BASE_DIR / 'mylinebot_code' / 'data' / 'tw_foods.csv'))
+FOOD_DB_INDEX_PATH = os.environ.get('FOOD_DB_INDEX_PATH', str(BASE_DIR / '.food_db.idx'))
+
+# Food photo preprocessing before vision-model upload (runs in a process pool)
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', '1024'))
+IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'JPEG')  # 'JPEG' or 'WEBP'
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '82'))
+IMAGE_PIPELINE_WORKERS = int(os.environ.get('IMAGE_PIPELINE_WORKERS', '2'))
+IMAGE_PIPELINE_TIMEOUT = float(os.environ.get('IMAGE_PIPELINE_TIMEOUT', '15'))
+
+# Perceptual-hash cache for food photos: max differing bits (of 64) to reuse an estimate.
+# Other users' photos must match exactly by default; -1 disables a scope
+PHOTO_HASH_USER_THRESHOLD = int(os.environ.get('PHOTO_HASH_USER_THRESHOLD', '6'))
+PHOTO_HASH_GLOBAL_THRESHOLD = int(os.environ.get('PHOTO_HASH_GLOBAL_THRESHOLD', '0'))
+PHOTO_CACHE_INDEX_SIZE = int(os.environ.get('PHOTO_CACHE_INDEX_SIZE', '500'))
+PHOTO_CACHE_TTL_DAYS = float(os.environ.get('PHOTO_CACHE_TTL_DAYS', '30'))
+PHOTO_CACHE_MAX_ENTRIES = int(os.environ.get('PHOTO_CACHE_MAX_ENTRIES', '5000'))
+
+# Per-model AI circuit breakers: consecutive 5xx/timeouts to trip, and cooldowns
+# (seconds) used when the provider sends no Retry-After; doubled on each re-trip
+AI_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('AI_BREAKER_FAILURE_THRESHOLD', '2'))
+AI_BREAKER_COOLDOWN = float(os.environ.get('AI_BREAKER_COOLDOWN', '30'))
+AI_BREAKER_RATE_LIMIT_COOLDOWN = float(os.environ.get('AI_BREAKER_RATE_LIMIT_COOLDOWN', '60'))
+AI_BREAKER_MAX_COOLDOWN = float(os.environ.get('AI_BREAKER_MAX_COOLDOWN', '900'))
+
+# Adaptive model routing: EWMA weight of each new sample, and share of calls that
+# try a random non-best model first so recovered models get re-scored
+AI_ROUTING_EWMA_ALPHA = float(os.environ.get('AI_ROUTING_EWMA_ALPHA', '0.2'))
+AI_ROUTING_EXPLORE_RATE = float(os.environ.get('AI_ROUTING_EXPLORE_RATE', '0.05'))
+
+# Cross-user micro-batching of meal parses: how long a request waits for others
+# to join its batch (0 disables batching), and the most meals sent in one prompt.
+# Batches only form between requests handled concurrently by one process, which
+# the gthread workers in Procfile / render.yaml do; set 0 when running sync workers.
+AI_BATCH_WINDOW_MS = float(os.environ.get('AI_BATCH_WINDOW_MS', '200'))
+AI_BATCH_MAX_ITEMS = int(os.environ.get('AI_BATCH_MAX_ITEMS', '8'))
+
+# Days of raw food entries kept; older ones are rolled up by the retention cron
+FOOD_RETENTION_DAYS = int(os.environ.get('FOOD_RETENTION_DAYS', '7'))
+
+# Local write-ahead journal for Gist backups (drained by a background syncer)
+BACKUP_JOURNAL_PATH = os.environ.get('BACKUP_JOURNAL_PATH', str(BASE_DIR / 'backup_journal.log'))
+BACKUP_SYNC_INTERVAL = float(os.environ.get('BACKUP_SYNC_INTERVAL', '5'))
+# Seconds a worker holds the backup-writer lease without renewing it
+BACKUP_LEASE_TTL = float(os.environ.get('BACKUP_LEASE_TTL', '60'))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -28,8 +28,10 @@ urlpatterns = [
     path('debug/<str:secret>/', views.debug_scraper, name='debug_scraper'),
     path('users/<str:secret>/', views.api_users, name='api_users'),
     path('targets/<str:secret>/', views.api_targets, name='api_targets'),
+    path('metrics/<str:secret>/', views.metrics, name='metrics'),
     path('dietary-report/<str:secret>/', views.dietary_report_cron, name='dietary_report_cron'),
     path('dietary-reminder/<str:secret>/', views.dietary_reminder_cron, name='dietary_reminder_cron'),
+    path('dietary-retention/<str:secret>/', views.dietary_retention_cron, name='dietary_retention_cron'),
 
     # LIFF web editor
     path('liff/editor/', liff_views.liff_editor, name='liff_editor'),
@@ -38,6 +40,9 @@ urlpatterns = [
     path('liff/api/ai-add/', liff_views.api_ai_add, name='liff_api_ai_add'),
     path('liff/api/ai-modify/<int:entry_id>/', liff_views.api_ai_modify, name='liff_api_ai_modify'),
     path('liff/api/image-add/', liff_views.api_image_add, name='liff_api_image_add'),
+    path('liff/api/advice/stream/', liff_views.api_advice_stream, name='liff_api_advice_stream'),
+    path('liff/api/export/', liff_views.api_export, name='liff_api_export'),
+    path('liff/api/import/', liff_views.api_import, name='liff_api_import'),
 
     # LIFF profile & goal
     path('liff/profile/', liff_views.liff_profile, name='liff_profile'),